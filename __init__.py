@@ -16,7 +16,10 @@ def post_init_hook(env):
         users_model = env['res.users']
         users_model.restore_pos_permissions()
         
+        # Precargar las cachés de la API para las primeras peticiones
+        env['pos.order.api.warmup'].warmup()
+        
         _logger.info("Post_init_hook completado exitosamente")
         
     except Exception as e:
-        _logger.error(f"Error en post_init_hook: {str(e)}")
\ No newline at end of file
+        _logger.error("Error en post_init_hook: %s", e)
\ No newline at end of file
@@ -8,6 +8,7 @@
     "installable": True,
     "application": False,
     "data": [
+        "security/ir.model.access.csv",
         "data/ir_config_parameter.xml",
         "data/res_users_data.xml",
         "data/ir_cron.xml",
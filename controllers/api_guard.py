@@ -0,0 +1,238 @@
+from odoo.http import request
+from odoo.tools.profiler import Profiler
+from .api_io import error_response
+from ..tools.request_context import (
+    ApiRequestContext,
+    get_logger,
+    new_request_id,
+    reset_request_context,
+    set_request_context,
+    stage,
+)
+from ..tools import traffic_capture
+import functools
+import random
+import threading
+import time
+
+_logger = get_logger(__name__)
+
+
+def _get_float_param(name, default):
+    try:
+        return float(request.env['ir.config_parameter'].sudo().get_param(name, default))
+    except (TypeError, ValueError):
+        return float(default)
+
+
+def _too_many_requests(message, retry_after):
+    """
+    Respuesta 429 rápida, sin tocar órdenes ni sesiones
+    """
+    response = error_response(message, status=429, retry_after=retry_after)
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def _authenticate(context, scope):
+    """
+    Verifica la cabecera X-API-Key y el scope requerido por la ruta. Las
+    rutas de scope 'admin' exigen siempre una clave, aunque
+    pos_order_api.require_api_key esté desactivado.
+
+    Returns:
+        tuple: (datos de la clave o None, Response de error o None)
+    """
+    raw_key = request.httprequest.headers.get('X-API-Key')
+    if not raw_key:
+        require = request.env['ir.config_parameter'].sudo().get_param('pos_order_api.require_api_key', 'False')
+        if scope == 'admin' or require.lower() == 'true':
+            return None, error_response("Se requiere una API key (cabecera X-API-Key)", status=401)
+        return None, None
+
+    api_key = request.env['pos.order.api.key'].sudo()._verify_api_key(raw_key)
+    if not api_key:
+        _logger.warning("API key inválida en %s", context.route)
+        return None, error_response("API key inválida", status=401)
+
+    context.api_key_id = api_key['id']
+    context.api_key_name = api_key['name']
+    context.company_id = api_key['company_id']
+
+    if scope and scope not in api_key['scopes']:
+        _logger.warning("API key sin scope '%s' en %s", scope, context.route)
+        return api_key, error_response(f"La API key no tiene el scope '{scope}'", status=403)
+
+    return api_key, None
+
+
+def _check_admission(context, api_key, inflight):
+    """
+    Aplica los límites por IP, por API key y el límite global de peticiones en vuelo.
+
+    Returns:
+        Response 429 si la petición debe rechazarse, None si puede continuar
+    """
+    ICP = request.env['ir.config_parameter'].sudo()
+    if ICP.get_param('pos_order_api.rate_limit_enabled', 'True').lower() != 'true':
+        return None
+
+    RateLimit = request.env['pos.order.api.rate.limit'].sudo()
+
+    try:
+        buckets = []
+
+        buckets.append((
+            f"ip:{context.client_ip}",
+            _get_float_param('pos_order_api.rate_limit_ip_rate', 5),
+            _get_float_param('pos_order_api.rate_limit_ip_burst', 20),
+        ))
+
+        if api_key:
+            # Cuota propia de la clave, o la cuota general si no tiene
+            buckets.append((
+                f"key:{api_key['id']}",
+                api_key['rate_limit'] or _get_float_param('pos_order_api.rate_limit_key_rate', 20),
+                api_key['burst'] or _get_float_param('pos_order_api.rate_limit_key_burst', 50),
+            ))
+
+        allowed, retry_after = RateLimit._consume_tokens(buckets)
+        if not allowed:
+            _logger.warning("Límite de peticiones excedido en %s", context.route)
+            return _too_many_requests("Demasiadas peticiones, intente más tarde", retry_after)
+    except Exception as e:
+        # Si el control de admisión falla, no bloquear la venta
+        _logger.error("Error en el control de límite de peticiones: %s", e)
+
+    if inflight:
+        max_inflight = int(_get_float_param('pos_order_api.max_inflight', 4))
+        try:
+            if not RateLimit._acquire_inflight_slot(max_inflight):
+                _logger.warning("Límite global de %s peticiones en vuelo alcanzado", max_inflight)
+                return _too_many_requests("Servidor ocupado, intente más tarde", 1)
+        except Exception as e:
+            _logger.error("Error al reservar slot de petición en vuelo: %s", e)
+
+    return None
+
+
+# Cabecera con el id de correlación de la petición (se acepta y se devuelve)
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+# Cabecera con la que una API key con scope 'admin' pide perfilar su petición
+PROFILE_HEADER = 'X-API-Profile'
+
+# Cabecera con las consultas SQL de la petición, solo para claves con scope 'admin'
+QUERY_COUNT_HEADER = 'X-Query-Count'
+
+
+def _query_count():
+    # Odoo cuenta las consultas del hilo que atiende la petición
+    return getattr(threading.current_thread(), 'query_count', 0)
+
+
+def _should_profile(api_key):
+    """
+    Decide si la petición se perfila: por la cabecera X-API-Profile (solo
+    claves con scope 'admin') o por muestreo según
+    pos_order_api.profile_sample_rate (0 desactiva el muestreo).
+    """
+    if request.httprequest.headers.get(PROFILE_HEADER) and api_key and 'admin' in api_key['scopes']:
+        return True
+    sample_rate = _get_float_param('pos_order_api.profile_sample_rate', 0)
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def _call_profiled(context, endpoint, *args, **kwargs):
+    """
+    Ejecuta la ruta dentro del profiler de Odoo (SQL con tiempos y pilas de
+    Python). El resultado queda en ir.profile y se puede abrir en speedscope.
+    """
+    profiler = Profiler(
+        collectors=['sql', 'traces_async'],
+        db=request.env.cr.dbname,
+        profile_session=f"pos_api {context.route}",
+        description=f"{request.httprequest.method} {context.route} {context.label()}",
+    )
+    with profiler:
+        response = endpoint(*args, **kwargs)
+
+    profile_id = getattr(profiler, 'profile_id', None)
+    if profile_id:
+        _logger.info("Petición perfilada: ir.profile %s", profile_id)
+        if hasattr(response, 'headers'):
+            response.headers['X-Profile-Id'] = str(profile_id)
+            response.headers['X-Profile-Url'] = f"/web/speedscope/{profile_id}"
+    return response
+
+
+def api_guard(scope=None, inflight=False, capture=False):
+    """
+    Decorador para las rutas de la API. Se coloca debajo de @http.route.
+
+    Args:
+        scope: scope que debe tener la API key para usar la ruta
+        inflight: si True, la ruta cuenta para el límite global de peticiones
+                  en vuelo (rutas de ingesta que escriben órdenes o productos)
+        capture: si True, una muestra de las peticiones autenticadas se guarda
+                 anonimizada para repetirla (pos_order_api.capture_sample_rate)
+    """
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        def wrapper(self, *args, **kwargs):
+            httprequest = request.httprequest
+            context = ApiRequestContext(
+                httprequest.path,
+                httprequest.remote_addr or 'unknown',
+                new_request_id(httprequest.headers.get(REQUEST_ID_HEADER)),
+            )
+            token = set_request_context(context)
+            started = time.perf_counter()
+            started_at = time.time()
+            queries_before = _query_count()
+            status = 500
+            captured = False
+            try:
+                with stage('auth'):
+                    api_key, response = _authenticate(context, scope)
+                if response is None and capture:
+                    captured = traffic_capture.should_capture(request.env)
+                if response is None:
+                    with stage('admission'):
+                        response = _check_admission(context, api_key, inflight)
+                if response is None:
+                    with stage('handler'):
+                        if _should_profile(api_key):
+                            response = _call_profiled(context, endpoint, self, *args, **kwargs)
+                        else:
+                            response = endpoint(self, *args, **kwargs)
+                status = getattr(response, 'status_code', 200)
+                if hasattr(response, 'headers'):
+                    response.headers[REQUEST_ID_HEADER] = context.request_id
+                    if api_key and 'admin' in api_key['scopes']:
+                        response.headers[QUERY_COUNT_HEADER] = str(_query_count() - queries_before)
+                return response
+            finally:
+                # Un solo registro resumen por petición, con los tiempos de cada etapa
+                duration_ms = (time.perf_counter() - started) * 1000
+                queries = _query_count() - queries_before
+                if captured:
+                    traffic_capture.write_capture(
+                        request.env, context, context.payload, started_at, status, duration_ms,
+                    )
+                _logger.info(
+                    "%s %s status=%s duration_ms=%.1f queries=%s %s",
+                    httprequest.method, context.route, status, duration_ms, queries, context.summary(),
+                    extra={'pos_api_summary': {
+                        'method': httprequest.method,
+                        'route': context.route,
+                        'status': status,
+                        'duration_ms': round(duration_ms, 1),
+                        'queries': queries,
+                        'stages': {name: round(value, 1) for name, value in context.stages.items()},
+                        'fields': context.fields,
+                    }},
+                )
+                reset_request_context(token)
+        return wrapper
+    return decorator
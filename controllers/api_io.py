@@ -0,0 +1,113 @@
+from odoo.http import Response, request
+from ..tools import json_codec
+from ..tools.request_context import get_request_context
+from ..tools.schema import SchemaError, validate
+import gzip
+import zlib
+
+# Las respuestas menores a este tamaño no compensan el costo de comprimir
+GZIP_MIN_BYTES = 1024
+
+# Tamaño máximo de un cuerpo gzip una vez descomprimido
+MAX_INFLATED_BYTES = 32 * 1024 * 1024
+
+
+def json_response(payload, status=200):
+    """
+    Respuesta application/json, comprimida con gzip si el cliente lo acepta
+    y el cuerpo es suficientemente grande.
+    """
+    body = json_codec.dumps(payload)
+    headers = [('Content-Type', 'application/json; charset=utf-8')]
+
+    accept_encoding = request.httprequest.headers.get('Accept-Encoding', '')
+    if len(body) >= GZIP_MIN_BYTES and 'gzip' in accept_encoding:
+        body = gzip.compress(body, compresslevel=5)
+        headers.append(('Content-Encoding', 'gzip'))
+        headers.append(('Vary', 'Accept-Encoding'))
+
+    return request.make_response(body, headers=headers, status=status)
+
+
+def stream_response(chunks, content_type, filename=None, extra_headers=None):
+    """
+    Respuesta con transferencia por bloques (chunked): el cuerpo se envía a
+    medida que el generador produce bloques, sin armarlo completo en memoria.
+    """
+    headers = [('Content-Type', content_type), ('Cache-Control', 'no-store')]
+    if filename:
+        headers.append(('Content-Disposition', f'attachment; filename="{filename}"'))
+    if extra_headers:
+        headers.extend(extra_headers)
+    return Response(chunks, headers=headers, status=200, direct_passthrough=True)
+
+
+def error_response(message, status=200, **extra):
+    payload = {"success": False, "error": message}
+    payload.update(extra)
+    return json_response(payload, status=status)
+
+
+def _gunzip(body, max_length=MAX_INFLATED_BYTES):
+    """
+    Descomprime un cuerpo gzip (uno o varios miembros) sin producir más de
+    max_length bytes.
+
+    Returns:
+        bytes: cuerpo descomprimido, o None si supera max_length
+
+    Raises:
+        EOFError: si el cuerpo está truncado
+        zlib.error: si el cuerpo no es gzip válido
+    """
+    chunks = []
+    remaining = max_length
+    while body:
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunk = inflater.decompress(body, remaining + 1)
+        if len(chunk) > remaining:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+        if not inflater.eof:
+            raise EOFError("Cuerpo gzip truncado")
+        body = inflater.unused_data
+    return b''.join(chunks)
+
+
+def read_json(schema=None):
+    """
+    Lee el cuerpo de la petición directamente desde los bytes y lo valida
+    contra el esquema declarado.
+
+    Returns:
+        tuple: (payload normalizado, None) o (None, Response 400/413)
+    """
+    body = request.httprequest.get_data()
+    if request.httprequest.headers.get('Content-Encoding', '').lower() == 'gzip':
+        try:
+            body = _gunzip(body)
+        except (OSError, EOFError, zlib.error):
+            return None, error_response("Cuerpo gzip inválido", status=400)
+        if body is None:
+            return None, error_response(
+                f"Cuerpo gzip demasiado grande (máximo {MAX_INFLATED_BYTES // (1024 * 1024)} MB descomprimido)",
+                status=413,
+            )
+
+    try:
+        data = json_codec.loads(body)
+    except ValueError as e:
+        return None, error_response(f"JSON inválido: {str(e)}", status=400)
+
+    context = get_request_context()
+    if context is not None:
+        context.payload = data
+
+    if schema is None:
+        return data, None
+
+    try:
+        return validate(data, schema), None
+    except SchemaError as e:
+        return None, error_response("Payload inválido", status=400, details=e.errors)
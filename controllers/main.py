@@ -1,43 +1,179 @@
 from odoo import http
 from odoo.http import request
-import json
-import logging
 
-_logger = logging.getLogger(__name__)
+from .api_guard import api_guard
+from .api_io import error_response, json_response, read_json, stream_response
+from .pricing import cart_key, price_line
+from .schemas import (
+    ARCHIVE_SCHEMA, MAX_ARCHIVE_IDS, MAX_STATUS_IDS, ORDER_SCHEMA, ORDER_STATUS_SCHEMA, PRODUCT_SCHEMA, QUOTE_SCHEMA,
+)
+from ..models.pos_order import STATUS_COLUMNS
+from ..tools import json_codec, order_stream
+from ..tools.circuit_breaker import CircuitOpenError, notification_breakers
+from ..tools.api_caches import product_cache, quote_cache, reference_cache, session_cache
+from ..tools.request_context import get_logger, get_request_context, record_stage, set_summary_field, stage
+from datetime import datetime, timezone
+from psycopg2.errors import SerializationFailure
+import functools
+import hashlib
+import odoo
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+
+_logger = get_logger(__name__)
 
 class PosRestController(http.Controller):
 
-    def _get_or_create_pos_session(self, pos_name='ECommerce'):
+    # Entorno fijo para crear órdenes fuera de una petición (workers de la
+    # ingesta diferida); sin él se usa el de la petición en curso
+    _bound_env = None
+
+    @property
+    def env(self):
+        return self._bound_env if self._bound_env is not None else request.env
+
+    @classmethod
+    def _with_env(cls, env):
+        controller = cls()
+        controller._bound_env = env
+        return controller
+
+    def _get_cached_reference(self, name, compute, company_id=False):
+        """
+        Devuelve el id de un dato de referencia (compañía, categoría, UoM,
+        lista de precios) desde la caché del worker, calculándolo solo la
+        primera vez. Los datos propios de una compañía se cachean por compañía.
+        """
+        cache_key = (self.env.cr.dbname, company_id, name)
+        value = reference_cache.get(cache_key, None)
+        if value is None:
+            value = compute()
+            if value:
+                reference_cache.set(cache_key, value)
+        return value
+
+    def _get_default_company_id(self):
+        return self._get_cached_reference(
+            'company',
+            lambda: (self.env['res.company'].sudo().search([('id', '=', 1)], limit=1)
+                     or self.env['res.company'].sudo().search([], limit=1)).id,
+        )
+
+    def _get_api_company_id(self, pos_name='ECommerce'):
+        """
+        Compañía en la que se registra la petición, por orden de prioridad:
+
+        1. La compañía de la API key.
+        2. pos_order_api.company_by_pos_name: JSON {"<pos_name del payload>": id de compañía}.
+        3. La compañía del punto de venta existente con ese nombre.
+        4. La compañía por defecto.
+        """
+        context = get_request_context()
+        if context and context.company_id:
+            return context.company_id
+
+        # get_param ya está en la caché del registro; la clave incluye el valor
+        # del parámetro para que un cambio del mapeo se aplique de inmediato
+        mapping = self.env['ir.config_parameter'].sudo().get_param('pos_order_api.company_by_pos_name')
+
+        def compute():
+            raw_name = pos_name[len('ECommerce'):].strip() if pos_name.startswith('ECommerce') else pos_name
+            if mapping:
+                try:
+                    company_id = int(json_codec.loads(mapping).get(raw_name) or 0)
+                except (ValueError, TypeError, AttributeError):
+                    _logger.warning("pos_order_api.company_by_pos_name no es un objeto JSON válido de ids de compañía")
+                    company_id = 0
+                if company_id and self.env['res.company'].sudo().browse(company_id).exists():
+                    return company_id
+            config = self.env['pos.config'].sudo().search([('name', '=', pos_name)], order='id', limit=1)
+            return config.company_id.id or self._get_default_company_id()
+
+        return self._get_cached_reference(('pos_company', pos_name, mapping), compute)
+
+    def _get_or_create_pos_session(self, pos_name='ECommerce', company_id=False):
+        """
+        Obtiene la sesión POS de pos_name desde la caché del worker si sigue
+        abierta; si no, la busca o la crea.
+        """
+        cache_key = (company_id, pos_name)
+        cached_session_id = session_cache.get(self.env, cache_key, None)
+        if cached_session_id:
+            # Una sola consulta por clave primaria para confirmar que sigue abierta y no fue rotada
+            if self.env['pos.session'].sudo().search_count([
+                ('id', '=', cached_session_id),
+                ('state', '=', 'opened'),
+                ('api_retired', '=', False),
+            ]):
+                return cached_session_id
+            session_cache.pop(self.env, cache_key)
+
+        session_id = self._find_or_create_pos_session(pos_name, company_id)
+        if session_id:
+            session_cache.set(self.env, cache_key, session_id)
+        return session_id
+
+    def _find_or_create_pos_session(self, pos_name='ECommerce', company_id=False):
         """
         Obtiene o crea una sesión POS para el punto de venta especificado por pos_name.
         Versión mejorada que maneja mejor los duplicados y errores de transacción.
+        Con company_id, solo se usan puntos de venta de esa compañía.
         """
+        company_domain = [('config_id.company_id', '=', company_id)] if company_id else []
         try:
             # Usar sudo para evitar problemas de permisos
-            PosSession = request.env['pos.session'].sudo()
-            PosConfig = request.env['pos.config'].sudo()
+            PosSession = self.env['pos.session'].sudo()
+            PosConfig = self.env['pos.config'].sudo()
+            
+            # Con rotación activa cada pos_name tiene su propia sesión gestionada por la API
+            rotation = self.env['ir.config_parameter'].sudo().get_param(
+                'pos_order_api.session_rotation', 'True'
+            ).lower() == 'true'
+            
+            # 0. Sesión vigente gestionada por la API para este punto de venta
+            api_session = PosSession.search([
+                ('api_managed', '=', True),
+                ('api_pos_name', '=', pos_name),
+                ('api_retired', '=', False),
+                ('state', '=', 'opened'),
+            ] + company_domain, order="id desc", limit=1)
+            if api_session:
+                return api_session.id
             
             # 1. Primero buscar cualquier sesión abierta existente (estrategia simple y segura)
-            any_open_session = PosSession.search([('state', '=', 'opened')], limit=1)
-            if any_open_session:
-                _logger.info(f"Usando sesión abierta existente: {any_open_session.id}")
-                return any_open_session.id
+            if not rotation:
+                any_open_session = PosSession.search([('state', '=', 'opened')] + company_domain, limit=1)
+                if any_open_session:
+                    _logger.debug("Usando sesión abierta existente: %s", any_open_session.id)
+                    return any_open_session.id
             
             # 2. Buscar el punto de venta por nombre
-            ecommerce_config = PosConfig.search([('name', '=', pos_name)], limit=1)
+            ecommerce_config = PosConfig.search(
+                [('name', '=', pos_name)] + ([('company_id', '=', company_id)] if company_id else []), limit=1
+            )
             
             # Si no existe, crearlo
             if not ecommerce_config:
                 try:
-                    _logger.info(f"Creando nuevo punto de venta '{pos_name}'")
+                    _logger.info("Creando nuevo punto de venta '%s'", pos_name)
                     
-                    # Obtener company por defecto
-                    company = request.env['res.company'].sudo().search([('id', '=', 1)], limit=1)
-                    if not company:
-                        company = request.env['res.company'].sudo().search([], limit=1)
+                    # Compañía de la petición, o la compañía por defecto
+                    company = self.env['res.company'].sudo().browse(company_id or self._get_default_company_id())
+                    
+                    # Lista de precios de la compañía (o compartida)
+                    pricelist_id = self._get_cached_reference(
+                        'pricelist',
+                        lambda: self.env['product.pricelist'].sudo().search(
+                            [('company_id', 'in', [company.id, False])], order='company_id, id', limit=1,
+                        ).id,
+                        company.id,
+                    )
                     
                     # Obtener o crear un journal específico para POS
-                    journal = request.env['account.journal'].sudo().search([
+                    journal = self.env['account.journal'].sudo().search([
                         ('type', '=', 'general'),
                         ('company_id', '=', company.id),
                         ('code', 'like', 'POS%')
@@ -45,7 +181,7 @@ class PosRestController(http.Controller):
                     
                     if not journal:
                         # Crear un journal específico para POS con todos los campos requeridos
-                        journal = request.env['account.journal'].sudo().create({
+                        journal = self.env['account.journal'].sudo().create({
                             'name': 'Point of Sale',
                             'code': 'POSS',
                             'type': 'general',
@@ -59,72 +195,82 @@ class PosRestController(http.Controller):
                         'company_id': company.id,
                         'journal_id': journal.id,
                         'invoice_journal_id': journal.id,
-                        'pricelist_id': 1,  # Pricelist por defecto
+                        'pricelist_id': pricelist_id or False,
                         'payment_method_ids': [(6, 0, [])],  # Sin métodos de pago específicos
-                        'use_pricelist': True,
+                        'use_pricelist': bool(pricelist_id),
                         'tax_regime_selection': False,
                         'module_account': True,
                     })
                 except Exception as e:
-                    _logger.error(f"Error al crear punto de venta: {str(e)}")
-                    # Buscar cualquier punto de venta existente
-                    ecommerce_config = PosConfig.search([], limit=1)
+                    _logger.error("Error al crear punto de venta: %s", e)
+                    # Buscar cualquier punto de venta existente (de la compañía si se indicó)
+                    ecommerce_config = PosConfig.search(
+                        [('company_id', '=', company_id)] if company_id else [], limit=1
+                    )
                     if not ecommerce_config:
                         _logger.error("No se encontró ningún punto de venta")
                         return 1
             
             # 3. Verificar si ya existe una sesión para este punto de venta
             existing_session = PosSession.search([
-                ('config_id', '=', ecommerce_config.id)
+                ('config_id', '=', ecommerce_config.id),
+                ('api_retired', '=', False),
             ], order="id desc", limit=1)
             
             if existing_session:
                 if existing_session.state == 'opened':
-                    _logger.info(f"Usando sesión existente abierta: {existing_session.id}")
+                    _logger.debug("Usando sesión existente abierta: %s", existing_session.id)
+                    if rotation and not existing_session.api_managed:
+                        # Adoptar la sesión para que entre en la rotación
+                        existing_session.write({'api_managed': True, 'api_pos_name': pos_name})
                     return existing_session.id
                 else:
                     # Si la sesión existe pero no está abierta, intentar abrirla
                     try:
                         if existing_session.state == 'opening_control':
                             existing_session.action_pos_session_open()
-                            _logger.info(f"Sesión abierta: {existing_session.id}")
+                            if rotation and not existing_session.api_managed:
+                                existing_session.write({'api_managed': True, 'api_pos_name': pos_name})
+                            _logger.debug("Sesión abierta: %s", existing_session.id)
                             return existing_session.id
                     except Exception as e:
-                        _logger.error(f"Error al abrir sesión existente: {str(e)}")
+                        _logger.error("Error al abrir sesión existente: %s", e)
             
             # 4. Como último recurso, intentar crear una nueva sesión con manejo de duplicados
             try:
                 # Obtener un usuario administrador
-                admin_user = request.env.ref('base.user_admin', raise_if_not_found=False)
+                admin_user = self.env.ref('base.user_admin', raise_if_not_found=False)
                 if not admin_user:
-                    admin_user = request.env['res.users'].sudo().search([('id', '=', 1)], limit=1)
+                    admin_user = self.env['res.users'].sudo().search([('id', '=', 1)], limit=1)
                 
                 user_id = admin_user.id if admin_user else 1
                 
-                _logger.info(f"Creando nueva sesión para '{pos_name}' con usuario {user_id}")
+                _logger.info("Creando nueva sesión para '%s' con usuario %s", pos_name, user_id)
                 
                 # Intentar crear sesión de forma directa
                 new_session = PosSession.create({
                     'user_id': user_id,
                     'config_id': ecommerce_config.id,
+                    'api_managed': True,
+                    'api_pos_name': pos_name,
                 })
                 
                 # Intentar abrir la sesión
                 try:
                     new_session.action_pos_session_open()
-                    _logger.info(f"Nueva sesión creada y abierta: {new_session.id}")
+                    _logger.info("Nueva sesión creada y abierta: %s", new_session.id)
                     return new_session.id
                 except Exception as open_error:
-                    _logger.warning(f"Sesión creada pero no se pudo abrir: {str(open_error)}")
+                    _logger.warning("Sesión creada pero no se pudo abrir: %s", open_error)
                     return new_session.id
                         
             except Exception as e:
-                _logger.error(f"Error al crear nueva sesión: {str(e)}")
+                _logger.error("Error al crear nueva sesión: %s", e)
             
             # 5. Si todo falla, buscar cualquier sesión disponible
-            fallback_session = PosSession.search([], order="id desc", limit=1)
+            fallback_session = PosSession.search(company_domain, order="id desc", limit=1)
             if fallback_session:
-                _logger.info(f"Usando sesión de respaldo: {fallback_session.id}")
+                _logger.info("Usando sesión de respaldo: %s", fallback_session.id)
                 return fallback_session.id
             
             # 6. Último recurso absoluto
@@ -132,27 +278,34 @@ class PosRestController(http.Controller):
             return 1
             
         except Exception as e:
-            _logger.error(f"Error crítico en _get_or_create_pos_session: {str(e)}")
+            _logger.error("Error crítico en _find_or_create_pos_session: %s", e)
             return 1
 
-    def _get_or_create_partner(self, partner_id=None):
+    def _get_or_create_partner(self, partner_id=None, customer=None, company_id=False):
         """
         Obtiene un cliente existente o crea uno nuevo si no se proporciona.
+        Si el payload trae la identidad del cliente (external_id, email o teléfono)
+        se resuelve por claves normalizadas e indexadas.
         Versión mejorada que maneja mejor los errores de permisos.
         """
         try:
-            Partner = request.env['res.partner'].sudo()
+            Partner = self.env['res.partner'].sudo()
             
             if partner_id:
                 partner = Partner.browse(partner_id)
                 if partner.exists():
                     return partner_id
+
+            if customer:
+                resolved_id = Partner._pos_api_resolve_customers([customer], company_id)[0]
+                if resolved_id:
+                    return resolved_id
             
             # Buscar un cliente existente (que no sea empresa ni proveedor)
             partner = Partner.search([
                 ('is_company', '=', False),
-                ('supplier_rank', '=', 0)
-            ], limit=1)
+                ('supplier_rank', '=', 0),
+            ] + ([('company_id', 'in', [company_id, False])] if company_id else []), limit=1)
             
             if partner:
                 return partner.id
@@ -161,73 +314,92 @@ class PosRestController(http.Controller):
             try:
                 new_partner = Partner.create({
                     'name': 'Cliente Ecommerce API',
-                    'company_id': 1,  # Usar company_id fijo
+                    'company_id': company_id or self._get_default_company_id(),
                     'is_company': False,
                     'customer_rank': 1,
                 })
                 return new_partner.id
             except Exception as e:
-                _logger.error(f"Error al crear nuevo cliente: {str(e)}")
+                _logger.error("Error al crear nuevo cliente: %s", e)
                 # Buscar cualquier partner existente
                 fallback_partner = Partner.search([], limit=1)
                 if fallback_partner:
                     return fallback_partner.id
                 return 1  # Partner por defecto
                 
+        except SerializationFailure:
+            # Conflicto con otra transacción: Odoo reintenta la petición completa
+            raise
         except Exception as e:
-            _logger.error(f"Error en _get_or_create_partner: {str(e)}")
+            _logger.error("Error en _get_or_create_partner: %s", e)
             return 1  # Partner por defecto
 
-    def _get_or_create_product(self, product_name, price_unit=0.0):
+    def _get_or_create_product(self, product_name, price_unit=0.0, company_id=False):
         """
         Obtiene un producto existente o crea uno nuevo con el sufijo 'D'.
         Versión mejorada que maneja mejor los errores y transacciones abortadas.
+        Con company_id se buscan los productos de esa compañía o compartidos.
         """
         if not product_name:
             _logger.error("Se recibió un nombre de producto vacío")
             return False
 
+        company_id = company_id or self._get_default_company_id()
+
+        # Los productos ya existentes se resuelven desde la caché del worker, por compañía
+        cache_key = (company_id, f"{product_name} D")
+        cached_product_id = product_cache.get(self.env, cache_key, None)
+        if cached_product_id:
+            return cached_product_id
+
         try:
             # Usar un savepoint para manejar transacciones abortadas
-            with request.env.cr.savepoint():
-                Product = request.env['product.product'].sudo()
+            with self.env.cr.savepoint():
+                Product = self.env['product.product'].sudo()
                 
                 # Buscar el producto con el sufijo 'D'
                 product_name_with_d = f"{product_name} D"
-                _logger.info(f"Buscando producto: {product_name_with_d}")
+                _logger.debug("Buscando producto: %s", product_name_with_d)
                 
-                product = Product.search([('name', '=', product_name_with_d)], limit=1)
+                product = Product.search([
+                    ('name', '=', product_name_with_d),
+                    ('company_id', 'in', [company_id, False]),
+                ], order='company_id, id', limit=1)
                 
                 if product:
-                    _logger.info(f"Producto encontrado: {product_name_with_d} (ID: {product.id})")
+                    _logger.debug("Producto encontrado: %s (ID: %s)", product_name_with_d, product.id)
+                    product_cache.set(self.env, cache_key, product.id)
                     return product.id
                     
                 # Si no existe, crear el producto
                 try:
-                    _logger.info(f"Intentando crear nuevo producto: {product_name_with_d} con precio {price_unit}")
+                    _logger.debug("Intentando crear nuevo producto: %s con precio %s", product_name_with_d, price_unit)
                         
-                    # Obtener company por defecto
-                    company = request.env['res.company'].sudo().search([('id', '=', 1)], limit=1)
-                    if not company:
-                        company = request.env['res.company'].sudo().search([], limit=1)
+                    company = self.env['res.company'].sudo().browse(company_id)
                     
                     # Obtener la categoría por defecto o crear una
-                    category = request.env['product.category'].sudo().search([('name', '=', 'Ecommerce')], limit=1)
+                    category = self.env['product.category'].sudo().browse(self._get_cached_reference(
+                        'product_category',
+                        lambda: self.env['product.category'].sudo().search([('name', '=', 'Ecommerce')], limit=1).id,
+                    ))
                     if not category:
                         try:
-                            category = request.env['product.category'].sudo().create({
+                            category = self.env['product.category'].sudo().create({
                                 'name': 'Ecommerce',
                                 'parent_id': False,
                             })
                         except:
-                            category = request.env['product.category'].sudo().search([], limit=1)
+                            category = self.env['product.category'].sudo().search([], limit=1)
                     
                     # Obtener unidades de medida por defecto
-                    uom = request.env.ref('uom.product_uom_unit', raise_if_not_found=False)
+                    uom = self.env['uom.uom'].sudo().browse(self._get_cached_reference(
+                        'uom_unit',
+                        lambda: (self.env.ref('uom.product_uom_unit', raise_if_not_found=False) or self.env['uom.uom']).id,
+                    ))
                     if not uom:
-                        uom = request.env['uom.uom'].sudo().search([('category_id.name', '=', 'Unit')], limit=1)
+                        uom = self.env['uom.uom'].sudo().search([('category_id.name', '=', 'Unit')], limit=1)
                         if not uom:
-                            uom = request.env['uom.uom'].sudo().search([], limit=1)
+                            uom = self.env['uom.uom'].sudo().search([], limit=1)
                     
                     new_product = Product.create({
                         'name': product_name_with_d,
@@ -245,20 +417,20 @@ class PosRestController(http.Controller):
                         'taxes_id': [(6, 0, [])],  # Sin impuestos por defecto
                         'supplier_taxes_id': [(6, 0, [])],  # Sin impuestos de proveedor
                     })
-                    _logger.info(f"Producto creado exitosamente: {product_name_with_d} (ID: {new_product.id})")
+                    _logger.info("Producto creado exitosamente: %s (ID: %s)", product_name_with_d, new_product.id)
                     return new_product.id
                     
                 except Exception as e:
-                    _logger.error(f"Error al crear producto {product_name_with_d}: {str(e)}")
+                    _logger.error("Error al crear producto %s: %s", product_name_with_d, e)
                     # Si hay error en la creación, intentar rollback y buscar fallback
                     raise
                     
         except Exception as e:
-            _logger.error(f"Error en savepoint al crear producto: {str(e)}")
+            _logger.error("Error en savepoint al crear producto: %s", e)
             
             # Intentar buscar un producto existente como fallback
             try:
-                Product = request.env['product.product'].sudo()
+                Product = self.env['product.product'].sudo()
                 
                 # Buscar un producto genérico como fallback
                 fallback_product = Product.search([('name', 'ilike', 'producto')], limit=1)
@@ -268,11 +440,11 @@ class PosRestController(http.Controller):
                     fallback_product = Product.search([], limit=1)
                 
                 if fallback_product:
-                    _logger.info(f"Usando producto de respaldo: {fallback_product.name} (ID: {fallback_product.id})")
+                    _logger.info("Usando producto de respaldo: %s (ID: %s)", fallback_product.name, fallback_product.id)
                     return fallback_product.id
                 
             except Exception as fallback_error:
-                _logger.error(f"Error al buscar producto de respaldo: {str(fallback_error)}")
+                _logger.error("Error al buscar producto de respaldo: %s", fallback_error)
             
             return False
 
@@ -294,116 +466,179 @@ class PosRestController(http.Controller):
         image_url = f"{base_url}/web/image/product.product/{product_id}/image_{size}"
         return image_url
 
+    def _queue_audit(self, order_id, source, started, payload_hash=None, notified_count=0, notify_ms=0.0):
+        """
+        Encola la entrada de auditoría de la orden; se inserta en bloque al confirmar la transacción
+        """
+        try:
+            context = get_request_context()
+            self.env['pos.order.api.audit'].sudo()._queue_entry(
+                order_id,
+                source,
+                payload_hash=payload_hash,
+                request_id=context and context.request_id,
+                notified_count=notified_count,
+                duration_ms=(time.perf_counter() - started) * 1000,
+                notify_ms=notify_ms,
+            )
+        except Exception as e:
+            _logger.warning("No se pudo registrar la auditoría de la orden %s: %s", order_id, e)
+
     @http.route('/api/pos/order', type='http', auth='none', methods=['POST'], csrf=False)
+    @api_guard(scope='order', inflight=True, capture=True)
     def create_pos_order(self):
+        # Leer y validar el payload (líneas, extras y montos) en una sola pasada
+        started = time.perf_counter()
+        order_data, error = read_json(ORDER_SCHEMA)
+        if error:
+            return error
+
+        payload_hash = hashlib.sha256(request.httprequest.get_data()).hexdigest()
+
+        # Ingesta diferida: la orden queda en la cola y la crea un worker (202 con ticket)
+        if request.env['ir.config_parameter'].sudo().get_param('pos_order_api.buffered_ingest', 'False').lower() == 'true':
+            return self._enqueue_order(order_data, payload_hash)
+
+        return json_response(self._create_order(order_data, started, payload_hash))
+
+    def _enqueue_order(self, order_data, payload_hash):
+        """
+        Guarda el payload ya validado en la cola de ingesta y responde 202 con
+        el ticket para consultar el resultado.
+        """
+        context = get_request_context()
+        pos_name = f"ECommerce {order_data['pos_name']}" if order_data['pos_name'] else 'ECommerce'
         try:
-            # Usar un savepoint principal para manejar toda la transacción
-            with request.env.cr.savepoint():
-                # Obtener datos JSON desde la petición HTTP
-                order_data = json.loads(request.httprequest.data.decode('utf-8'))
+            with stage('enqueue'):
+                ticket = request.env['pos.order.api.intake'].sudo()._enqueue(
+                    order_data,
+                    pos_name,
+                    company_id=context and context.company_id,
+                    api_key_id=context and context.api_key_id,
+                    request_id=context and context.request_id,
+                    payload_hash=payload_hash,
+                )
+        except Exception as e:
+            _logger.error("Error al encolar la orden: %s", e)
+            return error_response(str(e))
+
+        set_summary_field('ticket', ticket)
+        return json_response({
+            "success": True,
+            "queued": True,
+            "ticket": ticket,
+            "status_url": f"/api/pos/order/ticket/{ticket}",
+        }, status=202)
 
-                # Validar que existan líneas de pedido
-                if 'lines' not in order_data or not order_data['lines']:
-                    return json.dumps({"success": False, "error": "Debe proporcionar al menos una línea de pedido"})
+    def _create_order(self, order_data, started, payload_hash=None, source='api', fallback=True):
+        """
+        Crea la orden de un payload ya validado, con sus notificaciones y su
+        auditoría. La usan la ruta de órdenes y los workers de la ingesta
+        diferida (con un entorno fijo, ver _with_env).
+
+        Con fallback=False un error no crea la orden de respaldo: la excepción
+        se propaga para que quien llama revierta y reintente.
 
+        Returns:
+            dict: el cuerpo de la respuesta de /api/pos/order
+        """
+        try:
+            # Usar un savepoint principal para manejar toda la transacción
+            with self.env.cr.savepoint():
                 # Obtener el nombre del punto de venta si se proporciona
-                pos_name = order_data.get('pos_name', 'ECommerce')
-                if 'pos_name' in order_data:
-                    pos_name = f"ECommerce {pos_name}"
+                pos_name = 'ECommerce'
+                if order_data['pos_name']:
+                    pos_name = f"ECommerce {order_data['pos_name']}"
+
+                # Compañía de la marca: sesión, cliente y productos se buscan en ella
+                company_id = self._get_api_company_id(pos_name)
+                set_summary_field('company', company_id)
 
                 # Obtener o crear una sesión POS para el punto de venta indicado
-                session_id = self._get_or_create_pos_session(pos_name)
+                with stage('session'):
+                    session_id = self._get_or_create_pos_session(pos_name, company_id)
                 
                 # Obtener o crear un cliente
-                partner_id = self._get_or_create_partner(order_data.get('partner_id'))
+                with stage('partner'):
+                    partner_id = self._get_or_create_partner(order_data['partner_id'], order_data['customer'], company_id)
             
             # Preparar las líneas de la orden y calcular totales automáticamente
             order_lines = []
             calculated_total = 0.0
+            extras_total = 0.0
             
             for line in order_data['lines']:
-                qty = line.get('qty', 0.0)
-                base_price_unit = line.get('price_unit', 0.0)
-                discount = line.get('discount', 0.0)
-                # Permite ambos campos para compatibilidad
-                base_note = line.get('customer_note') or line.get('note', '')
-                
-                # Procesar extras si existen
-                extras = line.get('extras', [])
-                extras_price = 0.0
-                extras_text = ""
-                
-                if extras:
-                    extras_list = []
-                    for extra in extras:
-                        extra_name = extra.get('name', '')
-                        extra_price = extra.get('price', 0.0)
-                        
-                        if extra_name:
-                            if extra_price > 0:
-                                extras_list.append(f"+ {extra_name} (+${extra_price:.2f})")
-                                extras_price += extra_price
-                            else:
-                                extras_list.append(f"+ {extra_name}")
-                    
-                    if extras_list:
-                        extras_text = "\nExtras: " + ", ".join(extras_list)
-                
-                # Calcular el precio unitario total (precio base + extras)
-                total_price_unit = base_price_unit + extras_price
-                
-                # Combinar nota base con extras
-                final_note = base_note + extras_text
+                # Precio unitario con extras, subtotal, nota y extras estructurados
+                priced = price_line(line)
                 
                 # Obtener o crear el producto, pasando el precio base
-                product_id = self._get_or_create_product(line.get('product_name', ''), base_price_unit)
+                with stage('products'):
+                    product_id = self._get_or_create_product(line['product_name'], priced['base_price_unit'], company_id)
                 if not product_id:
-                    return json.dumps({"success": False, "error": f"No se pudo crear/obtener el producto: {line.get('product_name', '')}"})
-                
-                # Calcular price_subtotal con el precio total (incluyendo extras)
-                price_subtotal = qty * total_price_unit * (1 - discount / 100.0)
+                    return {"success": False, "error": f"No se pudo crear/obtener el producto: {line['product_name']}"}
                 
                 # Sumar al total calculado
-                calculated_total += price_subtotal
+                calculated_total += priced['subtotal']
+                extras_total += priced['extras_amount']
                 
                 order_lines.append((0, 0, {
                     'product_id': product_id,
-                    'qty': qty,
-                    'price_unit': total_price_unit,  # Precio unitario incluyendo extras
-                    'discount': discount,
-                    'price_subtotal': price_subtotal,
-                    'price_subtotal_incl': price_subtotal,  # También podría incluir impuestos si es necesario
-                    'customer_note': final_note,  # Nota que incluye extras
+                    'qty': priced['qty'],
+                    'price_unit': priced['price_unit'],  # Precio unitario incluyendo extras
+                    'discount': priced['discount'],
+                    'price_subtotal': priced['subtotal'],
+                    'price_subtotal_incl': priced['subtotal'],  # También podría incluir impuestos si es necesario
+                    'customer_note': priced['note'],  # Nota que incluye extras
+                    # Extras estructurados, creados en el mismo create de la orden
+                    'api_extra_ids': [(0, 0, extra) for extra in priced['extras']],
                 }))
             
             # Usar el total calculado automáticamente
             amount_total = calculated_total
-            amount_tax = order_data.get('amount_tax', 0.0)
-            amount_paid = order_data.get('amount_paid', amount_total)  # Si no se especifica, usar el total
-            amount_return = order_data.get('amount_return', max(0.0, amount_paid - amount_total))
+            amount_tax = order_data['amount_tax']
+            amount_paid = order_data['amount_paid'] if order_data['amount_paid'] is not None else amount_total  # Si no se especifica, usar el total
+            amount_return = order_data['amount_return'] if order_data['amount_return'] is not None else max(0.0, amount_paid - amount_total)
                     
             # Crear la orden POS con manejo robusto de errores
-            order = request.env['pos.order'].sudo().create({
-                'partner_id': partner_id,
-                'lines': order_lines,
-                'session_id': session_id,
-                'amount_paid': amount_paid,
-                'amount_total': amount_total,
-                'amount_tax': amount_tax,
-                'amount_return': amount_return,
-                'pricelist_id': order_data.get('pricelist_id'),
-            })
+            with stage('create'):
+                order = self.env['pos.order'].sudo().create({
+                    'partner_id': partner_id,
+                    'lines': order_lines,
+                    'session_id': session_id,
+                    'amount_paid': amount_paid,
+                    'amount_total': amount_total,
+                    'amount_tax': amount_tax,
+                    'amount_return': amount_return,
+                    'pricelist_id': order_data['pricelist_id'],
+                    'api_pos_name': pos_name,
+                    'api_extras_total': extras_total,
+                    'api_external_ref': order_data['external_ref'] or False,
+                })
+            set_summary_field('order_id', order.id)
+            set_summary_field('lines', len(order_lines))
+
+            # Actualizar el resumen incremental de ventas (misma transacción que la orden)
+            try:
+                with stage('stats'), self.env.cr.savepoint():
+                    self.env['pos.order.api.stats'].sudo()._record_order(
+                        pos_name, order.date_order, amount_total, extras_total
+                    )
+            except Exception as e:
+                _logger.error("Error al actualizar estadísticas de la API: %s", e)
 
             # Forzar la actualización de la orden para obtener la referencia
             order._compute_pos_reference() if hasattr(order, '_compute_pos_reference') else None
             
             # Verificar el punto de venta usado
-            session = request.env['pos.session'].sudo().browse(session_id)
+            session = self.env['pos.session'].sudo().browse(session_id)
             config_name = session.config_id.name if session.exists() else "Desconocido"
 
             # Obtener la referencia de la orden de manera segura
             pos_reference = order.pos_reference if order.pos_reference else f"ORD-{order.id}"
 
+            # Aviso a las pantallas de cocina conectadas al stream de su punto de venta
+            order._api_publish_order_event(pos_reference, len(order_lines))
+
             response = {
                 "success": True,
                 "order_id": order.id,
@@ -422,51 +657,87 @@ class PosRestController(http.Controller):
             # Enviar notificación de nueva orden de ecommerce con múltiples fallbacks
             notification_sent = False
             notification_count = 0
+            notify_started = time.perf_counter()
+            
+            # Cada estrategia costosa pasa por su circuit breaker: si está
+            # fallando o va lenta se omite sin costo y se prueba la siguiente.
+            # Las estrategias propagan sus errores (el breaker los cuenta) y
+            # corren en su propio savepoint para no abortar la transacción de la orden
+            skipped = []
             
             # Intento 1: Notificación a TODOS los usuarios POS (estrategia agresiva)
             try:
-                notification_count = request.env['pos.order'].send_notification_to_all_pos_users(response)
-                if notification_count > 0:
+                with self.env.cr.savepoint():
+                    targeted = notification_breakers['all_pos_users'].call(
+                        self.env, self.env['pos.order'].send_notification_to_all_pos_users, response
+                    )
+                notification_count = targeted['recipients']
+                # Sin nadie conectado ni de turno la orden igual queda atendida: no se pasa a los grupos
+                if targeted['handled']:
                     notification_sent = True
-                    _logger.info(f"Notificación masiva enviada a {notification_count} usuarios para la orden {pos_reference}")
+                    _logger.debug("Notificación masiva enviada a %s usuarios para la orden %s", notification_count, pos_reference)
+            except CircuitOpenError:
+                skipped.append('all_pos_users')
             except Exception as e:
-                _logger.warning(f"Error en notificación masiva a usuarios POS: {str(e)}")
+                _logger.warning("Error en notificación masiva a usuarios POS: %s", e)
             
             # Intento 2: Notificación completa con grupos específicos (fallback)
             if not notification_sent:
                 try:
-                    request.env['pos.order'].send_ecommerce_notification(response)
+                    with self.env.cr.savepoint():
+                        notification_breakers['ecommerce'].call(
+                            self.env, self.env['pos.order'].send_ecommerce_notification, response
+                        )
                     notification_sent = True
-                    _logger.info(f"Notificación por grupos enviada para la orden {pos_reference}")
+                    _logger.debug("Notificación por grupos enviada para la orden %s", pos_reference)
+                except CircuitOpenError:
+                    skipped.append('ecommerce')
                 except Exception as e:
-                    _logger.warning(f"Error en notificación por grupos: {str(e)}")
+                    _logger.warning("Error en notificación por grupos: %s", e)
             
             # Intento 3: Notificación por mensaje en la orden (último recurso)
             if not notification_sent:
                 try:
-                    request.env['pos.order'].send_message_notification(response)
+                    with self.env.cr.savepoint():
+                        notification_breakers['message'].call(
+                            self.env, self.env['pos.order'].send_message_notification, response
+                        )
                     notification_sent = True
-                    _logger.info(f"Notificación por mensaje enviada para la orden {pos_reference}")
+                    _logger.debug("Notificación por mensaje enviada para la orden %s", pos_reference)
+                except CircuitOpenError:
+                    skipped.append('message')
                 except Exception as e:
-                    _logger.warning(f"Error en notificación por mensaje: {str(e)}")
+                    _logger.warning("Error en notificación por mensaje: %s", e)
             
             # Intento 3: Notificación simple por logs
             if not notification_sent:
                 try:
-                    request.env['pos.order'].send_simple_notification(response)
+                    self.env['pos.order'].send_simple_notification(response)
                     notification_sent = True
-                    _logger.info(f"Notificación simple enviada para la orden {pos_reference}")
+                    _logger.debug("Notificación simple enviada para la orden %s", pos_reference)
                 except Exception as e:
-                    _logger.error(f"Error en notificación simple: {str(e)}")
+                    _logger.error("Error en notificación simple: %s", e)
             
             if not notification_sent:
                 _logger.error("No se pudo enviar ningún tipo de notificación")
             
-            return json.dumps(response)
+            # Registro de auditoría en lugar de un mensaje HTML en el chatter
+            notify_ms = (time.perf_counter() - notify_started) * 1000
+            record_stage('notify', notify_ms)
+            set_summary_field('notified', notification_count)
+            if skipped:
+                set_summary_field('notify_skipped', ','.join(skipped))
+            self._queue_audit(order.id, source, started, payload_hash, notification_count, notify_ms)
+            
+            return response
 
+        except SerializationFailure:
+            raise
         except Exception as e:
-            _logger.error(f"Error general en crear orden POS: {str(e)}")
-            
+            _logger.error("Error general en crear orden POS: %s", e)
+            if not fallback:
+                raise
+
             # En caso de error, intentar crear orden con datos mínimos como fallback
             try:
                 _logger.info("Intentando crear orden con datos mínimos como fallback")
@@ -476,15 +747,15 @@ class PosRestController(http.Controller):
                 fallback_partner_id = 1  # Cliente fijo de respaldo
                 
                 # Buscar un producto cualquiera para el fallback
-                fallback_product = request.env['product.product'].sudo().search([
+                fallback_product = self.env['product.product'].sudo().search([
                     ('available_in_pos', '=', True)
                 ], limit=1)
                 
                 if not fallback_product:
-                    fallback_product = request.env['product.product'].sudo().search([], limit=1)
+                    fallback_product = self.env['product.product'].sudo().search([], limit=1)
                 
                 if fallback_product:
-                    fallback_order = request.env['pos.order'].sudo().create({
+                    fallback_order = self.env['pos.order'].sudo().create({
                         'partner_id': fallback_partner_id,
                         'session_id': fallback_session_id,
                         'amount_paid': 0.0,
@@ -501,8 +772,9 @@ class PosRestController(http.Controller):
                             'customer_note': f"Orden de emergencia - Error original: {str(e)[:100]}",
                         })]
                     })
+                    self._queue_audit(fallback_order.id, 'fallback', started, payload_hash)
                     
-                    return json.dumps({
+                    return {
                         "success": True,
                         "order_id": fallback_order.id,
                         "pos_reference": f"ORD-FALLBACK-{fallback_order.id}",
@@ -511,32 +783,427 @@ class PosRestController(http.Controller):
                         "pos_name": "Fallback",
                         "warning": "Orden creada con datos de respaldo debido a errores en la creación normal",
                         "original_error": str(e)
-                    })
+                    }
                 
             except Exception as fallback_error:
-                _logger.error(f"Error crítico en fallback: {str(fallback_error)}")
+                _logger.error("Error crítico en fallback: %s", fallback_error)
             
-            return json.dumps({"success": False, "error": str(e)})
+            return {"success": False, "error": str(e)}
+
+    def _find_product(self, product_name, company_id):
+        """
+        Resuelve un producto existente (con el sufijo 'D') sin crearlo.
+        Devuelve False si todavía no existe.
+        """
+        cache_key = (company_id, f"{product_name} D")
+        product_id = product_cache.get(request.env, cache_key, None)
+        if product_id:
+            return product_id
+
+        product = request.env['product.product'].sudo().search([
+            ('name', '=', f"{product_name} D"),
+            ('company_id', 'in', [company_id, False]),
+        ], order='company_id, id', limit=1)
+        if product:
+            product_cache.set(request.env, cache_key, product.id)
+        return product.id
+
+    @http.route('/api/pos/quote', type='http', auth='none', methods=['POST'], csrf=False)
+    @api_guard(scope='order')
+    def quote_cart(self):
+        """
+        Cotiza un carrito con el mismo cálculo de líneas y extras que la
+        creación de órdenes, sin crear nada. Las cotizaciones se memorizan por
+        el hash del carrito normalizado: repetir un carrito no consulta la base.
+        """
+        data, error = read_json(QUOTE_SCHEMA)
+        if error:
+            return error
+
+        try:
+            pos_name = f"ECommerce {data['pos_name']}" if data['pos_name'] else 'ECommerce'
+            company_id = self._get_api_company_id(pos_name)
+            key = (company_id, cart_key(data['lines']))
+            quote = quote_cache.get(request.env, key, None)
+            set_summary_field('quote_cached', quote is not None)
+            if quote is not None:
+                return json_response(dict(quote, success=True, cached=True))
+
+            lines = []
+            amount_total = 0.0
+            extras_total = 0.0
+            with stage('products'):
+                for line in data['lines']:
+                    priced = price_line(line)
+                    product_id = self._find_product(line['product_name'], company_id)
+                    amount_total += priced['subtotal']
+                    extras_total += priced['extras_amount']
+                    lines.append({
+                        'product_name': priced['product_name'],
+                        'product_id': product_id or None,
+                        'new_product': not product_id,
+                        'qty': priced['qty'],
+                        'base_price_unit': priced['base_price_unit'],
+                        'extras_price': priced['extras_price'],
+                        'price_unit': priced['price_unit'],
+                        'discount': priced['discount'],
+                        'subtotal': priced['subtotal'],
+                        'extras_amount': priced['extras_amount'],
+                        'customer_note': priced['note'],
+                        'extras': priced['extras'],
+                    })
+
+            quote = {
+                'lines': lines,
+                'amount_total': amount_total,
+                'extras_total': extras_total,
+                'amount_tax': 0.0,
+            }
+            # Un producto aún inexistente puede crearse en cualquier momento:
+            # solo se memorizan los carritos con todos sus productos resueltos
+            if all(line['product_id'] for line in lines):
+                quote_cache.set(request.env, key, quote)
+
+            return json_response(dict(quote, success=True, cached=False))
+        except Exception as e:
+            _logger.error("Error al cotizar el carrito: %s", e)
+            return error_response(str(e))
+
+    @http.route('/api/pos/stats', type='http', auth='none', methods=['GET'], csrf=False)
+    @api_guard(scope='stats')
+    def get_sales_stats(self):
+        """
+        Devuelve conteo de órdenes, total vendido y total de extras por punto de venta,
+        agrupados por hora o por día, leyendo del resumen incremental.
+        """
+        try:
+            args = request.httprequest.args
+            granularity = args.get('granularity', 'day')
+            if granularity not in ('hour', 'day'):
+                return error_response("granularity debe ser 'hour' o 'day'", status=400)
+
+            # Mismo nombre que usa create_pos_order para el punto de venta
+            pos_name = args.get('pos_name')
+            if pos_name:
+                pos_name = f"ECommerce {pos_name}"
+
+            try:
+                limit = min(int(args.get('limit', 1000)), 10000)
+            except ValueError:
+                limit = 1000
+
+            summary = request.env['pos.order.api.stats'].sudo().get_summary(
+                pos_name=pos_name,
+                granularity=granularity,
+                date_from=args.get('date_from'),
+                date_to=args.get('date_to'),
+                limit=limit,
+            )
+
+            return json_response({
+                "success": True,
+                "granularity": granularity,
+                "periods": summary['periods'],
+                "totals": summary['totals'],
+                "truncated": summary['truncated'],
+            })
+        except Exception as e:
+            _logger.error("Error al obtener estadísticas: %s", e)
+            return error_response(str(e))
+
+    @staticmethod
+    def _parse_iso_datetime(value):
+        """
+        Convierte una fecha ISO 8601 (cursor o rango) a datetime UTC sin zona horaria
+        """
+        moment = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+        if moment.tzinfo:
+            moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+        return moment
+
+    @http.route('/api/pos/stats/extras', type='http', auth='none', methods=['GET'], csrf=False)
+    @api_guard(scope='stats')
+    def get_extras_stats(self):
+        """
+        Cantidad e importe vendidos por extra, agregados en una sola consulta
+        sobre los extras estructurados de las líneas.
+        """
+        try:
+            args = request.httprequest.args
+
+            # Mismo nombre que usa create_pos_order para el punto de venta
+            pos_name = args.get('pos_name')
+            if pos_name:
+                pos_name = f"ECommerce {pos_name}"
+
+            try:
+                limit = min(int(args.get('limit', 1000)), 10000)
+            except ValueError:
+                limit = 1000
+
+            try:
+                date_from = args.get('date_from') and self._parse_iso_datetime(args['date_from'])
+                date_to = args.get('date_to') and self._parse_iso_datetime(args['date_to'])
+            except ValueError:
+                return error_response("date_from y date_to deben ser fechas ISO 8601", status=400)
+
+            summary = request.env['pos.order.line.api.extra'].sudo().get_extras_summary(
+                pos_name=pos_name,
+                date_from=date_from,
+                date_to=date_to,
+                limit=limit,
+            )
+
+            return json_response({
+                "success": True,
+                "extras": summary['extras'],
+                "totals": summary['totals'],
+                "truncated": summary['truncated'],
+            })
+        except Exception as e:
+            _logger.error("Error al obtener estadísticas de extras: %s", e)
+            return error_response(str(e))
+
+    @http.route('/api/pos/order/<string:ref>', type='http', auth='none', methods=['GET'], csrf=False)
+    @api_guard(scope='order')
+    def get_order_status(self, ref):
+        """
+        Estado de una orden por id o por referencia externa.
+        Un valor numérico se busca como id salvo que se pida ?by=ref.
+        """
+        try:
+            PosOrder = request.env['pos.order'].sudo()
+            if ref.isdigit() and request.httprequest.args.get('by') != 'ref':
+                rows = PosOrder._api_order_states(ids=[int(ref)])
+            else:
+                rows = PosOrder._api_order_states(external_refs=[ref])
+
+            if not rows:
+                # Las órdenes antiguas pueden estar en el archivo (ver README_ARCHIVE.md)
+                if self._fetch_archived_by_ref(ref):
+                    return error_response(
+                        "La orden está archivada", status=404,
+                        archived=True, archive_url=f"/api/pos/order/archive/{ref}",
+                    )
+                return error_response("No se encontró la orden", status=404)
+
+            return json_response({
+                "success": True,
+                "fields": STATUS_COLUMNS,
+                "order": rows[0],
+            })
+        except Exception as e:
+            _logger.error("Error al consultar la orden %s: %s", ref, e)
+            return error_response(str(e))
+
+    def _fetch_archived_by_ref(self, ref):
+        Archive = request.env['pos.order.api.archive'].sudo()
+        if ref.isdigit() and request.httprequest.args.get('by') != 'ref':
+            return Archive.fetch_archived(ids=[int(ref)])
+        return Archive.fetch_archived(external_refs=[ref])
+
+    @http.route('/api/pos/order/archive/<string:ref>', type='http', auth='none', methods=['GET'], csrf=False)
+    @api_guard(scope='order')
+    def get_archived_order(self, ref):
+        """
+        Orden archivada por id o por referencia externa, con sus líneas,
+        extras y pagos. Un valor numérico se busca como id salvo que se pida ?by=ref.
+        """
+        try:
+            orders = self._fetch_archived_by_ref(ref)
+            if not orders:
+                return error_response("No se encontró la orden archivada", status=404)
+            return json_response({"success": True, "order": orders[0]})
+        except Exception as e:
+            _logger.error("Error al consultar la orden archivada %s: %s", ref, e)
+            return error_response(str(e))
+
+    @http.route('/api/pos/orders/archive', type='http', auth='none', methods=['POST'], csrf=False)
+    @api_guard(scope='order')
+    def get_archived_orders(self):
+        """
+        Varias órdenes archivadas por ids y/o referencias externas
+        """
+        data, error = read_json(ARCHIVE_SCHEMA)
+        if error:
+            return error
+        if not data['ids'] and not data['external_refs']:
+            return error_response("Debe indicar ids o external_refs", status=400)
+        if len(data['ids']) + len(data['external_refs']) > MAX_ARCHIVE_IDS:
+            return error_response(f"Se admiten como máximo {MAX_ARCHIVE_IDS} órdenes por consulta", status=400)
+
+        try:
+            orders = request.env['pos.order.api.archive'].sudo().fetch_archived(
+                ids=data['ids'], external_refs=data['external_refs'],
+            )
+            return json_response({"success": True, "orders": orders})
+        except Exception as e:
+            _logger.error("Error al consultar órdenes archivadas: %s", e)
+            return error_response(str(e))
+
+    @http.route('/api/pos/order/ticket/<string:ticket>', type='http', auth='none', methods=['GET'], csrf=False)
+    @api_guard(scope='order')
+    def get_order_ticket(self, ticket):
+        """
+        Resultado de una orden recibida en modo de ingesta diferida
+        """
+        try:
+            intake = request.env['pos.order.api.intake'].sudo()._ticket_status(ticket)
+            if not intake:
+                return error_response("No se encontró el ticket", status=404)
+
+            response = {"success": True, "ticket": intake}
+            if intake['order_id']:
+                rows = request.env['pos.order'].sudo()._api_order_states(ids=[intake['order_id']])
+                response.update(fields=STATUS_COLUMNS, order=rows[0] if rows else None)
+            return json_response(response)
+        except Exception as e:
+            _logger.error("Error al consultar el ticket %s: %s", ticket, e)
+            return error_response(str(e))
+
+    @http.route('/api/pos/orders/status', type='http', auth='none', methods=['POST'], csrf=False)
+    @api_guard(scope='order')
+    def get_orders_status(self):
+        """
+        Estado de varias órdenes (ids y/o referencias externas), o bien las
+        órdenes modificadas desde un cursor updated_since/after_id.
+        """
+        data, error = read_json(ORDER_STATUS_SCHEMA)
+        if error:
+            return error
+
+        try:
+            PosOrder = request.env['pos.order'].sudo()
+
+            if data['ids'] or data['external_refs']:
+                if len(data['ids']) + len(data['external_refs']) > MAX_STATUS_IDS:
+                    return error_response(f"Se admiten como máximo {MAX_STATUS_IDS} órdenes por consulta", status=400)
+                rows = PosOrder._api_order_states(ids=data['ids'], external_refs=data['external_refs'])
+                next_cursor = None
+            elif data['updated_since']:
+                try:
+                    updated_since = self._parse_iso_datetime(data['updated_since'])
+                except ValueError:
+                    return error_response("updated_since debe ser una fecha ISO 8601", status=400)
+                limit = max(1, min(data['limit'], MAX_STATUS_IDS))
+                rows, next_cursor = PosOrder._api_order_changes(updated_since, data['after_id'], limit)
+            else:
+                return error_response("Debe indicar ids, external_refs o updated_since", status=400)
+
+            return json_response({
+                "success": True,
+                "fields": STATUS_COLUMNS,
+                "orders": rows,
+                "next": next_cursor,
+            })
+        except Exception as e:
+            _logger.error("Error al consultar el estado de órdenes: %s", e)
+            return error_response(str(e))
+
+    @http.route('/api/pos/orders/export', type='http', auth='none', methods=['GET'], csrf=False)
+    @api_guard(scope='stats')
+    def export_orders(self):
+        """
+        Exporta en streaming las órdenes de la API (CSV o NDJSON) para un rango
+        de fechas y, opcionalmente, un punto de venta.
+        """
+        try:
+            args = request.httprequest.args
+            fmt = args.get('format', 'csv')
+            if fmt not in ('csv', 'ndjson'):
+                return error_response("format debe ser 'csv' o 'ndjson'", status=400)
+
+            # Mismo nombre que usa create_pos_order para el punto de venta
+            pos_name = args.get('pos_name')
+            if pos_name:
+                pos_name = f"ECommerce {pos_name}"
+
+            # Las fechas se validan antes de empezar a transmitir
+            try:
+                date_from = args.get('date_from') and self._parse_iso_datetime(args['date_from'])
+                date_to = args.get('date_to') and self._parse_iso_datetime(args['date_to'])
+            except ValueError:
+                return error_response("date_from y date_to deben ser fechas ISO 8601", status=400)
+
+            try:
+                chunk_size = int(request.env['ir.config_parameter'].sudo().get_param('pos_order_api.export_chunk_size', '2000'))
+            except ValueError:
+                chunk_size = 2000
+
+            chunks = request.env['pos.order.api.export'].sudo().export_stream(
+                fmt=fmt,
+                date_from=date_from,
+                date_to=date_to,
+                pos_name=pos_name,
+                chunk_size=max(chunk_size, 1),
+            )
+
+            if fmt == 'ndjson':
+                return stream_response(chunks, 'application/x-ndjson; charset=utf-8', 'ordenes_api.ndjson')
+            return stream_response(chunks, 'text/csv; charset=utf-8', 'ordenes_api.csv')
+        except Exception as e:
+            _logger.error("Error al exportar órdenes: %s", e)
+            return error_response(str(e))
+
+    @http.route('/api/pos/orders/stream', type='http', auth='none', methods=['GET'], csrf=False)
+    @api_guard(scope='order')
+    def stream_orders(self):
+        """
+        Server-Sent Events con las órdenes nuevas de un punto de venta, para
+        pantallas de cocina y despacho. Se reanuda con Last-Event-ID.
+        """
+        # En modo prefork una conexión abierta ocuparía un worker entero
+        if not odoo.evented and odoo.tools.config['workers']:
+            return error_response("El stream se atiende en el puerto de longpolling (gevent)", status=503)
+
+        try:
+            args = request.httprequest.args
+            # Mismo nombre que usa create_pos_order para el punto de venta
+            pos_name = args.get('pos_name')
+            if pos_name:
+                pos_name = f"ECommerce {pos_name}"
+
+            try:
+                max_seconds = int(request.env['ir.config_parameter'].sudo().get_param('pos_order_api.stream_max_seconds', '3600'))
+            except ValueError:
+                max_seconds = 3600
+
+            last_event_id = request.httprequest.headers.get('Last-Event-ID') or args.get('last_event_id')
+            order_stream.dispatch.ensure_started()
+            events = order_stream.stream_events(request.env.cr.dbname, pos_name, last_event_id, max(max_seconds, 1))
+            return stream_response(
+                events,
+                'text/event-stream; charset=utf-8',
+                # Sin buffer en el proxy, para que cada evento llegue de inmediato
+                extra_headers=[('X-Accel-Buffering', 'no')],
+            )
+        except Exception as e:
+            _logger.error("Error al abrir el stream de órdenes: %s", e)
+            return error_response(str(e))
 
     @http.route('/api/pos/get_product_by_name', type='http', auth='none', methods=['GET'], csrf=False)
+    @api_guard(scope='product')
     def get_product_by_name(self):
         try:
-            product_name = request.httprequest.args.get('product_name') + " D"
+            product_name = request.httprequest.args.get('product_name')
             image_size = request.httprequest.args.get('image_size', '1920')  # Tamaño por defecto
             
             if not product_name:
-                return json.dumps({"success": False, "error": "Debe proporcionar un nombre de producto"})
+                return error_response("Debe proporcionar un nombre de producto", status=400)
 
-            # No necesitamos agregar " D" aquí ya que el producto ya debería tenerlo
-            product = request.env['product.product'].sudo().search([('name', '=', product_name)], limit=1)
+            # Los productos de la API tienen el sufijo " D"
+            product = request.env['product.product'].sudo().search([
+                ('name', '=', f"{product_name} D"),
+                ('company_id', 'in', [self._get_api_company_id(), False]),
+            ], order='company_id, id', limit=1)
 
             if not product:
-                return json.dumps({"success": False, "error": "No se encontró el producto"})
+                return error_response("No se encontró el producto")
 
             # Obtener la URL de la imagen del producto con el tamaño especificado
             image_url = self._get_product_image_url(product.id, image_size)
 
-            return json.dumps({
+            return json_response({
                 "success": True, 
                 "product_id": product.id,
                 "name": product.name,
@@ -544,17 +1211,20 @@ class PosRestController(http.Controller):
                 "image_url": image_url
             })
         except Exception as e:
-            _logger.error(f"Error al buscar producto: {str(e)}")
-            return json.dumps({"success": False, "error": str(e)})
+            _logger.error("Error al buscar producto: %s", e)
+            return error_response(str(e))
 
     @http.route('/api/pos/get_or_create_product', type='http', auth='none', methods=['GET', 'POST'], csrf=False)
+    @api_guard(scope='product', inflight=True)
     def get_or_create_product_http(self):
         try:
             if request.httprequest.method == 'POST':
-                data = json.loads(request.httprequest.data.decode('utf-8'))
-                product_name = data.get('product_name')
-                price_unit = data.get('price_unit', 0.0)
-                image_size = data.get('image_size', '1920')  # Tamaño por defecto
+                data, error = read_json(PRODUCT_SCHEMA)
+                if error:
+                    return error
+                product_name = data['product_name']
+                price_unit = data['price_unit']
+                image_size = data['image_size']
             else:
                 product_name = request.httprequest.args.get('product_name')
                 price_unit = request.httprequest.args.get('price_unit', 0.0)
@@ -565,18 +1235,18 @@ class PosRestController(http.Controller):
                     price_unit = 0.0
 
             if not product_name:
-                return json.dumps({"success": False, "error": "Debe proporcionar un nombre de producto"})
+                return error_response("Debe proporcionar un nombre de producto", status=400)
 
-            product_id = self._get_or_create_product(product_name, price_unit)
+            product_id = self._get_or_create_product(product_name, price_unit, self._get_api_company_id())
             if not product_id:
-                return json.dumps({"success": False, "error": f"No se pudo crear/obtener el producto: {product_name}"})
+                return error_response(f"No se pudo crear/obtener el producto: {product_name}")
 
             product = request.env['product.product'].sudo().browse(product_id)
             
             # Obtener la URL de la imagen del producto con el tamaño especificado
             image_url = self._get_product_image_url(product.id, image_size)
             
-            return json.dumps({
+            return json_response({
                 "success": True,
                 "product_id": product.id,
                 "name": product.name,
@@ -584,10 +1254,95 @@ class PosRestController(http.Controller):
                 "image_url": image_url
             })
         except Exception as e:
-            _logger.error(f"Error en get_or_create_product_http: {str(e)}")
-            return json.dumps({"success": False, "error": str(e)})
+            _logger.error("Error en get_or_create_product_http: %s", e)
+            return error_response(str(e))
+
+    @staticmethod
+    def _image_entries(zip_file, max_bytes, skipped):
+        """
+        Entradas (nombre de producto, lector) de un zip de imágenes. Cada
+        imagen se descomprime recién cuando se lee.
+        """
+        archive = zipfile.ZipFile(zip_file)
+        entries = []
+        for info in archive.infolist():
+            basename = os.path.basename(info.filename)
+            if info.is_dir() or not basename or basename.startswith('.') or info.filename.startswith('__MACOSX/'):
+                continue
+            name = os.path.splitext(basename)[0].strip()
+            if info.file_size > max_bytes:
+                skipped.append(name)
+                continue
+            entries.append((name, functools.partial(archive.read, info)))
+        return entries
+
+    @http.route('/api/pos/products/images', type='http', auth='none', methods=['POST'], csrf=False)
+    @api_guard(scope='product', inflight=True)
+    def upload_product_images(self):
+        """
+        Carga masiva de imágenes de productos: multipart con una imagen por
+        archivo (el nombre del archivo es el nombre del producto) o un zip,
+        como parte multipart o como cuerpo application/zip. La carga se
+        guarda en disco, no en memoria, y las variantes de tamaño se generan
+        en segundo plano.
+        """
+        httprequest = request.httprequest
+        ICP = request.env['ir.config_parameter'].sudo()
+        try:
+            max_upload = int(float(ICP.get_param('pos_order_api.image_upload_max_mb', '200')) * 1024 * 1024)
+            max_image = int(float(ICP.get_param('pos_order_api.image_max_mb', '20')) * 1024 * 1024)
+        except ValueError:
+            max_upload, max_image = 200 * 1024 * 1024, 20 * 1024 * 1024
+
+        if httprequest.content_length and httprequest.content_length > max_upload:
+            return error_response(f"La carga supera el máximo de {max_upload // (1024 * 1024)} MB", status=413)
+
+        too_large = []
+        try:
+            with tempfile.TemporaryFile() as spool:
+                entries = []
+                if httprequest.mimetype in ('application/zip', 'application/x-zip-compressed'):
+                    # El cuerpo se copia a disco por bloques, sin armarlo en memoria
+                    shutil.copyfileobj(httprequest.stream, spool, 1024 * 1024)
+                    spool.seek(0)
+                    entries = self._image_entries(spool, max_image, too_large)
+                else:
+                    # werkzeug ya vuelca a disco los archivos multipart grandes
+                    for upload in httprequest.files.values():
+                        filename = os.path.basename(upload.filename or '')
+                        if not filename:
+                            continue
+                        if filename.lower().endswith('.zip'):
+                            entries.extend(self._image_entries(upload.stream, max_image, too_large))
+                            continue
+                        name = os.path.splitext(filename)[0].strip()
+                        # El tamaño de la parte se toma del archivo ya volcado, no de sus cabeceras
+                        upload.stream.seek(0, os.SEEK_END)
+                        size = upload.stream.tell()
+                        upload.stream.seek(0)
+                        if size > max_image:
+                            too_large.append(name)
+                            continue
+                        entries.append((name, upload.read))
+
+                if not entries and not too_large:
+                    return error_response("No se recibieron imágenes", status=400)
+
+                with stage('enqueue'):
+                    result = request.env['pos.order.api.image.job'].sudo().enqueue_images(
+                        entries, company_id=self._get_api_company_id(),
+                    )
+
+            set_summary_field('images_queued', result['queued'])
+            return json_response(dict(result, success=True, too_large=too_large))
+        except zipfile.BadZipFile:
+            return error_response("El archivo zip no es válido", status=400)
+        except Exception as e:
+            _logger.error("Error en la carga masiva de imágenes: %s", e)
+            return error_response(str(e))
 
     @http.route('/api/pos/debug/users', type='http', auth='none', methods=['GET'], csrf=False)
+    @api_guard(scope='admin')
     def debug_notification_users(self):
         """
         Endpoint para debugging: obtiene información sobre usuarios y grupos disponibles
@@ -622,18 +1377,28 @@ class PosRestController(http.Controller):
                 "timestamp": str(request.env['ir.fields'].datetime.now())
             }
             
-            _logger.info(f"Debug info: {len(all_users)} usuarios internos encontrados")
-            return json.dumps(response, indent=2, ensure_ascii=False)
+            _logger.debug("Debug info: %s usuarios internos encontrados", len(all_users))
+            return json_response(response)
             
         except Exception as e:
-            error_response = {
-                "success": False,
-                "error": f"Error getting debug info: {str(e)}"
-            }
-            _logger.error(f"Error in debug_notification_users: {str(e)}")
-            return json.dumps(error_response)
+            _logger.error("Error in debug_notification_users: %s", e)
+            return error_response(f"Error getting debug info: {str(e)}")
     
+    @http.route('/api/pos/debug/breakers', type='http', auth='none', methods=['GET'], csrf=False)
+    @api_guard(scope='admin')
+    def debug_notification_breakers(self):
+        """
+        Estado y métricas de los circuit breakers de notificación del worker
+        que atiende la petición
+        """
+        dbname = request.env.cr.dbname
+        return json_response({
+            "success": True,
+            "breakers": {name: breaker.snapshot(dbname) for name, breaker in notification_breakers.items()},
+        })
+
     @http.route('/api/pos/test-notification', type='http', auth='none', methods=['POST'], csrf=False)
+    @api_guard(scope='admin')
     def test_notification_to_all_users(self):
         """
         Endpoint de prueba para enviar notificación a todos los usuarios
@@ -649,22 +1414,19 @@ class PosRestController(http.Controller):
                 }
             }
             
-            notification_count = request.env['pos.order'].send_notification_to_all_pos_users(test_data)
+            targeted = request.env['pos.order'].send_notification_to_all_pos_users(test_data)
+            notification_count = targeted['recipients']
             
             response = {
-                "success": True,
+                "success": targeted['handled'],
                 "notifications_sent": notification_count,
                 "message": f"Notificación de prueba enviada a {notification_count} usuarios",
                 "timestamp": str(request.env['ir.fields'].datetime.now())
             }
             
-            _logger.info(f"Notificación de prueba enviada a {notification_count} usuarios")
-            return json.dumps(response, indent=2)
+            _logger.info("Notificación de prueba enviada a %s usuarios", notification_count)
+            return json_response(response)
             
         except Exception as e:
-            error_response = {
-                "success": False,
-                "error": f"Error sending test notification: {str(e)}"
-            }
-            _logger.error(f"Error in test_notification_to_all_users: {str(e)}")
-            return json.dumps(error_response)
\ No newline at end of file
+            _logger.error("Error in test_notification_to_all_users: %s", e)
+            return error_response(f"Error sending test notification: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,78 @@
+from ..tools import json_codec
+import hashlib
+
+
+def price_line(line):
+    """
+    Calcula los importes de una línea validada con ORDER_LINE_SCHEMA: precio
+    unitario con extras, subtotal con descuento, importe de extras, nota para
+    el cliente con los extras y los extras estructurados.
+
+    Es el mismo cálculo para crear la orden y para cotizar el carrito, y no
+    accede a la base de datos.
+    """
+    qty = line['qty']
+    base_price_unit = line['price_unit']
+    discount = line['discount']
+    # Permite ambos campos para compatibilidad
+    base_note = line['customer_note'] or line['note']
+    discount_factor = 1 - discount / 100.0
+
+    extras_price = 0.0
+    extras_list = []
+    extras = []
+    for extra in line['extras']:
+        extra_name = extra['name']
+        extra_price = extra['price']
+        if not extra_name:
+            continue
+        if extra_price > 0:
+            extras_list.append(f"+ {extra_name} (+${extra_price:.2f})")
+            extras_price += extra_price
+        else:
+            extras_list.append(f"+ {extra_name}")
+            extra_price = 0.0
+        extras.append({
+            'name': extra_name,
+            'price': extra_price,
+            'qty': qty,
+            'amount': qty * extra_price * discount_factor,
+        })
+
+    extras_text = "\nExtras: " + ", ".join(extras_list) if extras_list else ""
+
+    # Precio unitario total (precio base + extras)
+    total_price_unit = base_price_unit + extras_price
+
+    return {
+        'product_name': line['product_name'],
+        'qty': qty,
+        'base_price_unit': base_price_unit,
+        'extras_price': extras_price,
+        'price_unit': total_price_unit,
+        'discount': discount,
+        'subtotal': qty * total_price_unit * discount_factor,
+        'extras_amount': qty * extras_price * discount_factor,
+        'note': base_note + extras_text,
+        'extras': extras,
+    }
+
+
+def cart_key(lines):
+    """
+    Clave estable de un carrito validado: hash de sus líneas normalizadas
+    (nota efectiva y extras sin nombre descartados), independiente del orden
+    de las claves y del formato del JSON recibido.
+    """
+    normalized = [
+        [
+            line['product_name'],
+            line['qty'],
+            line['price_unit'],
+            line['discount'],
+            line['customer_note'] or line['note'],
+            [[extra['name'], extra['price']] for extra in line['extras'] if extra['name']],
+        ]
+        for line in lines
+    ]
+    return hashlib.sha256(json_codec.dumps(normalized)).hexdigest()
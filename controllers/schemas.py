@@ -0,0 +1,65 @@
+from ..tools.schema import Field
+
+EXTRA_SCHEMA = {
+    'name': Field(str, default=''),
+    'price': Field(float, default=0.0),
+}
+
+ORDER_LINE_SCHEMA = {
+    'product_name': Field(str, required=True),
+    'qty': Field(float, default=0.0),
+    'price_unit': Field(float, default=0.0),
+    'discount': Field(float, default=0.0),
+    'customer_note': Field(str),
+    'note': Field(str, default=''),
+    'extras': Field(list, default=[], items=EXTRA_SCHEMA),
+}
+
+CUSTOMER_SCHEMA = {
+    'external_id': Field(str),
+    'email': Field(str),
+    'phone': Field(str),
+    'name': Field(str),
+}
+
+ORDER_SCHEMA = {
+    'lines': Field(list, required=True, min_items=1, items=ORDER_LINE_SCHEMA),
+    'pos_name': Field(str),
+    'external_ref': Field(str),
+    'partner_id': Field(int),
+    'customer': Field(dict, items=CUSTOMER_SCHEMA),
+    'pricelist_id': Field(int),
+    'amount_tax': Field(float, default=0.0),
+    'amount_paid': Field(float),
+    'amount_return': Field(float),
+}
+
+QUOTE_SCHEMA = {
+    'lines': Field(list, required=True, min_items=1, items=ORDER_LINE_SCHEMA),
+    'pos_name': Field(str),
+}
+
+# Máximo de órdenes por consulta de estado
+MAX_STATUS_IDS = 5000
+
+ORDER_STATUS_SCHEMA = {
+    'ids': Field(list, default=[], items=int, max_items=MAX_STATUS_IDS),
+    'external_refs': Field(list, default=[], items=str, max_items=MAX_STATUS_IDS),
+    'updated_since': Field(str),
+    'after_id': Field(int, default=0),
+    'limit': Field(int, default=1000),
+}
+
+# Máximo de órdenes archivadas por consulta (cada una trae sus líneas y pagos)
+MAX_ARCHIVE_IDS = 500
+
+ARCHIVE_SCHEMA = {
+    'ids': Field(list, default=[], items=int, max_items=MAX_ARCHIVE_IDS),
+    'external_refs': Field(list, default=[], items=str, max_items=MAX_ARCHIVE_IDS),
+}
+
+PRODUCT_SCHEMA = {
+    'product_name': Field(str, required=True),
+    'price_unit': Field(float, default=0.0),
+    'image_size': Field(str, default='1920'),
+}
@@ -1,2 +1,16 @@
 from . import pos_order
+from . import pos_order_api_archive
+from . import pos_order_api_audit
+from . import pos_order_api_cache
+from . import pos_order_api_export
+from . import pos_order_api_image
+from . import pos_order_api_intake
+from . import pos_order_api_key
+from . import pos_order_api_rate_limit
+from . import pos_order_api_stats
+from . import pos_order_api_warmup
+from . import pos_order_line
+from . import pos_session
+from . import product
+from . import res_partner
 from . import res_users
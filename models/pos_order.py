@@ -1,45 +1,159 @@
 from odoo import models, api, fields
-import logging
+from odoo.addons.bus.models.bus_presence import DISCONNECTION_TIMER
 from datetime import datetime, timedelta
+from ..tools.api_caches import recipient_cache
+from ..tools.request_context import get_logger, get_request_context
+from ..tools import order_stream
+import logging
 
-_logger = logging.getLogger(__name__)
+_logger = get_logger(__name__)
+
+# Columnas de la tupla de estado que devuelven los endpoints de consulta
+STATUS_COLUMNS = ('id', 'api_external_ref', 'pos_reference', 'state', 'amount_total', 'amount_paid', 'write_date')
 
 class PosOrder(models.Model):
     _inherit = 'pos.order'
 
+    # Datos de las órdenes creadas por la API (vacíos para órdenes del POS)
+    api_pos_name = fields.Char(string='Punto de Venta API', index=True, readonly=True)
+    api_extras_total = fields.Float(string='Total Extras API', readonly=True)
+    api_external_ref = fields.Char(string='Referencia Externa API', index=True, readonly=True, copy=False)
+
+    def init(self):
+        """
+        Índice para la paginación por (write_date, id) de las órdenes de la API.
+        Es parcial: solo cubre las órdenes creadas por la API.
+        """
+        super().init()
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS pos_order_api_write_date_id_idx
+                ON pos_order (write_date, id)
+             WHERE api_pos_name IS NOT NULL
+        """)
+
+    @api.model
+    def _api_status_rows(self, where, params, limit=None):
+        """
+        Tuplas de estado de las órdenes que cumplen where. Con una API key
+        asociada a una compañía, solo se ven las órdenes de esa compañía.
+        """
+        self.flush_model()
+        where = f"({where})"
+        params = list(params)
+        context = get_request_context()
+        if context and context.company_id:
+            where += " AND company_id = %s"
+            params.append(context.company_id)
+        query = f"SELECT {', '.join(STATUS_COLUMNS)} FROM pos_order WHERE {where} ORDER BY write_date, id"
+        if limit:
+            query += " LIMIT %s"
+            params.append(limit)
+        self.env.cr.execute(query, params)
+        # Montos numeric como float; write_date con microsegundos porque es el cursor de la paginación
+        return [
+            (order_id, external_ref or None, pos_reference, state, float(amount_total or 0.0),
+             float(amount_paid or 0.0), write_date.isoformat(sep=' '))
+            for order_id, external_ref, pos_reference, state, amount_total, amount_paid, write_date
+            in self.env.cr.fetchall()
+        ]
+
+    @api.model
+    def _api_order_states(self, ids=None, external_refs=None):
+        """
+        Estado de un conjunto de órdenes de la API, por id o por referencia
+        externa, en una sola consulta sobre columnas indexadas. Las órdenes
+        del POS no se exponen aunque se pida su id.
+
+        Returns:
+            list: tuplas con las columnas de STATUS_COLUMNS
+        """
+        if not ids and not external_refs:
+            return []
+        return self._api_status_rows(
+            "api_pos_name IS NOT NULL AND (id = ANY(%s) OR api_external_ref = ANY(%s))",
+            [list(ids or []), list(external_refs or [])],
+        )
+
+    @api.model
+    def _api_order_changes(self, updated_since, after_id=0, limit=1000):
+        """
+        Órdenes de la API modificadas después del cursor (write_date, id),
+        en orden ascendente. La comparación por fila usa el índice
+        pos_order_api_write_date_id_idx, así que el costo no crece con el
+        número de páginas ya leídas.
+
+        Returns:
+            tuple: (tuplas de estado, cursor de la página siguiente o None)
+        """
+        rows = self._api_status_rows(
+            "api_pos_name IS NOT NULL AND (write_date, id) > (%s, %s)",
+            [updated_since, after_id or 0],
+            limit=limit,
+        )
+        next_cursor = None
+        if len(rows) == limit:
+            next_cursor = {'updated_since': rows[-1][-1], 'after_id': rows[-1][0]}
+        return rows, next_cursor
+
+    def _api_publish_order_event(self, pos_reference, line_count):
+        """
+        Publica la orden en el stream SSE de su punto de venta. El aviso sale
+        al confirmar la transacción; un error aquí no afecta a la orden.
+        """
+        self.ensure_one()
+        try:
+            order_stream.publish(self.env.cr, self.env.cr.dbname, {
+                'id': self.id,
+                'ref': pos_reference,
+                'ext': self.api_external_ref or None,
+                'pos': self.api_pos_name,
+                'total': self.amount_total,
+                'lines': line_count,
+                'ts': fields.Datetime.to_string(self.date_order),
+            })
+        except Exception as e:
+            _logger.error("Error al publicar la orden %s en el stream: %s", self.id, e)
+
     @api.model
     def send_ecommerce_notification(self, order_data):
         """
         Envía una actividad/notificación visible en el panel de actividades
-        cuando se crea una orden desde el ecommerce
+        cuando se crea una orden desde el ecommerce.
+
+        Cada usuario se notifica en su propio savepoint: si su actividad falla
+        recibe un aviso del bus. Si no se pudo notificar a nadie, la excepción
+        se propaga para que el circuit breaker la cuente como fallo.
         """
-        try:
-            # Trabajar con sudo para tener permisos completos
-            self = self.sudo()
-            
-            # Obtener información de la orden
-            order_id = order_data.get('order_id')
-            pos_reference = order_data.get('pos_reference')
-            partner_id = order_data.get('partner_id')
-            amount_total = order_data.get('calculated_totals', {}).get('amount_total', 0.0)
-            pos_name = order_data.get('pos_name', 'ECommerce')
-            
-            # Obtener el nombre del cliente
-            partner = self.env['res.partner'].browse(partner_id)
-            partner_name = partner.name if partner.exists() else 'Cliente Desconocido'
-            
-            # Obtener usuarios que deben recibir la notificación
-            users_to_notify = self._get_users_to_notify()
-            
-            if not users_to_notify:
-                _logger.warning("No se encontraron usuarios para notificar")
-                return
-            
-            # Crear actividad directa en el sistema usando el modelo res.users
-            for user in users_to_notify:
-                try:
+        # Trabajar con sudo para tener permisos completos
+        self = self.sudo()
+        
+        # Obtener información de la orden
+        order_id = order_data.get('order_id')
+        pos_reference = order_data.get('pos_reference')
+        partner_id = order_data.get('partner_id')
+        amount_total = order_data.get('calculated_totals', {}).get('amount_total', 0.0)
+        pos_name = order_data.get('pos_name', 'ECommerce')
+        
+        # Obtener el nombre del cliente
+        partner = self.env['res.partner'].browse(partner_id)
+        partner_name = partner.name if partner.exists() else 'Cliente Desconocido'
+        
+        # Obtener usuarios que deben recibir la notificación
+        users_to_notify = self._get_users_to_notify()
+        
+        if not users_to_notify:
+            _logger.warning("No se encontraron usuarios para notificar")
+            return
+        
+        res_model_id = self.env['ir.model']._get('res.users').id
+        delivered = 0
+        last_error = None
+        # Crear actividad directa en el sistema usando el modelo res.users
+        for user in users_to_notify:
+            try:
+                with self.env.cr.savepoint():
                     # Crear actividad en el modelo res.users para que aparezca en actividades
-                    activity_vals = {
+                    activity = self.env['mail.activity'].create({
                         'activity_type_id': 1,  # Usar el primer tipo disponible (Todo)
                         'summary': f'🛒 Nueva Orden Ecommerce: {pos_reference}',
                         'note': f'''Nueva orden recibida:
@@ -48,60 +162,65 @@ class PosOrder(models.Model):
 • Total: ${amount_total:.2f}
 • Tienda: {pos_name}
 • ID: {order_id}''',
-                        'res_model_id': self.env['ir.model']._get('res.users').id,
+                        'res_model_id': res_model_id,
                         'res_id': user.id,
                         'user_id': user.id,
                         'date_deadline': fields.Date.today(),
-                    }
-                    
-                    activity = self.env['mail.activity'].create(activity_vals)
-                    _logger.info(f"Actividad creada para usuario {user.name}: {activity.id}")
-                    
-                except Exception as activity_error:
-                    _logger.error(f"Error al crear actividad: {str(activity_error)}")
-                    
-                    # Fallback: Crear notificación directa con bus
-                    try:
-                        self.env['bus.bus']._sendone(
-                            user.partner_id,
-                            'simple_notification',
-                            {
-                                'type': 'success',
-                                'title': '🛒 Nueva Orden Ecommerce',
-                                'message': f'Orden {pos_reference} - Cliente: {partner_name} - Total: ${amount_total:.2f}',
-                                'sticky': True
-                            }
-                        )
-                        _logger.info(f"Notificación bus enviada a {user.name}")
-                    except Exception as bus_error:
-                        _logger.error(f"Error en notificación bus: {str(bus_error)}")
-            
-            # Crear mensaje en la orden también
+                    })
+                delivered += 1
+                _logger.debug("Actividad creada para usuario %s: %s", user.name, activity.id)
+                continue
+            except Exception as activity_error:
+                _logger.error("Error al crear actividad: %s", activity_error)
+                last_error = activity_error
+            
+            # Fallback: Crear notificación directa con bus
             try:
-                order_record = self.browse(order_id)
-                if order_record.exists():
-                    order_record.message_post(
-                        body=f'''
-                        <div style="background: #e8f5e8; padding: 10px; border-left: 3px solid #28a745;">
-                            <h4>🛒 Orden Ecommerce Procesada</h4>
-                            <p><strong>Ref:</strong> {pos_reference} | <strong>Cliente:</strong> {partner_name} | <strong>Total:</strong> ${amount_total:.2f}</p>
-                            <p>📢 {len(users_to_notify)} usuario(s) notificado(s)</p>
-                        </div>
-                        ''',
-                        subject=f"Orden Ecommerce: {pos_reference}",
-                        message_type='comment'
+                with self.env.cr.savepoint():
+                    self.env['bus.bus']._sendone(
+                        user.partner_id,
+                        'simple_notification',
+                        {
+                            'type': 'success',
+                            'title': '🛒 Nueva Orden Ecommerce',
+                            'message': f'Orden {pos_reference} - Cliente: {partner_name} - Total: ${amount_total:.2f}',
+                            'sticky': True
+                        }
                     )
-                    _logger.info(f"Mensaje agregado al chatter de la orden {order_id}")
-            except Exception as chatter_error:
-                _logger.error(f"Error al agregar mensaje al chatter: {str(chatter_error)}")
-            
-            _logger.info(f"Sistema de notificaciones completado para orden {pos_reference}")
-            
-        except Exception as e:
-            _logger.error(f"Error en sistema de notificación de ecommerce: {str(e)}")
+                delivered += 1
+                _logger.debug("Notificación bus enviada a %s", user.name)
+            except Exception as bus_error:
+                _logger.error("Error en notificación bus: %s", bus_error)
+                last_error = bus_error
+        
+        if not delivered:
+            raise last_error
+        
+        # Resumen en el chatter de la orden (opcional; la auditoría ya registra la orden)
+        try:
+            with self.env.cr.savepoint():
+                self._post_chatter_summary(order_id, pos_reference, partner_name, amount_total, len(users_to_notify))
+        except Exception as chatter_error:
+            _logger.error("Error al agregar mensaje al chatter: %s", chatter_error)
+        
+        _logger.debug("Sistema de notificaciones completado para orden %s", pos_reference)
     
     @api.model
     def _get_users_to_notify(self):
+        """
+        Devuelve los usuarios a notificar desde la caché del worker,
+        resolviéndolos solo cuando la caché expira
+        """
+        cache_key = ('notify_users',)
+        user_ids = recipient_cache.get(self.env, cache_key, None)
+        if user_ids is None:
+            user_ids = [user.id for user in self._compute_users_to_notify()]
+            if user_ids:
+                recipient_cache.set(self.env, cache_key, user_ids)
+        return list(self.env['res.users'].browse(user_ids))
+
+    @api.model
+    def _compute_users_to_notify(self):
         """
         Obtiene la lista de usuarios que deben recibir notificaciones
         Prioriza usuarios de Point of Sale y ventas
@@ -116,9 +235,9 @@ class PosOrder(models.Model):
                     pos_manager_users = pos_manager_group.users
                     if pos_manager_users:
                         users_to_notify.extend(pos_manager_users)
-                        _logger.info(f"Encontrados {len(pos_manager_users)} usuarios del grupo POS Manager")
+                        _logger.debug("Encontrados %s usuarios del grupo POS Manager", len(pos_manager_users))
             except Exception as e:
-                _logger.warning(f"No se pudo encontrar grupo POS Manager: {str(e)}")
+                _logger.warning("No se pudo encontrar grupo POS Manager: %s", e)
             
             # Opción 2: Buscar usuarios del grupo Point of Sale User
             try:
@@ -127,9 +246,9 @@ class PosOrder(models.Model):
                     pos_user_users = pos_user_group.users
                     if pos_user_users:
                         users_to_notify.extend(pos_user_users)
-                        _logger.info(f"Encontrados {len(pos_user_users)} usuarios del grupo POS User")
+                        _logger.debug("Encontrados %s usuarios del grupo POS User", len(pos_user_users))
             except Exception as e:
-                _logger.warning(f"No se pudo encontrar grupo POS User: {str(e)}")
+                _logger.warning("No se pudo encontrar grupo POS User: %s", e)
             
             # Opción 3: Buscar usuarios del grupo de ventas
             try:
@@ -138,9 +257,9 @@ class PosOrder(models.Model):
                     sales_users = sales_group.users
                     if sales_users:
                         users_to_notify.extend(sales_users)
-                        _logger.info(f"Encontrados {len(sales_users)} usuarios del grupo de ventas")
+                        _logger.debug("Encontrados %s usuarios del grupo de ventas", len(sales_users))
             except Exception as e:
-                _logger.warning(f"No se pudo encontrar grupo de ventas: {str(e)}")
+                _logger.warning("No se pudo encontrar grupo de ventas: %s", e)
             
             # Opción 4: Buscar usuarios que tengan acceso a cualquier punto de venta
             try:
@@ -152,9 +271,9 @@ class PosOrder(models.Model):
                 pos_session_users = pos_sessions.mapped('user_id')
                 if pos_session_users:
                     users_to_notify.extend(pos_session_users)
-                    _logger.info(f"Encontrados {len(pos_session_users)} usuarios con sesiones de POS")
+                    _logger.debug("Encontrados %s usuarios con sesiones de POS", len(pos_session_users))
             except Exception as e:
-                _logger.warning(f"No se pudo encontrar usuarios de sesiones POS: {str(e)}")
+                _logger.warning("No se pudo encontrar usuarios de sesiones POS: %s", e)
             
             # Opción 5: Si no hay usuarios específicos de POS, buscar administradores
             if not users_to_notify:
@@ -164,9 +283,9 @@ class PosOrder(models.Model):
                         admin_users = admin_group.users
                         if admin_users:
                             users_to_notify.extend(admin_users)
-                            _logger.info(f"Encontrados {len(admin_users)} usuarios administradores")
+                            _logger.debug("Encontrados %s usuarios administradores", len(admin_users))
                 except Exception as e:
-                    _logger.warning(f"No se pudo encontrar grupo de administradores: {str(e)}")
+                    _logger.warning("No se pudo encontrar grupo de administradores: %s", e)
             
             # Opción 6: Como último recurso, el usuario administrador principal
             if not users_to_notify:
@@ -174,9 +293,9 @@ class PosOrder(models.Model):
                     admin_user = self.env.ref('base.user_admin', raise_if_not_found=False)
                     if admin_user:
                         users_to_notify.append(admin_user)
-                        _logger.info("Usando usuario administrador principal")
+                        _logger.debug("Usando usuario administrador principal")
                 except Exception as e:
-                    _logger.warning(f"No se pudo encontrar usuario administrador: {str(e)}")
+                    _logger.warning("No se pudo encontrar usuario administrador: %s", e)
             
             # Opción 7: Buscar cualquier usuario activo (último recurso)
             if not users_to_notify:
@@ -186,7 +305,7 @@ class PosOrder(models.Model):
                 ], limit=10)
                 if active_users:
                     users_to_notify.extend(active_users)
-                    _logger.info(f"Usando {len(active_users)} usuarios activos como último recurso")
+                    _logger.info("Usando %s usuarios activos como último recurso", len(active_users))
             
             # Filtrar usuarios válidos (activos y no compartidos)
             valid_users = []
@@ -202,16 +321,17 @@ class PosOrder(models.Model):
                     seen.add(user.id)
                     unique_users.append(user)
             
-            _logger.info(f"Total usuarios únicos para notificar: {len(unique_users)}")
+            _logger.debug("Total usuarios únicos para notificar: %s", len(unique_users))
             
-            # Log de usuarios específicos para debugging
-            for user in unique_users:
-                _logger.info(f"Usuario a notificar: {user.name} (ID: {user.id}) - Email: {user.email}")
+            # Detalle por usuario solo con el nivel DEBUG activo
+            if _logger.isEnabledFor(logging.DEBUG):
+                for user in unique_users:
+                    _logger.debug("Usuario a notificar: %s (ID: %s) - Email: %s", user.name, user.id, user.email)
             
             return unique_users
             
         except Exception as e:
-            _logger.error(f"Error al obtener usuarios para notificar: {str(e)}")
+            _logger.error("Error al obtener usuarios para notificar: %s", e)
             return []
     
     @api.model
@@ -233,56 +353,56 @@ class PosOrder(models.Model):
             except:
                 partner_name = f'Cliente ID: {partner_id}'
             
-            # Crear mensaje simple
-            notification_message = (
-                f"🛒 NUEVA ORDEN ECOMMERCE - "
-                f"Ref: {pos_reference} | "
-                f"Cliente: {partner_name} | "
-                f"Total: ${amount_total:.2f} | "
-                f"Tienda: {pos_name} | "
-                f"ID: {order_id}"
+            # Un solo registro, formateado solo si el nivel INFO está activo
+            _logger.info(
+                "🛒 NUEVA ORDEN ECOMMERCE - Ref: %s | Cliente: %s | Total: $%.2f | Tienda: %s | ID: %s",
+                pos_reference, partner_name, amount_total, pos_name, order_id,
             )
             
-            _logger.info(notification_message)
-            _logger.info("=" * 80)
-            
         except Exception as e:
-            _logger.error(f"Error en notificación simple: {str(e)}")
+            _logger.error("Error en notificación simple: %s", e)
     
     @api.model
     def send_message_notification(self, order_data):
         """
-        Método alternativo usando mail.message directamente
+        Método alternativo usando mail.message directamente. Los errores se
+        propagan al circuit breaker.
         """
-        try:
-            order_id = order_data.get('order_id')
-            pos_reference = order_data.get('pos_reference', 'N/A')
-            partner_id = order_data.get('partner_id')
-            amount_total = order_data.get('calculated_totals', {}).get('amount_total', 0.0)
-            
-            # Crear un mensaje en la orden directamente
-            message_body = f"""
-            <div style="background: #f0f8ff; padding: 15px; border-left: 4px solid #007bff; margin: 10px 0;">
-                <h3 style="color: #007bff; margin: 0 0 10px 0;">🛒 Nueva Orden Ecommerce</h3>
-                <p><strong>📋 Referencia:</strong> {pos_reference}</p>
-                <p><strong>💰 Total:</strong> ${amount_total:.2f}</p>
-                <p><strong>🆔 ID Orden:</strong> {order_id}</p>
-                <p style="color: #28a745;"><strong>✅ Orden procesada exitosamente</strong></p>
-            </div>
-            """
-            
-            # Crear mensaje en la orden
-            if order_id:
-                order_record = self.sudo().browse(order_id)
-                if order_record.exists():
-                    order_record.message_post(
-                        body=message_body,
-                        subject=f"Nueva Orden Ecommerce: {pos_reference}"
-                    )
-                    _logger.info(f"Mensaje creado en la orden {order_id}")
-            
-        except Exception as e:
-            _logger.error(f"Error en notificación por mensaje: {str(e)}")
+        order_id = order_data.get('order_id')
+        pos_reference = order_data.get('pos_reference', 'N/A')
+        partner_id = order_data.get('partner_id')
+        amount_total = order_data.get('calculated_totals', {}).get('amount_total', 0.0)
+        
+        partner = self.env['res.partner'].sudo().browse(partner_id)
+        partner_name = partner.name if partner_id and partner.exists() else 'Cliente Desconocido'
+        
+        # Crear un resumen en la orden (solo si el chatter está habilitado)
+        self._post_chatter_summary(order_id, pos_reference, partner_name, amount_total, 0)
+
+    @api.model
+    def _post_chatter_summary(self, order_id, pos_reference, partner_name, amount_total, notified_count):
+        """
+        Publica un resumen compacto en el chatter de la orden si
+        pos_order_api.chatter_summary está activo. Por defecto no se publica
+        nada: la orden queda registrada en pos.order.api.audit.
+        """
+        enabled = self.env['ir.config_parameter'].sudo().get_param('pos_order_api.chatter_summary', 'False')
+        if enabled.lower() != 'true' or not order_id:
+            return False
+
+        order_record = self.sudo().browse(order_id)
+        if not order_record.exists():
+            return False
+
+        # Nota interna en texto plano, sin agregar seguidores ni disparar correos
+        order_record.with_context(mail_create_nosubscribe=True, mail_post_autofollow=False).message_post(
+            body=f"Orden Ecommerce {pos_reference} · Cliente: {partner_name} · "
+                 f"Total: ${amount_total:.2f} · {notified_count} usuario(s) notificado(s)",
+            message_type='comment',
+            subtype_xmlid='mail.mt_note',
+        )
+        _logger.debug("Resumen agregado al chatter de la orden %s", order_id)
+        return True
 
     @api.model
     def get_notification_groups_info(self):
@@ -315,97 +435,181 @@ class PosOrder(models.Model):
                             'active_users': len(active_users),
                             'user_names': [u.name for u in active_users]
                         })
-                        _logger.info(f"Grupo {group_name}: {len(active_users)} usuarios activos")
+                        _logger.debug("Grupo %s: %s usuarios activos", group_name, len(active_users))
                     else:
                         group_info.append({
                             'name': group_name,
                             'xml_id': group_ref,
                             'error': 'Grupo no encontrado'
                         })
-                        _logger.warning(f"Grupo {group_name} no encontrado")
+                        _logger.warning("Grupo %s no encontrado", group_name)
                 except Exception as e:
                     group_info.append({
                         'name': group_name,
                         'xml_id': group_ref,
                         'error': str(e)
                     })
-                    _logger.error(f"Error verificando grupo {group_name}: {str(e)}")
+                    _logger.error("Error verificando grupo %s: %s", group_name, e)
             
             return group_info
             
         except Exception as e:
-            _logger.error(f"Error obteniendo información de grupos: {str(e)}")
+            _logger.error("Error obteniendo información de grupos: %s", e)
             return []
 
     @api.model 
     def send_notification_to_all_pos_users(self, order_data):
         """
-        Método alternativo que envía notificaciones a TODOS los usuarios con acceso a POS
-        usando una estrategia más agresiva para encontrar usuarios
+        Notifica una orden nueva al personal que puede atenderla:
+
+        - Aviso en tiempo real (bus) a los usuarios conectados en este momento.
+        - Actividad persistente al personal de turno (ver _get_notification_recipients).
+
+        Las escrituras por orden crecen con el personal en turno, no con el
+        total de usuarios internos.
+
+        Que nadie esté conectado ni de turno es un resultado válido: la orden
+        queda atendida por esta estrategia aunque no haya destinatarios.
+
+        Los errores se propagan para que el circuit breaker los cuente como
+        fallos; quien llama la ejecuta en un savepoint.
+
+        Returns:
+            dict: handled (siempre True: la orden quedó atendida) y recipients
+            (usuarios notificados, por bus o con actividad)
         """
-        try:
-            order_id = order_data.get('order_id')
-            pos_reference = order_data.get('pos_reference', 'N/A')
-            partner_id = order_data.get('partner_id')
-            amount_total = order_data.get('calculated_totals', {}).get('amount_total', 0.0)
-            pos_name = order_data.get('pos_name', 'ECommerce')
-            
-            # Obtener el nombre del cliente
-            partner = self.env['res.partner'].browse(partner_id)
-            partner_name = partner.name if partner.exists() else 'Cliente Desconocido'
-            
-            # Estrategia 1: Buscar TODOS los usuarios internos activos
-            all_internal_users = self.env['res.users'].search([
-                ('active', '=', True),
-                ('share', '=', False),  # Solo usuarios internos (no portal)
+        order_id = order_data.get('order_id')
+        pos_reference = order_data.get('pos_reference', 'N/A')
+        partner_id = order_data.get('partner_id')
+        amount_total = order_data.get('calculated_totals', {}).get('amount_total', 0.0)
+        pos_name = order_data.get('pos_name', 'ECommerce')
+        
+        # Obtener el nombre del cliente
+        partner = self.env['res.partner'].browse(partner_id)
+        partner_name = partner.name if partner.exists() else 'Cliente Desconocido'
+        
+        recipients = self._get_notification_recipients(order_id)
+        online = [row for row in recipients if row['online']]
+        on_duty = [row for row in recipients if row['on_duty']]
+        
+        # Un solo envío al bus para todos los usuarios conectados
+        if online:
+            message = {
+                'type': 'success',
+                'title': '🛒 Nueva Orden Ecommerce',
+                'message': f'Orden {pos_reference} - Cliente: {partner_name} - Total: ${amount_total:.2f}',
+                'sticky': True
+            }
+            partners = self.env['res.partner'].browse([row['partner_id'] for row in online])
+            self.env['bus.bus']._sendmany([
+                (partner, 'simple_notification', message) for partner in partners
             ])
-            
-            notification_count = 0
-            
-            for user in all_internal_users:
-                try:
-                    # Enviar notificación bus a cada usuario
-                    self.env['bus.bus']._sendone(
-                        user.partner_id,
-                        'simple_notification',
-                        {
-                            'type': 'success',
-                            'title': '🛒 Nueva Orden Ecommerce',
-                            'message': f'Orden {pos_reference} - Cliente: {partner_name} - Total: ${amount_total:.2f}',
-                            'sticky': True
-                        }
-                    )
-                    
-                    # También crear actividad para cada usuario
-                    activity_vals = {
-                        'activity_type_id': 1,  # Todo
-                        'summary': f'🛒 Nueva Orden Ecommerce: {pos_reference}',
-                        'note': f'''
-                        <p><strong>Nueva orden recibida desde ecommerce</strong></p>
-                        <ul>
-                            <li><strong>Referencia:</strong> {pos_reference}</li>
-                            <li><strong>Cliente:</strong> {partner_name}</li>
-                            <li><strong>Total:</strong> ${amount_total:.2f}</li>
-                            <li><strong>Tienda:</strong> {pos_name}</li>
-                            <li><strong>ID:</strong> {order_id}</li>
-                        </ul>
-                        ''',
-                        'res_model_id': self.env['ir.model']._get('res.users').id,
-                        'res_id': user.id,
-                        'user_id': user.id,
-                        'date_deadline': fields.Date.today(),
-                    }
-                    
-                    self.env['mail.activity'].create(activity_vals)
-                    notification_count += 1
-                    _logger.info(f"Notificación enviada a usuario: {user.name} ({user.email})")
-                    
-                except Exception as user_error:
-                    _logger.warning(f"Error enviando notificación a {user.name}: {str(user_error)}")
-            
-            _logger.info(f"Notificaciones enviadas a {notification_count} usuarios internos")
-            return notification_count
-            
-        except Exception as e:
-            _logger.error(f"Error en notificación masiva a usuarios POS: {str(e)}")
-            return 0
+        
+        # Actividades en un solo create, solo para el personal de turno
+        if on_duty:
+            res_model_id = self.env['ir.model']._get('res.users').id
+            note = f'''
+            <p><strong>Nueva orden recibida desde ecommerce</strong></p>
+            <ul>
+                <li><strong>Referencia:</strong> {pos_reference}</li>
+                <li><strong>Cliente:</strong> {partner_name}</li>
+                <li><strong>Total:</strong> ${amount_total:.2f}</li>
+                <li><strong>Tienda:</strong> {pos_name}</li>
+                <li><strong>ID:</strong> {order_id}</li>
+            </ul>
+            '''
+            self.env['mail.activity'].sudo().create([{
+                'activity_type_id': 1,  # Todo
+                'summary': f'🛒 Nueva Orden Ecommerce: {pos_reference}',
+                'note': note,
+                'res_model_id': res_model_id,
+                'res_id': row['id'],
+                'user_id': row['id'],
+                'date_deadline': fields.Date.today(),
+            } for row in on_duty])
+        
+        _logger.debug(
+            "Orden %s notificada: %s usuarios conectados, %s actividades de turno",
+            pos_reference, len(online), len(on_duty)
+        )
+        return {'handled': True, 'recipients': len(recipients)}
+
+    @api.model
+    def _get_notification_recipients(self, order_id):
+        """
+        Destinatarios de la notificación de una orden, resueltos en una sola
+        consulta. Solo usuarios internos activos con acceso a la compañía de
+        la orden:
+
+        - online: conectados según bus.presence (mismo umbral que im_status de Odoo).
+        - on_duty: con una sesión POS abierta (no gestionada por la API) en un
+          punto de venta de la compañía, o miembros de los grupos de
+          pos_order_api.notify_activity_groups que iniciaron sesión en los
+          últimos pos_order_api.notify_login_days días (res.users.login_date).
+
+        Returns:
+            list: dicts con id, partner_id, online y on_duty
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        try:
+            login_days = int(ICP.get_param('pos_order_api.notify_login_days', '30'))
+        except ValueError:
+            login_days = 30
+        group_ids = []
+        for xmlid in ICP.get_param('pos_order_api.notify_activity_groups', '').split(','):
+            group = self.env.ref(xmlid.strip(), raise_if_not_found=False) if xmlid.strip() else None
+            if group and group._name == 'res.groups':
+                group_ids.append(group.id)
+
+        # login_date de res.users no se almacena: es la última fila de res_users_log
+        self.env.cr.execute("""
+            WITH target AS (
+                SELECT c.company_id
+                  FROM pos_order o
+                  JOIN pos_session s ON s.id = o.session_id
+                  JOIN pos_config c ON c.id = s.config_id
+                 WHERE o.id = %(order_id)s
+            ), candidates AS (
+                SELECT u.id, u.partner_id,
+                       COALESCE(p.last_poll > (now() AT TIME ZONE 'UTC') - make_interval(secs => %(online_seconds)s), false) AS online,
+                       (
+                           EXISTS (
+                               SELECT 1
+                                 FROM pos_session s
+                                 JOIN pos_config c ON c.id = s.config_id
+                                WHERE s.user_id = u.id
+                                  AND s.state IN ('opened', 'closing_control')
+                                  AND s.api_managed IS NOT TRUE
+                                  AND c.company_id IN (SELECT company_id FROM target)
+                           )
+                           OR (
+                               u.id IN (SELECT uid FROM res_groups_users_rel WHERE gid = ANY(%(group_ids)s))
+                               AND EXISTS (
+                                   SELECT 1 FROM res_users_log l
+                                    WHERE l.create_uid = u.id
+                                      AND l.create_date > (now() AT TIME ZONE 'UTC') - make_interval(days => %(login_days)s)
+                               )
+                           )
+                       ) AS on_duty
+                  FROM res_users u
+                  LEFT JOIN bus_presence p ON p.user_id = u.id
+                 WHERE u.active AND NOT u.share
+                   AND (
+                       NOT EXISTS (SELECT 1 FROM target)
+                       OR EXISTS (
+                           SELECT 1 FROM res_company_users_rel cu
+                            WHERE cu.user_id = u.id AND cu.cid IN (SELECT company_id FROM target)
+                       )
+                   )
+            )
+            SELECT id, partner_id, online, on_duty
+              FROM candidates
+             WHERE online OR on_duty
+             ORDER BY id
+        """, {
+            'order_id': order_id or 0,
+            'online_seconds': DISCONNECTION_TIMER,
+            'group_ids': group_ids,
+            'login_days': login_days,
+        })
+        return self.env.cr.dictfetchall()
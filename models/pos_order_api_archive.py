@@ -0,0 +1,291 @@
+from odoo import models, api, fields
+from psycopg2.extras import execute_values
+from .pos_order_api_export import EXPORT_QUERY, LINE_COLUMNS, ORDER_COLUMNS, _plain
+from .pos_session import MODULE_NAME
+from ..tools import json_codec
+from ..tools.request_context import get_logger, get_request_context
+import time
+import zlib
+
+_logger = get_logger(__name__)
+
+ARCHIVE_TABLE = 'pos_order_api_archive'
+
+# Órdenes archivables: creadas por la API, de sesiones cerradas antes del
+# corte y sin factura (las facturadas siguen enlazadas a su asiento)
+CANDIDATES_QUERY = """
+    SELECT o.id
+      FROM pos_order o
+      JOIN pos_session s ON s.id = o.session_id
+     WHERE o.api_pos_name IS NOT NULL
+       AND s.state = 'closed'
+       AND COALESCE(s.stop_at, s.start_at) < %(cutoff)s
+       AND o.date_order < %(cutoff)s
+       AND o.account_move IS NULL
+       AND o.id != ALL(%(skip)s)
+  ORDER BY o.id
+     LIMIT %(limit)s
+       FOR UPDATE OF o SKIP LOCKED
+"""
+
+
+class PosOrderApiArchive(models.AbstractModel):
+    """
+    Archivo de órdenes de la API. Las órdenes se borran de pos_order con SQL
+    directo: se salta a propósito la protección de pos.order.unlink, que solo
+    permite borrar órdenes en borrador o canceladas. Solo se archivan órdenes
+    de sesiones cerradas y sin factura, cuyo asiento ya está contabilizado.
+    """
+    _name = 'pos.order.api.archive'
+    _description = 'Archivo de órdenes antiguas de la API POS'
+
+    def init(self):
+        """
+        Tabla compacta de órdenes archivadas: las columnas de búsqueda y el
+        documento completo (orden, líneas, extras y pagos) en JSON comprimido.
+        """
+        self.env.cr.execute(f"""
+            CREATE TABLE IF NOT EXISTS {ARCHIVE_TABLE} (
+                order_id integer PRIMARY KEY,
+                external_ref varchar,
+                pos_reference varchar,
+                pos_name varchar,
+                company_id integer,
+                date_order timestamp,
+                amount_total numeric,
+                archived_at timestamp NOT NULL DEFAULT (now() at time zone 'UTC'),
+                data bytea NOT NULL
+            )
+        """)
+        self.env.cr.execute(f"""
+            CREATE INDEX IF NOT EXISTS {ARCHIVE_TABLE}_external_ref_idx
+                ON {ARCHIVE_TABLE} (external_ref)
+             WHERE external_ref IS NOT NULL
+        """)
+
+    @api.model
+    def cron_archive_orders(self):
+        """
+        Mueve al archivo, por bloques y con un commit por bloque, las órdenes
+        de la API de sesiones cerradas hace más de
+        pos_order_api.archive_after_days días. Con 0 el archivado está desactivado.
+        El plazo nunca es menor que la ventana de reconciliación de estadísticas.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        try:
+            after_days = int(ICP.get_param('pos_order_api.archive_after_days', '0'))
+            batch_size = max(int(ICP.get_param('pos_order_api.archive_batch_size', '500')), 1)
+            time_budget = float(ICP.get_param('pos_order_api.archive_time_budget', '300'))
+            reconcile_days = int(ICP.get_param('pos_order_api.stats_reconcile_days', '2'))
+        except ValueError:
+            _logger.warning("Parámetros de archivado de la API POS inválidos; no se archiva")
+            return
+        if after_days <= 0:
+            return
+
+        # La reconciliación de estadísticas recalcula desde pos_order los días
+        # desde el inicio del día de hace stats_reconcile_days: una orden
+        # archivada dentro de esa ventana desaparecería de los resúmenes
+        min_days = max(reconcile_days, 0) + 1
+        if after_days < min_days:
+            _logger.warning(
+                "archive_after_days = %s no supera la ventana de reconciliación de estadísticas "
+                "(stats_reconcile_days = %s); se archiva con %s días",
+                after_days, reconcile_days, min_days,
+            )
+            after_days = min_days
+
+        cutoff = fields.Datetime.subtract(fields.Datetime.now(), days=after_days)
+        deadline = time.monotonic() + time_budget
+        archived = 0
+        skip = []
+
+        while True:
+            self.env.flush_all()
+            self.env.cr.execute(CANDIDATES_QUERY, {'cutoff': cutoff, 'skip': skip, 'limit': batch_size})
+            order_ids = [row[0] for row in self.env.cr.fetchall()]
+            if not order_ids:
+                break
+
+            try:
+                with self.env.cr.savepoint():
+                    archived += self._archive_batch(order_ids)
+            except Exception as e:
+                # Alguna orden del bloque no se puede borrar: se archivan de a una
+                _logger.warning("Bloque de archivado revertido (%s); se reintenta orden por orden", e)
+                for order_id in order_ids:
+                    try:
+                        with self.env.cr.savepoint():
+                            archived += self._archive_batch([order_id])
+                    except Exception as order_error:
+                        skip.append(order_id)
+                        _logger.error("La orden %s no se pudo archivar: %s", order_id, order_error)
+            self.env.invalidate_all()
+            self.env.cr.commit()
+
+            if time.monotonic() > deadline:
+                cron = self.env.ref(f'{MODULE_NAME}.cron_archive_api_orders', raise_if_not_found=False)
+                if cron:
+                    cron._trigger()
+                    self.env.cr.commit()
+                break
+
+        if archived:
+            _logger.info("Archivo de la API POS: %s órdenes archivadas (anteriores a %s)", archived, cutoff)
+
+    @api.model
+    def _archive_batch(self, order_ids):
+        """
+        Copia las órdenes al archivo y borra las filas de pos_order sin pasar
+        por unlink. Las líneas, los pagos y los extras se borran en cascada; el
+        chatter y los seguidores de las órdenes, explícitamente. La auditoría
+        se conserva con order_id vacío: sus entradas ya van en el documento.
+
+        Returns:
+            int: órdenes archivadas
+        """
+        cr = self.env.cr
+        documents = self._build_documents(order_ids)
+
+        execute_values(
+            cr._obj,
+            f"""
+                INSERT INTO {ARCHIVE_TABLE}
+                    (order_id, external_ref, pos_reference, pos_name, company_id, date_order, amount_total, data)
+                VALUES %s
+                ON CONFLICT (order_id) DO NOTHING
+            """,
+            [
+                (
+                    order_id, order['external_ref'], order['pos_reference'], order['pos_name'],
+                    order['company_id'], order['date_order'], order['amount_total'],
+                    zlib.compress(json_codec.dumps(document), 6),
+                )
+                for order_id, document in documents.items()
+                for order in [document['order']]
+            ],
+        )
+
+        ids = list(documents)
+        cr.execute("DELETE FROM mail_followers WHERE res_model = 'pos.order' AND res_id = ANY(%s)", (ids,))
+        cr.execute("DELETE FROM mail_activity WHERE res_model = 'pos.order' AND res_id = ANY(%s)", (ids,))
+        cr.execute("DELETE FROM mail_message WHERE model = 'pos.order' AND res_id = ANY(%s)", (ids,))
+        cr.execute("DELETE FROM pos_order WHERE id = ANY(%s)", (ids,))
+        return cr.rowcount
+
+    @api.model
+    def _build_documents(self, order_ids):
+        """
+        Documento de archivo de cada orden, con las mismas columnas que la
+        exportación más los extras de cada línea, los pagos y las entradas de
+        auditoría.
+
+        Returns:
+            dict: order_id -> {'order': {...}, 'lines': [...], 'payments': [...], 'audit': [...]}
+        """
+        cr = self.env.cr
+        documents = {}
+
+        cr.execute(EXPORT_QUERY.format(where="o.id = ANY(%s)"), (list(order_ids),))
+        for row in cr.fetchall():
+            values = [_plain(value) for value in row]
+            order_id = values[0]
+            if order_id not in documents:
+                documents[order_id] = {
+                    'order': dict(zip(ORDER_COLUMNS, values[:len(ORDER_COLUMNS)])),
+                    'lines': [],
+                    'payments': [],
+                    'audit': [],
+                }
+            line = dict(zip(LINE_COLUMNS, values[len(ORDER_COLUMNS):]))
+            if line['line_id']:
+                line['extras'] = []
+                documents[order_id]['lines'].append(line)
+
+        cr.execute("""
+            SELECT id, session_id, company_id, amount_return, create_date
+              FROM pos_order
+             WHERE id = ANY(%s)
+        """, (list(order_ids),))
+        for order_id, session_id, company_id, amount_return, create_date in cr.fetchall():
+            documents[order_id]['order'].update(
+                session_id=session_id,
+                company_id=company_id,
+                amount_return=_plain(amount_return),
+                create_date=_plain(create_date),
+            )
+
+        lines_by_id = {
+            line['line_id']: line
+            for document in documents.values()
+            for line in document['lines']
+        }
+        cr.execute("""
+            SELECT line_id, name, price, qty, amount
+              FROM pos_order_line_api_extra
+             WHERE order_id = ANY(%s)
+          ORDER BY id
+        """, (list(order_ids),))
+        for line_id, name, price, qty, amount in cr.fetchall():
+            if line_id in lines_by_id:
+                lines_by_id[line_id]['extras'].append({'name': name, 'price': price, 'qty': qty, 'amount': amount})
+
+        cr.execute("""
+            SELECT pos_order_id, payment_method_id, amount, payment_date
+              FROM pos_payment
+             WHERE pos_order_id = ANY(%s)
+          ORDER BY id
+        """, (list(order_ids),))
+        for order_id, payment_method_id, amount, payment_date in cr.fetchall():
+            documents[order_id]['payments'].append({
+                'payment_method_id': payment_method_id,
+                'amount': _plain(amount),
+                'payment_date': _plain(payment_date),
+            })
+
+        # Al borrar la orden el order_id de la auditoría queda vacío: el vínculo se conserva en el documento
+        cr.execute("""
+            SELECT order_id, source, request_id, payload_hash, notified_count, duration_ms, notify_ms, create_date
+              FROM pos_order_api_audit
+             WHERE order_id = ANY(%s)
+          ORDER BY id
+        """, (list(order_ids),))
+        for order_id, source, request_id, payload_hash, notified_count, duration_ms, notify_ms, create_date in cr.fetchall():
+            documents[order_id]['audit'].append({
+                'source': source,
+                'request_id': request_id,
+                'payload_hash': payload_hash,
+                'notified_count': notified_count,
+                'duration_ms': _plain(duration_ms),
+                'notify_ms': _plain(notify_ms),
+                'create_date': _plain(create_date),
+            })
+        return documents
+
+    @api.model
+    def fetch_archived(self, ids=None, external_refs=None):
+        """
+        Órdenes archivadas por id o por referencia externa, descomprimidas.
+
+        Returns:
+            list: documentos de archivo, con archived_at
+        """
+        if not ids and not external_refs:
+            return []
+        where = "(order_id = ANY(%s) OR external_ref = ANY(%s))"
+        params = [list(ids or []), list(external_refs or [])]
+        # Una API key de una compañía solo ve las órdenes de esa compañía
+        context = get_request_context()
+        if context and context.company_id:
+            where += " AND company_id = %s"
+            params.append(context.company_id)
+        self.env.cr.execute(f"""
+            SELECT order_id, archived_at, data
+              FROM {ARCHIVE_TABLE}
+             WHERE {where}
+          ORDER BY order_id
+        """, params)
+        return [
+            dict(json_codec.loads(zlib.decompress(bytes(data))), archived_at=_plain(archived_at))
+            for _order_id, archived_at, data in self.env.cr.fetchall()
+        ]
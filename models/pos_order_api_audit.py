@@ -0,0 +1,63 @@
+from odoo import models, api, fields
+from odoo.exceptions import UserError
+from psycopg2.extras import execute_values
+from ..tools.request_context import get_logger
+
+_logger = get_logger(__name__)
+
+AUDIT_COLUMNS = ('order_id', 'source', 'request_id', 'payload_hash', 'notified_count', 'duration_ms', 'notify_ms', 'create_date')
+
+
+class PosOrderApiAudit(models.Model):
+    _name = 'pos.order.api.audit'
+    _description = 'Registro de auditoría de órdenes de la API POS'
+    _order = 'id desc'
+    _log_access = False
+
+    order_id = fields.Many2one('pos.order', string='Orden', index=True, ondelete='set null', readonly=True)
+    source = fields.Char(string='Origen', readonly=True)
+    request_id = fields.Char(string='ID de Correlación', index=True, readonly=True)
+    payload_hash = fields.Char(string='Hash del Payload', index=True, readonly=True)
+    notified_count = fields.Integer(string='Usuarios Notificados', readonly=True)
+    duration_ms = fields.Float(string='Duración (ms)', readonly=True)
+    notify_ms = fields.Float(string='Notificaciones (ms)', readonly=True)
+    create_date = fields.Datetime(string='Fecha', index=True, readonly=True)
+
+    @api.model
+    def _queue_entry(self, order_id, source, payload_hash=None, request_id=None, notified_count=0, duration_ms=0.0, notify_ms=0.0):
+        """
+        Agrega una entrada al lote de la transacción en curso. Todas las entradas
+        de la transacción se insertan juntas, con un solo INSERT, justo antes del commit.
+        """
+        entries = self.env.cr.precommit.data.setdefault('pos_order_api.audit', [])
+        if not entries:
+            self.env.cr.precommit.add(self._flush_entries)
+        entries.append((
+            order_id or None,
+            source,
+            request_id,
+            payload_hash,
+            notified_count or 0,
+            round(duration_ms or 0.0, 2),
+            round(notify_ms or 0.0, 2),
+            fields.Datetime.now(),
+        ))
+
+    @api.model
+    def _flush_entries(self):
+        entries = self.env.cr.precommit.data.pop('pos_order_api.audit', [])
+        if not entries:
+            return
+        try:
+            # La auditoría nunca debe impedir que las órdenes se confirmen
+            with self.env.cr.savepoint(flush=False):
+                execute_values(
+                    self.env.cr._obj,
+                    f"INSERT INTO pos_order_api_audit ({', '.join(AUDIT_COLUMNS)}) VALUES %s",
+                    entries,
+                )
+        except Exception as e:
+            _logger.error("Error al escribir %s entradas de auditoría: %s", len(entries), e)
+
+    def write(self, vals):
+        raise UserError("El registro de auditoría de la API es de solo inserción.")
@@ -0,0 +1,105 @@
+from odoo import models, api
+from ..tools.api_caches import product_cache, session_cache
+from ..tools.shared_cache import CACHE_TABLE, VERSION_TABLE, flush_pending
+from ..tools.request_context import get_logger
+import time
+
+_logger = get_logger(__name__)
+
+
+class PosOrderApiCache(models.AbstractModel):
+    _name = 'pos.order.api.cache'
+    _description = 'Caché compartida de la API POS'
+
+    def init(self):
+        """
+        Crea las tablas de la caché compartida (L2). Son UNLOGGED: perder su
+        contenido tras un crash solo obliga a recalcular las búsquedas.
+        """
+        self.env.cr.execute(f"""
+            CREATE UNLOGGED TABLE IF NOT EXISTS {CACHE_TABLE} (
+                namespace varchar NOT NULL,
+                key varchar NOT NULL,
+                version bigint NOT NULL,
+                value text NOT NULL,
+                expires_at timestamp NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        self.env.cr.execute(f"""
+            CREATE UNLOGGED TABLE IF NOT EXISTS {VERSION_TABLE} (
+                namespace varchar PRIMARY KEY,
+                version bigint NOT NULL DEFAULT 0
+            )
+        """)
+
+    @api.model
+    def cron_purge_shared_cache(self):
+        """
+        Borra las entradas vencidas de la caché compartida
+        """
+        self.env.cr.execute(
+            f"DELETE FROM {CACHE_TABLE} WHERE expires_at < now() at time zone 'UTC'"
+        )
+        _logger.info("Caché compartida de la API POS: %s entradas vencidas eliminadas", self.env.cr.rowcount)
+
+    @api.model
+    def benchmark(self, iterations=1000):
+        """
+        Compara la latencia de un acierto en L1 y en L2 con las búsquedas ORM
+        que reemplazan en _get_or_create_product y _get_or_create_pos_session.
+        Pensado para ejecutarse desde `odoo shell`.
+
+        Returns:
+            dict: microsegundos por operación de cada variante
+        """
+        env = self.sudo().env
+        results = {}
+
+        def measure(name, func):
+            started = time.perf_counter()
+            for _i in range(iterations):
+                func()
+            results[name] = round((time.perf_counter() - started) * 1e6 / iterations, 2)
+
+        # Productos: búsqueda por nombre exacto, como en _get_or_create_product
+        Product = env['product.product']
+        product = Product.search([('name', '=like', '% D')], limit=1) or Product.search([], limit=1)
+        if product:
+            key = (product.company_id.id or env.company.id, product.name)
+            product_cache.set(env, key, product.id)
+            flush_pending(env.cr)
+
+            measure('product_orm_search', lambda: Product.search([('name', '=', product.name)], limit=1))
+            measure('product_l1_hit', lambda: product_cache.get(env, key))
+
+            def l2_hit():
+                product_cache.l1.pop((env.cr.dbname,) + key)
+                product_cache.get(env, key)
+
+            measure('product_l2_hit', l2_hit)
+
+        # Sesiones: búsqueda de la sesión abierta de la API para un pos_name
+        Session = env['pos.session']
+        session = Session.search([('api_managed', '=', True), ('state', '=', 'opened')], limit=1)
+        if session:
+            key = (session.config_id.company_id.id, session.api_pos_name)
+            session_cache.set(env, key, session.id)
+            flush_pending(env.cr)
+
+            measure('session_orm_search', lambda: Session.search([
+                ('api_managed', '=', True),
+                ('api_pos_name', '=', session.api_pos_name),
+                ('state', '=', 'opened'),
+                ('api_retired', '=', False),
+            ], limit=1))
+            measure('session_l1_hit', lambda: session_cache.get(env, key))
+
+            def l2_hit():
+                session_cache.l1.pop((env.cr.dbname,) + key)
+                session_cache.get(env, key)
+
+            measure('session_l2_hit', l2_hit)
+
+        _logger.info("Benchmark de la caché compartida (µs por operación, %s iteraciones): %s", iterations, results)
+        return results
@@ -0,0 +1,288 @@
+from odoo import models, api, fields
+from odoo.tools.mimetypes import guess_mimetype
+from concurrent.futures import ProcessPoolExecutor
+from .pos_session import MODULE_NAME
+from ..tools.image_resize import IMAGE_SIZES, resize_variants
+from ..tools.request_context import get_logger
+import base64
+import hashlib
+import multiprocessing
+import odoo.addons
+import os
+import time
+
+_logger = get_logger(__name__)
+
+# Bytes de imágenes (en base64) que se acumulan antes de crear un bloque de trabajos
+BATCH_BYTES = 64 * 1024 * 1024
+
+# Los procesos del pool arrancan limpios (sin heredar las conexiones a
+# PostgreSQL del worker de cron) y solo reciben la ruta de addons, para
+# poder importar resize_variants
+_POOL_INIT = "import odoo.addons; odoo.addons.__path__[:] = {paths!r}"
+
+
+def _image_pool(pool_size):
+    """
+    Pool de procesos para redimensionar imágenes. Usa 'forkserver' (o
+    'spawn' donde no existe) en lugar de fork: un fork del worker de cron
+    copiaría sus conexiones abiertas y el estado de sus hilos.
+    """
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(
+        max_workers=pool_size,
+        mp_context=multiprocessing.get_context(method),
+        initializer=exec,
+        initargs=(_POOL_INIT.format(paths=list(odoo.addons.__path__)),),
+    )
+
+
+class PosOrderApiImageJob(models.Model):
+    _name = 'pos.order.api.image.job'
+    _description = 'Imagen de producto pendiente de la API POS'
+    _order = 'id'
+
+    product_tmpl_id = fields.Many2one('product.template', string='Producto', required=True, index=True, ondelete='cascade')
+    checksum = fields.Char(string='Checksum', required=True, index=True, help="SHA-1 de la imagen, como ir.attachment.checksum")
+    image = fields.Binary(string='Imagen Original', attachment=True)
+    state = fields.Selection([
+        ('pending', 'Pendiente'),
+        ('done', 'Aplicada'),
+        ('failed', 'Fallida'),
+    ], string='Estado', default='pending', required=True, index=True)
+    error = fields.Char(string='Error')
+
+    @api.model
+    def _resolve_products(self, names, company_id=False):
+        """
+        Productos por nombre de archivo: el nombre con el sufijo 'D' de
+        _get_or_create_product o, si no existe, el nombre exacto. Con
+        company_id, solo los productos de esa compañía o compartidos.
+
+        Returns:
+            dict: nombre -> product.template id
+        """
+        candidates = set(names) | {f"{name} D" for name in names}
+        domain = [('name', 'in', list(candidates))]
+        if company_id:
+            domain.append(('company_id', 'in', [company_id, False]))
+        rows = self.env['product.template'].sudo().search_read(domain, ['name'], order='company_id, id')
+        by_name = {}
+        for row in rows:
+            by_name.setdefault(row['name'], row['id'])
+        return {
+            name: by_name.get(f"{name} D") or by_name.get(name)
+            for name in names
+            if by_name.get(f"{name} D") or by_name.get(name)
+        }
+
+    @api.model
+    def _current_checksums(self, template_ids):
+        """
+        Checksum de la imagen actual de cada producto, y de su imagen pendiente si la hay
+        """
+        attachments = self.env['ir.attachment'].sudo().search_read([
+            ('res_model', '=', 'product.template'),
+            ('res_field', '=', 'image_1920'),
+            ('res_id', 'in', list(template_ids)),
+        ], ['res_id', 'checksum'])
+        current = {attachment['res_id']: attachment['checksum'] for attachment in attachments}
+        pending = {
+            job['product_tmpl_id'][0]: job['checksum']
+            for job in self.sudo().search_read(
+                [('state', '=', 'pending'), ('product_tmpl_id', 'in', list(template_ids))],
+                ['product_tmpl_id', 'checksum'], order='id',
+            )
+        }
+        return current, pending
+
+    @api.model
+    def enqueue_images(self, entries, batch_bytes=BATCH_BYTES, company_id=False):
+        """
+        Encola imágenes de productos sin redimensionarlas. entries es un
+        iterable de (nombre de producto, función que devuelve los bytes): cada
+        imagen se lee recién al procesarla, de a una, y los trabajos se crean
+        en bloques de hasta batch_bytes bytes, para no tener la carga completa
+        en memoria.
+
+        Se descartan las imágenes repetidas en la carga, iguales a la actual
+        del producto o a la que ya está pendiente.
+
+        Returns:
+            dict: resumen con queued, unchanged, duplicates, unknown e invalid
+        """
+        entries = list(entries)
+        products = self._resolve_products({name for name, _read in entries}, company_id)
+        current, pending = self._current_checksums(set(products.values()))
+
+        result = {'queued': 0, 'unchanged': 0, 'duplicates': 0, 'unknown': [], 'invalid': []}
+        seen = {}
+        batch = []
+        batch_size = 0
+        Jobs = self.sudo()
+
+        def flush():
+            nonlocal batch_size
+            if not batch:
+                return
+            # La imagen más reciente de un producto reemplaza a la pendiente
+            Jobs.search([
+                ('state', '=', 'pending'),
+                ('product_tmpl_id', 'in', [vals['product_tmpl_id'] for vals in batch]),
+            ]).unlink()
+            Jobs.create(batch)
+            result['queued'] += len(batch)
+            batch.clear()
+            batch_size = 0
+
+        for name, read in entries:
+            template_id = products.get(name)
+            if not template_id:
+                result['unknown'].append(name)
+                continue
+
+            raw = read()
+            if not guess_mimetype(raw).startswith('image/'):
+                result['invalid'].append(name)
+                continue
+
+            checksum = hashlib.sha1(raw).hexdigest()
+            if seen.get(template_id) == checksum:
+                result['duplicates'] += 1
+                continue
+            if pending.get(template_id, current.get(template_id)) == checksum:
+                result['unchanged'] += 1
+                continue
+
+            seen[template_id] = pending[template_id] = checksum
+            # Si el mismo producto aparece de nuevo en el lote, gana la última imagen
+            for vals in batch:
+                if vals['product_tmpl_id'] == template_id:
+                    batch.remove(vals)
+                    batch_size -= len(vals['image'])
+                    break
+            image = base64.b64encode(raw)
+            batch.append({'product_tmpl_id': template_id, 'checksum': checksum, 'image': image})
+            batch_size += len(image)
+            if batch_size >= batch_bytes:
+                flush()
+
+        flush()
+        if result['queued']:
+            cron = self.env.ref(f'{MODULE_NAME}.cron_process_image_jobs', raise_if_not_found=False)
+            if cron:
+                cron.sudo()._trigger()
+        return result
+
+    def _apply_variants(self, variants_by_template):
+        """
+        Guarda las variantes ya calculadas como adjuntos de los campos de
+        imagen, sin pasar por write: el ORM las volvería a redimensionar.
+        """
+        Attachment = self.env['ir.attachment'].sudo()
+        template_ids = list(variants_by_template)
+        Attachment.search([
+            ('res_model', '=', 'product.template'),
+            ('res_field', 'in', list(IMAGE_SIZES)),
+            ('res_id', 'in', template_ids),
+        ]).unlink()
+        Attachment.create([
+            {
+                'name': field,
+                'res_model': 'product.template',
+                'res_field': field,
+                'res_id': template_id,
+                'type': 'binary',
+                'raw': data,
+            }
+            for template_id, resized in variants_by_template.items()
+            for field, data in resized['variants'].items()
+        ])
+
+        # write_date cambia la URL de las imágenes en caché del navegador
+        self.env['product.template'].flush_model()
+        for zoomable in (True, False):
+            ids = [template_id for template_id, resized in variants_by_template.items() if resized['zoomable'] == zoomable]
+            if ids:
+                self.env.cr.execute("""
+                    UPDATE product_template
+                       SET can_image_1024_be_zoomed = %s, write_date = now() at time zone 'UTC'
+                     WHERE id IN %s
+                """, (zoomable, tuple(ids)))
+        self.env['product.template'].invalidate_model()
+        self.env['product.product'].invalidate_model()
+
+    @api.model
+    def cron_process_image_jobs(self):
+        """
+        Genera las variantes de las imágenes pendientes en un pool de procesos
+        y las aplica en bloque, con un commit por bloque. Si se agota el
+        tiempo, el cron se vuelve a programar.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        try:
+            batch_size = max(int(ICP.get_param('pos_order_api.image_batch_size', '100')), 1)
+            time_budget = float(ICP.get_param('pos_order_api.image_time_budget', '300'))
+            pool_size = int(ICP.get_param('pos_order_api.image_workers', '0'))
+        except ValueError:
+            batch_size, time_budget, pool_size = 100, 300.0, 0
+        pool_size = pool_size or min(4, os.cpu_count() or 1)
+
+        deadline = time.monotonic() + time_budget
+        Jobs = self.sudo()
+        processed = failed = 0
+
+        with _image_pool(pool_size) as pool:
+            while True:
+                jobs = Jobs.search([('state', '=', 'pending')], limit=batch_size)
+                if not jobs:
+                    break
+
+                attachments = self.env['ir.attachment'].sudo().search([
+                    ('res_model', '=', self._name),
+                    ('res_field', '=', 'image'),
+                    ('res_id', 'in', jobs.ids),
+                ])
+                raw_by_job = {attachment.res_id: attachment.raw for attachment in attachments}
+                # Una misma imagen para varios productos se redimensiona una sola vez
+                futures = {}
+                for job in jobs:
+                    if job.id in raw_by_job and job.checksum not in futures:
+                        futures[job.checksum] = pool.submit(resize_variants, raw_by_job[job.id])
+
+                variants_by_template = {}
+                done = self.browse()
+                for job in jobs:
+                    future = futures.get(job.checksum) if job.id in raw_by_job else None
+                    try:
+                        if future is None:
+                            raise ValueError("Imagen original no encontrada")
+                        variants_by_template[job.product_tmpl_id.id] = future.result()
+                        done |= job
+                    except Exception as e:
+                        failed += 1
+                        job.write({'state': 'failed', 'error': str(e)[:200], 'image': False})
+                        _logger.warning("Imagen del producto %s descartada: %s", job.product_tmpl_id.id, e)
+
+                if variants_by_template:
+                    self._apply_variants(variants_by_template)
+                # La imagen original ya está en el producto: se libera el adjunto del trabajo
+                done.write({'state': 'done', 'image': False})
+                processed += len(done)
+                self.env.cr.commit()
+
+                if time.monotonic() > deadline:
+                    remaining = Jobs.search_count([('state', '=', 'pending')])
+                    if remaining:
+                        cron = self.env.ref(f'{MODULE_NAME}.cron_process_image_jobs', raise_if_not_found=False)
+                        if cron:
+                            cron._trigger()
+                        self.env.cr.commit()
+                    break
+
+        _logger.info("Imágenes de productos: %s aplicadas, %s fallidas", processed, failed)
+        # Los trabajos terminados se conservan un día para consulta
+        self.sudo().search([
+            ('state', 'in', ('done', 'failed')),
+            ('write_date', '<', fields.Datetime.subtract(fields.Datetime.now(), days=1)),
+        ]).unlink()
@@ -0,0 +1,331 @@
+from odoo import models, api, fields
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2 import errors
+from .pos_session import MODULE_NAME
+from ..tools import json_codec
+from ..tools.request_context import ApiRequestContext, get_logger, reset_request_context, set_request_context
+import threading
+import time
+import uuid
+
+_logger = get_logger(__name__)
+
+# Intentos de una orden que falla con una excepción antes de descartarla
+MAX_ATTEMPTS = 3
+
+# Segundos de espera antes de reintentar, multiplicados por el número de intento
+RETRY_DELAY = 30
+
+# Segundos mínimos entre dos disparos del cron desde un mismo worker HTTP
+TRIGGER_INTERVAL = 1.0
+
+# La cabeza de cada punto de venta: la orden pendiente más antigua de su
+# pos_name. Quien la bloquea es dueño de la partición hasta su commit; las
+# demás cabezas bloqueadas se saltan, así cada worker toma otro punto de venta
+# y las órdenes de una tienda se crean en el orden en que llegaron.
+CLAIM_QUERY = """
+    SELECT i.id, i.pos_name
+      FROM pos_order_api_intake i
+     WHERE i.state = 'pending'
+       AND (i.retry_at IS NULL OR i.retry_at <= now() AT TIME ZONE 'UTC')
+       AND NOT EXISTS (
+           SELECT 1 FROM pos_order_api_intake e
+            WHERE e.pos_name = i.pos_name AND e.state = 'pending' AND e.id < i.id
+       )
+     ORDER BY i.id
+     LIMIT 1
+       FOR UPDATE OF i SKIP LOCKED
+"""
+
+# Último disparo del cron por base de datos, en este proceso
+_last_trigger = {}
+
+
+class PosOrderApiIntake(models.Model):
+    _name = 'pos.order.api.intake'
+    _description = 'Orden recibida por la API pendiente de crear'
+    _order = 'id'
+
+    ticket = fields.Char(string='Ticket', required=True, readonly=True, copy=False)
+    pos_name = fields.Char(string='Punto de Venta', required=True, readonly=True)
+    company_id = fields.Many2one('res.company', string='Compañía', readonly=True)
+    api_key_id = fields.Many2one('pos.order.api.key', string='API Key', readonly=True, ondelete='set null')
+    request_id = fields.Char(string='ID de Correlación', readonly=True)
+    payload = fields.Text(string='Payload', required=True, readonly=True, help="Payload ya validado, en JSON")
+    payload_hash = fields.Char(string='Hash del Payload', readonly=True)
+    state = fields.Selection([
+        ('pending', 'Pendiente'),
+        ('done', 'Creada'),
+        ('failed', 'Fallida'),
+    ], string='Estado', default='pending', required=True, readonly=True, index=True)
+    attempts = fields.Integer(string='Intentos', readonly=True)
+    retry_at = fields.Datetime(string='Reintentar Desde', readonly=True)
+    order_id = fields.Many2one('pos.order', string='Orden', readonly=True, ondelete='set null')
+    error = fields.Char(string='Error', readonly=True)
+
+    _sql_constraints = [
+        ('ticket_uniq', 'unique(ticket)', 'El ticket de la orden debe ser único.'),
+    ]
+
+    def init(self):
+        """
+        Índice parcial para tomar la cabeza de cada punto de venta: solo cubre
+        las órdenes pendientes, así se mantiene chico aunque la tabla crezca.
+        """
+        super().init()
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS pos_order_api_intake_pending_idx
+                ON pos_order_api_intake (pos_name, id)
+             WHERE state = 'pending'
+        """)
+
+    @api.model
+    def _enqueue(self, order_data, pos_name, company_id=None, api_key_id=None, request_id=None, payload_hash=None):
+        """
+        Guarda un payload ya validado y avisa a los workers.
+
+        Returns:
+            str: ticket para consultar el resultado
+        """
+        ticket = uuid.uuid4().hex
+        self.sudo().create({
+            'ticket': ticket,
+            'pos_name': pos_name,
+            'company_id': company_id or False,
+            'api_key_id': api_key_id or False,
+            'request_id': request_id,
+            'payload': json_codec.dumps(order_data).decode('utf-8'),
+            'payload_hash': payload_hash,
+        })
+        self._trigger_workers()
+        return ticket
+
+    @api.model
+    def _trigger_workers(self):
+        # Durante una ráfaga basta un disparo por segundo: el cron sigue tomando
+        # órdenes mientras queden pendientes
+        dbname = self.env.cr.dbname
+        now = time.monotonic()
+        if now - _last_trigger.get(dbname, 0.0) < TRIGGER_INTERVAL:
+            return
+        _last_trigger[dbname] = now
+        cron = self.env.ref(f'{MODULE_NAME}.cron_process_order_intake', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    @api.model
+    def _ticket_status(self, ticket):
+        rows = self.search_read(
+            [('ticket', '=', ticket)],
+            ['state', 'attempts', 'error', 'order_id', 'create_date', 'write_date'],
+            limit=1,
+        )
+        if not rows:
+            return None
+        row = rows[0]
+        return {
+            'ticket': ticket,
+            'state': row['state'],
+            'attempts': row['attempts'],
+            'error': row['error'] or None,
+            'order_id': row['order_id'] and row['order_id'][0],
+            'received_at': fields.Datetime.to_string(row['create_date']),
+            'updated_at': fields.Datetime.to_string(row['write_date']),
+        }
+
+    @api.model
+    def cron_process_intake(self):
+        """
+        Crea las órdenes encoladas con varios workers en paralelo, cada uno con
+        su propio cursor. Cada worker toma un punto de venta libre, crea un
+        bloque de sus órdenes en orden de llegada y confirma; luego toma otro.
+        Si se agota el tiempo con órdenes pendientes, el cron se vuelve a programar.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        try:
+            workers = max(int(ICP.get_param('pos_order_api.intake_workers', '2')), 1)
+            batch_size = max(int(ICP.get_param('pos_order_api.intake_batch_size', '20')), 1)
+            time_budget = float(ICP.get_param('pos_order_api.intake_time_budget', '240'))
+            retention_days = int(ICP.get_param('pos_order_api.intake_retention_days', '7'))
+        except ValueError:
+            workers, batch_size, time_budget, retention_days = 2, 20, 240.0, 7
+
+        deadline = time.monotonic() + time_budget
+        registry = self.env.registry
+        dbname = self.env.cr.dbname
+        uid = self.env.uid
+
+        def work():
+            threading.current_thread().dbname = dbname
+            processed = 0
+            with registry.cursor() as cr:
+                Intake = api.Environment(cr, uid, {})[self._name]
+                while time.monotonic() < deadline:
+                    try:
+                        count = Intake._process_partition(batch_size)
+                        cr.commit()
+                    except (errors.SerializationFailure, errors.DeadlockDetected, errors.LockNotAvailable) as e:
+                        # Otro worker tomó la misma partición: se reintenta con otra
+                        cr.rollback()
+                        _logger.debug("Conflicto de concurrencia en la ingesta diferida, se reintenta: %s", e)
+                        continue
+                    except Exception:
+                        cr.rollback()
+                        _logger.exception("Error en un worker de la ingesta diferida")
+                        break
+                    if count is None:
+                        # No quedan puntos de venta libres con órdenes pendientes
+                        break
+                    processed += count
+            return processed
+
+        if workers == 1:
+            totals = [work()]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pos_api_intake') as pool:
+                totals = list(pool.map(lambda _index: work(), range(workers)))
+
+        if sum(totals):
+            _logger.info("Ingesta diferida: %s órdenes creadas por %s workers", sum(totals), workers)
+
+        if time.monotonic() >= deadline and self.sudo().search_count([('state', '=', 'pending')]):
+            cron = self.env.ref(f'{MODULE_NAME}.cron_process_order_intake', raise_if_not_found=False)
+            if cron:
+                cron._trigger()
+
+        # Los tickets resueltos se conservan unos días para consulta
+        self.sudo().search([
+            ('state', 'in', ('done', 'failed')),
+            ('write_date', '<', fields.Datetime.subtract(fields.Datetime.now(), days=retention_days)),
+        ]).unlink()
+
+    @api.model
+    def _process_partition(self, batch_size):
+        """
+        Toma la cabeza de un punto de venta libre y crea hasta batch_size de
+        sus órdenes pendientes. La transacción la confirma el llamador.
+
+        Returns:
+            int o None: órdenes resueltas, o None si no había partición libre
+        """
+        cr = self.env.cr
+        cr.execute(CLAIM_QUERY)
+        head = cr.fetchone()
+        if not head:
+            return None
+
+        # El resto del bloque no puede tomarlo otro worker: ninguna de estas filas es cabeza
+        cr.execute("""
+            SELECT i.id, i.ticket, i.pos_name, i.company_id, i.api_key_id, k.name AS api_key_name,
+                   i.request_id, i.payload, i.payload_hash, i.attempts, i.create_date
+              FROM pos_order_api_intake i
+              LEFT JOIN pos_order_api_key k ON k.id = i.api_key_id
+             WHERE i.pos_name = %s AND i.state = 'pending'
+             ORDER BY i.id
+             LIMIT %s
+               FOR UPDATE OF i
+        """, (head[1], batch_size))
+        rows = cr.dictfetchall()
+        for row in rows:
+            row['order_data'] = json_codec.loads(row['payload'])
+
+        from ..controllers.main import PosRestController
+        controller = PosRestController._with_env(self.env)
+        self._prefetch_customers(controller, rows)
+
+        resolved = 0
+        for row in rows:
+            if not self._process_row(controller, row):
+                # Se reintenta más tarde; las siguientes esperan para conservar el orden
+                break
+            resolved += 1
+        return resolved
+
+    @api.model
+    def _prefetch_customers(self, controller, rows):
+        """
+        Resuelve los clientes de todo el bloque con una búsqueda por compañía,
+        en lugar de una por orden. Las órdenes quedan con su partner_id.
+        """
+        by_company = {}
+        for row in rows:
+            order_data = row['order_data']
+            if order_data.get('partner_id') or not order_data.get('customer'):
+                continue
+            company_id = row['company_id'] or controller._get_api_company_id(row['pos_name'])
+            by_company.setdefault(company_id, []).append(order_data)
+
+        Partner = self.env['res.partner'].sudo()
+        for company_id, orders in by_company.items():
+            try:
+                with self.env.cr.savepoint():
+                    partner_ids = Partner._pos_api_resolve_customers([order['customer'] for order in orders], company_id)
+            except Exception as e:
+                # Cada orden resuelve su cliente por su cuenta, como en la ruta
+                _logger.warning("No se pudieron resolver los clientes del bloque: %s", e)
+                continue
+            for order_data, partner_id in zip(orders, partner_ids):
+                if partner_id:
+                    order_data['partner_id'] = partner_id
+
+    @api.model
+    def _process_row(self, controller, row):
+        """
+        Crea la orden de una fila con la misma lógica que la ruta, dentro de un
+        savepoint y con el contexto de la petición original (compañía, API key
+        e id de correlación para los logs).
+
+        Returns:
+            bool: False si la fila debe reintentarse más tarde
+        """
+        context = ApiRequestContext('/api/pos/order', 'intake', row['request_id'])
+        context.company_id = row['company_id']
+        context.api_key_id = row['api_key_id']
+        context.api_key_name = row['api_key_name']
+        token = set_request_context(context)
+        started = time.perf_counter()
+        intake = self.sudo().browse(row['id'])
+        try:
+            savepoint = self.env.cr.savepoint()
+            try:
+                with savepoint:
+                    result = controller._create_order(
+                        row['order_data'], started, row['payload_hash'], source='intake', fallback=False,
+                    )
+            except Exception as e:
+                # Si la creación dejó la transacción abortada, el RELEASE falla y el savepoint sigue abierto
+                savepoint.close(rollback=True)
+                attempts = row['attempts'] + 1
+                if attempts >= MAX_ATTEMPTS:
+                    _logger.error("Ticket %s descartado tras %s intentos: %s", row['ticket'], attempts, e)
+                    intake.write({'state': 'failed', 'attempts': attempts, 'error': str(e)[:200]})
+                    return True
+                _logger.warning("Ticket %s: intento %s fallido, se reintentará: %s", row['ticket'], attempts, e)
+                intake.write({
+                    'attempts': attempts,
+                    'error': str(e)[:200],
+                    'retry_at': fields.Datetime.add(fields.Datetime.now(), seconds=RETRY_DELAY * attempts),
+                })
+                return False
+
+            duration_ms = (time.perf_counter() - started) * 1000
+            # Tiempo en cola: desde la recepción hasta que un worker tomó la orden
+            queued_ms = (fields.Datetime.now() - row['create_date']).total_seconds() * 1000 - duration_ms
+            if result.get('success'):
+                intake.write({
+                    'state': 'done',
+                    'attempts': row['attempts'] + 1,
+                    'order_id': result['order_id'],
+                    'error': False,
+                })
+            else:
+                intake.write({'state': 'failed', 'attempts': row['attempts'] + 1, 'error': str(result.get('error'))[:200]})
+            _logger.info(
+                "Ticket %s procesado: success=%s queued_ms=%s duration_ms=%.1f %s",
+                row['ticket'], bool(result.get('success')),
+                round(queued_ms, 1), duration_ms, context.summary(),
+            )
+            return True
+        finally:
+            reset_request_context(token)
+
@@ -0,0 +1,118 @@
+from odoo import models, api, fields
+from ..tools.api_caches import api_key_cache
+from ..tools.cache import MISSING
+from ..tools.request_context import get_logger
+import hashlib
+import hmac
+import secrets
+
+_logger = get_logger(__name__)
+
+# Scopes disponibles para las rutas de la API
+API_SCOPES = ('order', 'product', 'stats', 'admin')
+
+
+def _hash_key(raw_key):
+    return hashlib.sha256(raw_key.encode('utf-8')).hexdigest()
+
+
+class PosOrderApiKey(models.Model):
+    _name = 'pos.order.api.key'
+    _description = 'API Key de la API POS'
+    _order = 'name'
+
+    name = fields.Char(string='Cliente', required=True)
+    active = fields.Boolean(default=True)
+    key_prefix = fields.Char(string='Prefijo', readonly=True, index=True)
+    key_hash = fields.Char(string='Hash', readonly=True, groups='base.group_system')
+    scopes = fields.Char(
+        string='Scopes',
+        default='order,product,stats',
+        help="Lista separada por comas de: order, product, stats, admin",
+    )
+    rate_limit = fields.Float(
+        string='Peticiones por Segundo',
+        help="Cuota propia de la clave. 0 usa pos_order_api.rate_limit_key_rate",
+    )
+    burst = fields.Float(
+        string='Ráfaga Máxima',
+        help="Ráfaga propia de la clave. 0 usa pos_order_api.rate_limit_key_burst",
+    )
+    company_id = fields.Many2one(
+        'res.company',
+        string='Compañía',
+        help="Compañía en la que se registran las órdenes de esta clave. "
+             "Vacío: según el punto de venta (ver README_MULTI_COMPANY.md)",
+    )
+
+    _sql_constraints = [
+        ('key_prefix_uniq', 'unique(key_prefix)', 'El prefijo de la API key debe ser único.'),
+    ]
+
+    @api.model
+    def generate_api_key(self, name, scopes=None, rate_limit=0.0, burst=0.0, company_id=False):
+        """
+        Crea una API key nueva. La clave en claro solo se devuelve aquí;
+        en la base de datos se guarda únicamente su hash.
+
+        Returns:
+            str: clave en formato '<prefijo>.<secreto>'
+        """
+        prefix = secrets.token_hex(4)
+        raw_key = f"{prefix}.{secrets.token_urlsafe(32)}"
+        self.sudo().create({
+            'name': name,
+            'key_prefix': prefix,
+            'key_hash': _hash_key(raw_key),
+            'scopes': scopes or 'order,product,stats',
+            'rate_limit': rate_limit,
+            'burst': burst,
+            'company_id': company_id,
+        })
+        _logger.info("API key creada para '%s' con prefijo %s", name, prefix)
+        return raw_key
+
+    @api.model
+    def _verify_api_key(self, raw_key):
+        """
+        Verifica una API key. Tras la primera petición los datos de la clave
+        quedan en la caché compartida (api_key_cache) y el único costo es el
+        hash y la comparación en tiempo constante. Revocar o modificar una
+        clave invalida esa caché en todos los workers.
+
+        Returns:
+            dict con id, name, scopes, rate_limit, burst y company_id, o None si no es válida
+        """
+        if not raw_key or '.' not in raw_key:
+            return None
+
+        prefix = raw_key.split('.', 1)[0]
+        cached = api_key_cache.get(self.env, (prefix,))
+        if cached is MISSING:
+            key = self.sudo().search([('key_prefix', '=', prefix)], limit=1)
+            cached = None
+            if key:
+                cached = {
+                    'id': key.id,
+                    'name': key.name,
+                    'key_hash': key.key_hash,
+                    'scopes': sorted(s.strip() for s in (key.scopes or '').split(',') if s.strip()),
+                    'rate_limit': key.rate_limit,
+                    'burst': key.burst,
+                    'company_id': key.company_id.id,
+                }
+            api_key_cache.set(self.env, (prefix,), cached)
+
+        if not cached or not hmac.compare_digest(cached['key_hash'], _hash_key(raw_key)):
+            return None
+        return dict(cached, scopes=frozenset(cached['scopes']))
+
+    def write(self, vals):
+        res = super().write(vals)
+        api_key_cache.clear(self.env)
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        api_key_cache.clear(self.env)
+        return res
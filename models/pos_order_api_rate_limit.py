@@ -0,0 +1,137 @@
+from odoo import models, api
+from ..tools.request_context import get_logger
+import math
+import random
+
+_logger = get_logger(__name__)
+
+# Espacio de nombres para los advisory locks de los slots en vuelo ('POSA')
+INFLIGHT_LOCK_NAMESPACE = 0x504F5341
+
+
+class PosOrderApiRateLimit(models.AbstractModel):
+    _name = 'pos.order.api.rate.limit'
+    _description = 'Control de admisión de la API POS'
+
+    def init(self):
+        """
+        Crea la tabla de buckets. Es UNLOGGED porque los contadores son
+        efímeros: no generan WAL y perderlos tras un crash es aceptable.
+        """
+        self.env.cr.execute("""
+            CREATE UNLOGGED TABLE IF NOT EXISTS pos_order_api_rate_bucket (
+                bucket_key varchar PRIMARY KEY,
+                tokens double precision NOT NULL,
+                rate double precision NOT NULL,
+                burst double precision NOT NULL,
+                allowed boolean NOT NULL DEFAULT true,
+                updated_at timestamp NOT NULL DEFAULT (now() at time zone 'UTC')
+            )
+        """)
+
+    @api.model
+    def _consume_tokens(self, buckets):
+        """
+        Comprueba todos los buckets y, solo si todos tienen un token, consume
+        uno de cada uno, en una sola sentencia sobre el cursor de la petición.
+        Un rechazo por el bucket de la API key no gasta el token de la IP.
+
+        La sentencia va en una transacción corta propia, en READ COMMITTED, que
+        se confirma enseguida: el bloqueo de las filas de los buckets dura solo
+        esa sentencia, y dos peticiones del mismo cliente se esperan en lugar
+        de fallar por serialización. Lo anterior de la petición (verificación
+        de la clave) solo lee, así que confirmarlo antes no cambia nada.
+
+        Args:
+            buckets: lista de tuplas (bucket_key, rate, burst)
+
+        Returns:
+            tuple: (permitido, segundos de espera sugeridos)
+        """
+        if not buckets:
+            return True, 0
+
+        values = []
+        params = []
+        for bucket_key, rate, burst in buckets:
+            values.append("(%s, %s::double precision, %s::double precision)")
+            params.extend([bucket_key, rate, burst])
+
+        cr = self.env.cr
+        try:
+            cr.commit()
+            cr.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+            # Las filas se bloquean en orden de clave para que dos peticiones no
+            # se bloqueen mutuamente; un bucket nuevo empieza lleno
+            cr.execute("""
+                WITH requested (bucket_key, rate, burst) AS (VALUES %s),
+                locked AS (
+                    SELECT b.bucket_key,
+                           LEAST(i.burst, b.tokens + i.rate * EXTRACT(EPOCH FROM (
+                               clock_timestamp() at time zone 'UTC' - b.updated_at))) AS tokens
+                      FROM pos_order_api_rate_bucket b
+                      JOIN requested i ON i.bucket_key = b.bucket_key
+                  ORDER BY b.bucket_key
+                       FOR UPDATE OF b
+                ),
+                state AS (
+                    SELECT i.bucket_key, i.rate, i.burst, COALESCE(l.tokens, i.burst) AS tokens
+                      FROM requested i
+                 LEFT JOIN locked l ON l.bucket_key = i.bucket_key
+                ),
+                decision AS (
+                    SELECT bool_and(tokens >= 1) AS allowed FROM state
+                )
+                INSERT INTO pos_order_api_rate_bucket AS b
+                    (bucket_key, tokens, rate, burst, allowed, updated_at)
+                SELECT s.bucket_key, s.tokens - CASE WHEN d.allowed THEN 1 ELSE 0 END,
+                       s.rate, s.burst, s.tokens >= 1, clock_timestamp() at time zone 'UTC'
+                  FROM state s, decision d
+                ON CONFLICT (bucket_key) DO UPDATE SET
+                    tokens = EXCLUDED.tokens,
+                    rate = EXCLUDED.rate,
+                    burst = EXCLUDED.burst,
+                    allowed = EXCLUDED.allowed,
+                    updated_at = EXCLUDED.updated_at
+                RETURNING allowed, tokens, rate
+            """ % ", ".join(values), params)
+            results = cr.fetchall()
+            cr.commit()
+        except Exception:
+            cr.rollback()
+            raise
+
+        retry_after = 0
+        for allowed, tokens, rate in results:
+            if not allowed:
+                wait = math.ceil((1 - tokens) / rate) if rate > 0 else 60
+                retry_after = max(retry_after, wait, 1)
+
+        return retry_after == 0, retry_after
+
+    @api.model
+    def _acquire_inflight_slot(self, max_inflight):
+        """
+        Intenta ocupar uno de los `max_inflight` slots globales compartidos por
+        todos los workers. Usa advisory locks de transacción sobre el cursor
+        de la petición, que se liberan solos al hacer commit o rollback
+        (incluso si el worker muere).
+
+        Returns:
+            bool: True si se obtuvo un slot
+        """
+        if max_inflight <= 0:
+            return True
+
+        self.env.cr.execute("""
+            SELECT slot
+              FROM (SELECT (s + %(offset)s) %% %(size)s AS slot
+                      FROM generate_series(0, %(size)s - 1) s) slots
+             WHERE pg_try_advisory_xact_lock(%(namespace)s, slot)
+             LIMIT 1
+        """, {
+            'offset': random.randrange(max_inflight),
+            'size': max_inflight,
+            'namespace': INFLIGHT_LOCK_NAMESPACE,
+        })
+        return bool(self.env.cr.fetchone())
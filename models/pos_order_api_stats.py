@@ -0,0 +1,144 @@
+from odoo import models, api, fields
+from ..tools.request_context import get_logger
+
+_logger = get_logger(__name__)
+
+class PosOrderApiStats(models.Model):
+    _name = 'pos.order.api.stats'
+    _description = 'Resumen de ventas de la API POS'
+    _order = 'period_start desc, pos_name'
+    _log_access = False
+
+    pos_name = fields.Char(string='Punto de Venta', required=True)
+    granularity = fields.Selection([
+        ('hour', 'Hora'),
+        ('day', 'Día'),
+    ], string='Granularidad', required=True)
+    period_start = fields.Datetime(string='Inicio del Periodo', required=True)
+    order_count = fields.Integer(string='Órdenes', default=0)
+    amount_total = fields.Float(string='Total Vendido', default=0.0)
+    extras_total = fields.Float(string='Total Extras', default=0.0)
+
+    # El índice único cubre (pos_name, granularity, period_start), que es
+    # exactamente el orden de filtrado del endpoint de estadísticas
+    _sql_constraints = [
+        ('period_uniq', 'unique(pos_name, granularity, period_start)',
+         'Ya existe un resumen para este punto de venta y periodo.'),
+    ]
+
+    @api.model
+    def _record_order(self, pos_name, date_order, amount_total, extras_total):
+        """
+        Suma una orden a los resúmenes por hora y por día.
+        Se ejecuta en la misma transacción que crea la orden, por lo que
+        el resumen solo cambia si la orden se confirma.
+        """
+        self.env.cr.execute("""
+            INSERT INTO pos_order_api_stats AS s
+                (pos_name, granularity, period_start, order_count, amount_total, extras_total)
+            VALUES
+                (%(pos_name)s, 'hour', date_trunc('hour', %(date)s::timestamp), 1, %(amount)s, %(extras)s),
+                (%(pos_name)s, 'day', date_trunc('day', %(date)s::timestamp), 1, %(amount)s, %(extras)s)
+            ON CONFLICT (pos_name, granularity, period_start) DO UPDATE SET
+                order_count = s.order_count + EXCLUDED.order_count,
+                amount_total = s.amount_total + EXCLUDED.amount_total,
+                extras_total = s.extras_total + EXCLUDED.extras_total
+        """, {
+            'pos_name': pos_name,
+            'date': date_order,
+            'amount': amount_total or 0.0,
+            'extras': extras_total or 0.0,
+        })
+
+    @api.model
+    def get_summary(self, pos_name=None, granularity='day', date_from=None, date_to=None, limit=1000):
+        """
+        Devuelve los periodos resumidos que coinciden con los filtros.
+        El costo depende del número de periodos pedidos, no del número de órdenes.
+
+        Los totales cubren todos los periodos del filtro, no solo los
+        devueltos: si limit corta la lista, truncated es True.
+        """
+        domain = [('granularity', '=', granularity)]
+        if pos_name:
+            domain.append(('pos_name', '=', pos_name))
+        if date_from:
+            domain.append(('period_start', '>=', date_from))
+        if date_to:
+            domain.append(('period_start', '<', date_to))
+
+        Stats = self.sudo()
+        rows = Stats.search_read(
+            domain,
+            ['pos_name', 'period_start', 'order_count', 'amount_total', 'extras_total'],
+            order='period_start asc, pos_name asc',
+            limit=limit,
+        )
+        [(period_count, order_count, amount_total, extras_total)] = Stats._read_group(
+            domain, [], ['__count', 'order_count:sum', 'amount_total:sum', 'extras_total:sum'],
+        )
+
+        periods = [
+            {
+                'pos_name': row['pos_name'],
+                'period_start': fields.Datetime.to_string(row['period_start']),
+                'order_count': row['order_count'],
+                'amount_total': row['amount_total'],
+                'extras_total': row['extras_total'],
+            }
+            for row in rows
+        ]
+        totals = {
+            'order_count': order_count or 0,
+            'amount_total': amount_total or 0.0,
+            'extras_total': extras_total or 0.0,
+        }
+        return {'periods': periods, 'totals': totals, 'truncated': period_count > len(rows)}
+
+    @api.model
+    def cron_reconcile_stats(self):
+        """
+        Recalcula los resúmenes de los últimos días a partir de las órdenes
+        creadas por la API para corregir cualquier desviación (órdenes
+        canceladas, borradas o transacciones parciales).
+        """
+        try:
+            days = int(self.env['ir.config_parameter'].sudo().get_param(
+                'pos_order_api.stats_reconcile_days', '2'
+            ))
+        except ValueError:
+            days = 2
+
+        try:
+            with self.env.cr.savepoint():
+                self._reconcile_window(days)
+        except Exception as e:
+            _logger.error("Error en la reconciliación de estadísticas de la API: %s", e)
+
+    @api.model
+    def _reconcile_window(self, days):
+        """
+        Reemplaza los resúmenes desde el inicio del día de hace `days` días
+        """
+        cr = self.env.cr
+        cr.execute("SELECT date_trunc('day', now() at time zone 'UTC' - %s * interval '1 day')", (days,))
+        window_start = cr.fetchone()[0]
+
+        cr.execute("DELETE FROM pos_order_api_stats WHERE period_start >= %s", (window_start,))
+        removed = cr.rowcount
+
+        for granularity in ('hour', 'day'):
+            cr.execute("""
+                INSERT INTO pos_order_api_stats
+                    (pos_name, granularity, period_start, order_count, amount_total, extras_total)
+                SELECT o.api_pos_name, %(granularity)s, date_trunc(%(granularity)s, o.date_order),
+                       count(*), coalesce(sum(o.amount_total), 0), coalesce(sum(o.api_extras_total), 0)
+                  FROM pos_order o
+                 WHERE o.api_pos_name IS NOT NULL
+                   AND o.state != 'cancel'
+                   AND o.date_order >= %(window_start)s
+              GROUP BY o.api_pos_name, date_trunc(%(granularity)s, o.date_order)
+            """, {'granularity': granularity, 'window_start': window_start})
+
+        self.env.invalidate_all()
+        _logger.info("Reconciliación de estadísticas completada desde %s (%s filas recalculadas)", window_start, removed)
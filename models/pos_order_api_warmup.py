@@ -0,0 +1,114 @@
+from odoo import models, api
+from odoo.tools import config
+from ..tools.api_caches import product_cache, recipient_cache, reference_cache, session_cache
+from ..tools.request_context import get_logger
+import time
+
+_logger = get_logger(__name__)
+
+# Referencias que resuelven las rutas y las notificaciones en cada petición
+WARMUP_XMLIDS = [
+    'base.user_admin',
+    'base.group_system',
+    'point_of_sale.group_pos_manager',
+    'point_of_sale.group_pos_user',
+    'sales_team.group_sale_salesman',
+]
+
+
+class PosOrderApiWarmup(models.AbstractModel):
+    _name = 'pos.order.api.warmup'
+    _description = 'Precarga de cachés de la API POS'
+
+    def _register_hook(self):
+        """
+        Precarga las cachés al cargar el registro en cada proceso, para que las
+        primeras peticiones tras un despliegue o un reciclado del worker no
+        paguen la resolución de referencias, productos, sesiones y destinatarios.
+        """
+        super()._register_hook()
+
+        # Durante una instalación/actualización no se precarga (lo hace post_init_hook)
+        if config.get('init') or config.get('update'):
+            return
+
+        try:
+            enabled = self.env['ir.config_parameter'].sudo().get_param('pos_order_api.warmup_on_start', 'True')
+            if enabled.lower() == 'true':
+                with self.env.cr.savepoint():
+                    self.warmup()
+        except Exception as e:
+            _logger.warning("No se pudo precargar las cachés de la API POS: %s", e)
+
+    @api.model
+    def warmup(self):
+        """
+        Llena las cachés de productos, sesiones, destinatarios y datos de referencia.
+
+        Returns:
+            dict: duración en milisegundos de cada etapa y total
+        """
+        timings = {}
+        started = time.perf_counter()
+        env = self.sudo().env
+        dbname = self.env.cr.dbname
+
+        # 1. Datos de referencia: xmlids y modelos (quedan en el ormcache del worker)
+        stage = time.perf_counter()
+        for xmlid in WARMUP_XMLIDS:
+            env.ref(xmlid, raise_if_not_found=False)
+        env['ir.model']._get('res.users')
+
+        company = env['res.company'].search([('id', '=', 1)], limit=1) or env['res.company'].search([], limit=1)
+        category = env['product.category'].search([('name', '=', 'Ecommerce')], limit=1)
+        uom = env.ref('uom.product_uom_unit', raise_if_not_found=False)
+        for name, record in (('company', company), ('product_category', category), ('uom_unit', uom)):
+            if record:
+                reference_cache.set((dbname, False, name), record.id)
+        timings['reference'] = (time.perf_counter() - stage) * 1000
+
+        # 2. Productos creados por la API (nombre con sufijo ' D'), por compañía.
+        # Los productos compartidos valen para todas las compañías.
+        company_ids = env['res.company'].search([]).ids
+        stage = time.perf_counter()
+        try:
+            limit = int(env['ir.config_parameter'].get_param('pos_order_api.warmup_product_limit', '5000'))
+        except ValueError:
+            limit = 5000
+        products = env['product.product'].search_read(
+            [('name', '=like', '% D'), ('available_in_pos', '=', True)],
+            ['name', 'company_id'],
+            order='write_date desc',
+            limit=limit,
+        )
+        # Como en _get_or_create_product, el producto propio de la compañía gana al compartido
+        for product in sorted(products, key=lambda product: bool(product['company_id'])):
+            for company_id in ([product['company_id'][0]] if product['company_id'] else company_ids):
+                product_cache.set(env, (company_id, product['name']), product['id'])
+        timings['products'] = (time.perf_counter() - stage) * 1000
+
+        # 3. Sesiones vigentes de los puntos de venta de la API
+        stage = time.perf_counter()
+        api_sessions = env['pos.session'].search_read([
+            ('api_managed', '=', True),
+            ('api_retired', '=', False),
+            ('state', '=', 'opened'),
+        ], ['api_pos_name', 'company_id'], order='id asc')
+        for session in api_sessions:
+            session_cache.set(env, (session['company_id'] and session['company_id'][0], session['api_pos_name']), session['id'])
+        timings['sessions'] = (time.perf_counter() - stage) * 1000
+
+        # 4. Destinatarios de notificaciones
+        stage = time.perf_counter()
+        recipient_cache.pop(env, ('notify_users',))
+        env['pos.order']._get_users_to_notify()
+        timings['recipients'] = (time.perf_counter() - stage) * 1000
+
+        timings['total'] = (time.perf_counter() - started) * 1000
+        _logger.info(
+            "Precarga de la API POS completada en %.1f ms "
+            "(referencias %.1f ms, %s productos %.1f ms, sesiones %.1f ms, destinatarios %.1f ms)",
+            timings['total'], timings['reference'], len(products), timings['products'],
+            timings['sessions'], timings['recipients'],
+        )
+        return timings
@@ -0,0 +1,74 @@
+from odoo import models, api, fields
+from ..tools.request_context import get_logger
+
+_logger = get_logger(__name__)
+
+
+class PosOrderLineApiExtra(models.Model):
+    _name = 'pos.order.line.api.extra'
+    _description = 'Extra de una línea de orden de la API POS'
+    _order = 'id'
+    _log_access = False
+
+    line_id = fields.Many2one('pos.order.line', string='Línea', required=True, index=True, ondelete='cascade')
+    order_id = fields.Many2one(related='line_id.order_id', store=True, index=True, string='Orden')
+    name = fields.Char(string='Extra', required=True, index=True)
+    price = fields.Float(string='Precio Unitario', default=0.0)
+    qty = fields.Float(string='Cantidad', default=0.0)
+    amount = fields.Float(string='Importe', default=0.0, help="Cantidad × precio del extra, con el descuento de la línea")
+
+    @api.model
+    def get_extras_summary(self, pos_name=None, date_from=None, date_to=None, limit=1000):
+        """
+        Cantidad e importe vendidos por extra, con una sola consulta agrupada
+        sobre los extras estructurados (sin recorrer las notas de las líneas).
+        Se excluyen las órdenes canceladas.
+
+        Los totales se calculan con funciones de ventana antes del LIMIT, así
+        que cubren todos los extras del filtro; truncated indica si limit
+        cortó la lista.
+        """
+        where = ["o.state != 'cancel'", "o.api_pos_name IS NOT NULL"]
+        params = []
+        if pos_name:
+            where.append("o.api_pos_name = %s")
+            params.append(pos_name)
+        if date_from:
+            where.append("o.date_order >= %s")
+            params.append(date_from)
+        if date_to:
+            where.append("o.date_order < %s")
+            params.append(date_to)
+        params.append(limit)
+
+        self.env['pos.order.line.api.extra'].flush_model()
+        self.env.cr.execute(f"""
+            SELECT e.name, count(DISTINCT e.line_id), sum(e.qty), sum(e.amount),
+                   count(*) OVER (), sum(sum(e.qty)) OVER (), sum(sum(e.amount)) OVER ()
+              FROM pos_order_line_api_extra e
+              JOIN pos_order o ON o.id = e.order_id
+             WHERE {' AND '.join(where)}
+          GROUP BY e.name
+          ORDER BY sum(e.amount) DESC, e.name
+             LIMIT %s
+        """, params)
+        rows = self.env.cr.fetchall()
+
+        extras = [
+            {
+                'name': name,
+                'line_count': line_count,
+                'qty': qty or 0.0,
+                'amount': amount or 0.0,
+            }
+            for name, line_count, qty, amount, _count, _total_qty, _total_amount in rows
+        ]
+        extra_count, total_qty, total_amount = rows[0][4:] if rows else (0, 0.0, 0.0)
+        totals = {'qty': total_qty or 0.0, 'amount': total_amount or 0.0}
+        return {'extras': extras, 'totals': totals, 'truncated': extra_count > len(rows)}
+
+
+class PosOrderLine(models.Model):
+    _inherit = 'pos.order.line'
+
+    api_extra_ids = fields.One2many('pos.order.line.api.extra', 'line_id', string='Extras API', readonly=True)
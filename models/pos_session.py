@@ -0,0 +1,319 @@
+from odoo import models, api, fields, _
+from odoo.exceptions import ValidationError
+from datetime import timedelta
+from ..tools.request_context import get_logger
+import time
+
+_logger = get_logger(__name__)
+
+# Nombre técnico del módulo, para resolver sus xmlids (odoo.addons.<módulo>.models...)
+MODULE_NAME = __name__.split('.')[2]
+
+# Método de pago con el que se liquidan las órdenes de la API al cerrar la sesión
+API_PAYMENT_METHOD_NAME = 'Ecommerce API'
+
+
+class PosSession(models.Model):
+    _inherit = 'pos.session'
+
+    api_managed = fields.Boolean(string='Gestionada por la API', index=True, readonly=True, copy=False)
+    api_pos_name = fields.Char(string='Punto de Venta API', index=True, readonly=True, copy=False)
+    api_retired = fields.Boolean(
+        string='Rotada', readonly=True, copy=False,
+        help="La sesión fue reemplazada por una sucesora y ya no recibe órdenes; queda pendiente de cierre.",
+    )
+
+    # Progreso del cierre por bloques en segundo plano
+    api_close_state = fields.Selection([
+        ('orders', 'Procesando Órdenes'),
+        ('closing', 'Cerrando Sesión'),
+        ('done', 'Cerrada'),
+        ('failed', 'Error'),
+    ], string='Estado del Cierre', readonly=True, copy=False)
+    api_close_last_order_id = fields.Integer(string='Última Orden Procesada', readonly=True, copy=False)
+    api_close_processed = fields.Integer(string='Órdenes Procesadas', readonly=True, copy=False)
+    api_close_started_at = fields.Datetime(string='Inicio del Cierre', readonly=True, copy=False)
+    api_close_error = fields.Text(string='Error del Cierre', readonly=True, copy=False)
+    api_close_final_seconds = fields.Float(string='Duración del Cierre Contable (s)', readonly=True, copy=False)
+
+    @api.constrains('config_id')
+    def _check_pos_config(self):
+        """
+        Las sesiones de la API pueden convivir con una sesión rotada que todavía
+        se está cerrando; para el resto se mantiene la validación estándar.
+        """
+        api_sessions = self.filtered('api_managed')
+        super(PosSession, self - api_sessions)._check_pos_config()
+        for session in api_sessions:
+            if self.search_count([
+                ('state', '!=', 'closed'),
+                ('config_id', '=', session.config_id.id),
+                ('rescue', '=', False),
+                ('api_retired', '=', False),
+            ]) > 1:
+                raise ValidationError(_("Another session is already opened for this point of sale."))
+
+    @api.model
+    def _get_rotation_limits(self):
+        ICP = self.env['ir.config_parameter'].sudo()
+        try:
+            max_hours = float(ICP.get_param('pos_order_api.session_rotation_hours', '24'))
+        except ValueError:
+            max_hours = 24.0
+        try:
+            max_orders = int(ICP.get_param('pos_order_api.session_rotation_max_orders', '5000'))
+        except ValueError:
+            max_orders = 5000
+        return max_hours, max_orders
+
+    @api.model
+    def cron_rotate_api_sessions(self):
+        """
+        Rota la sesión de la API de cada punto de venta cuando supera la ventana
+        de tiempo o el número de órdenes configurados. La sucesora se abre en la
+        misma transacción en que la sesión anterior deja de recibir órdenes, y
+        el cierre de la anterior queda para el cron de cierre en segundo plano.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        if ICP.get_param('pos_order_api.session_rotation', 'True').lower() != 'true':
+            return
+
+        max_hours, max_orders = self._get_rotation_limits()
+        sessions = self.sudo().search([
+            ('api_managed', '=', True),
+            ('api_retired', '=', False),
+            ('state', '=', 'opened'),
+        ])
+        if not sessions:
+            return
+
+        self.env.cr.execute("""
+            SELECT session_id, count(*)
+              FROM pos_order
+             WHERE session_id IN %s
+          GROUP BY session_id
+        """, (tuple(sessions.ids),))
+        order_counts = dict(self.env.cr.fetchall())
+
+        deadline = fields.Datetime.now() - timedelta(hours=max_hours)
+        for session in sessions:
+            order_count = order_counts.get(session.id, 0)
+            too_old = max_hours > 0 and session.start_at and session.start_at <= deadline
+            too_big = max_orders > 0 and order_count >= max_orders
+            if not (too_old or too_big):
+                continue
+
+            try:
+                with self.env.cr.savepoint():
+                    successor = session._rotate_api_session()
+                self.env.cr.commit()
+                _logger.info(
+                    "Sesión %s de '%s' rotada con %s órdenes; nueva sesión %s",
+                    session.id, session.api_pos_name, order_count, successor.id,
+                )
+            except Exception as e:
+                _logger.error("Error al rotar la sesión %s: %s", session.id, e)
+
+    def _rotate_api_session(self):
+        """
+        Retira esta sesión y abre su sucesora para el mismo punto de venta.
+
+        Returns:
+            pos.session: la sesión sucesora
+        """
+        self.ensure_one()
+        self.write({'api_retired': True})
+        successor = self.create({
+            'user_id': self.user_id.id,
+            'config_id': self.config_id.id,
+            'api_managed': True,
+            'api_pos_name': self.api_pos_name,
+        })
+        successor.action_pos_session_open()
+        return successor
+
+    def action_api_close_in_background(self):
+        """
+        Encola el cierre de sesiones de la API: dejan de recibir órdenes
+        y el cron de cierre las procesa por bloques.
+        """
+        self.filtered(lambda s: s.api_managed and s.state != 'closed').write({'api_retired': True})
+        cron = self.env.ref(f'{MODULE_NAME}.cron_close_retired_api_sessions', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+        return True
+
+    @api.model
+    def cron_close_retired_api_sessions(self):
+        """
+        Cierra en segundo plano las sesiones de la API ya rotadas, procesando
+        sus órdenes por bloques de tamaño fijo con un commit por bloque.
+        Si el tiempo asignado se agota, el cron se vuelve a programar y la
+        siguiente ejecución continúa desde el último bloque confirmado.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        try:
+            chunk_size = int(ICP.get_param('pos_order_api.close_chunk_size', '200'))
+            time_budget = float(ICP.get_param('pos_order_api.close_time_budget', '240'))
+        except ValueError:
+            chunk_size, time_budget = 200, 240.0
+        deadline = time.monotonic() + time_budget
+
+        sessions = self.sudo().search([
+            ('api_managed', '=', True),
+            ('api_retired', '=', True),
+            ('state', '!=', 'closed'),
+        ], order='id')
+
+        for session in sessions:
+            try:
+                finished = session._api_close_in_chunks(chunk_size, deadline, final_budget=time_budget / 2)
+            except Exception as e:
+                self.env.cr.rollback()
+                _logger.error("Error al cerrar la sesión rotada %s: %s", session.id, e)
+                session.write({'api_close_state': 'failed', 'api_close_error': str(e)})
+                self.env.cr.commit()
+                continue
+
+            if not finished:
+                # Tiempo agotado: continuar en una nueva ejecución del cron
+                cron = self.env.ref(f'{MODULE_NAME}.cron_close_retired_api_sessions', raise_if_not_found=False)
+                if cron:
+                    cron._trigger()
+                self.env.cr.commit()
+                return
+
+    def _api_close_in_chunks(self, chunk_size, deadline, final_budget=0.0):
+        """
+        Procesa las órdenes en borrador de la sesión por bloques (pago con el
+        método de la API, estado pagado y picking) y, al terminar, cierra la
+        sesión. El progreso se confirma después de cada bloque.
+
+        El cierre contable final sigue siendo una sola transacción de Odoo y no
+        se puede partir: solo empieza si quedan al menos final_budget segundos,
+        y su duración se guarda en api_close_final_seconds.
+
+        Returns:
+            bool: True si la sesión quedó cerrada, False si se agotó el tiempo
+        """
+        self.ensure_one()
+        if self.api_close_state in (False, 'failed'):
+            # Un reintento tras un error revisa de nuevo todas las órdenes en borrador
+            # Con el stock actualizado al cierre, Odoo crea todos los pickings de
+            # la sesión dentro del cierre contable; en tiempo real, cada bloque
+            # crea los de sus órdenes y el cierre final solo genera el asiento
+            self.write({
+                'api_close_state': 'orders',
+                'api_close_last_order_id': 0,
+                'api_close_processed': 0,
+                'api_close_started_at': fields.Datetime.now(),
+                'api_close_error': False,
+                'update_stock_at_closing': False,
+            })
+            self.env.cr.commit()
+
+        payment_method = self._get_api_payment_method()
+        PosOrder = self.env['pos.order'].sudo()
+        swept = False
+
+        while self.api_close_state == 'orders':
+            if time.monotonic() > deadline:
+                return False
+
+            chunk_started = time.monotonic()
+            orders = PosOrder.search([
+                ('session_id', '=', self.id),
+                ('state', '=', 'draft'),
+                ('id', '>', self.api_close_last_order_id),
+            ], order='id', limit=chunk_size)
+
+            if not orders:
+                # Una orden en vuelo al rotar la sesión puede confirmarse con un id
+                # menor que el cursor: se repasa una vez desde el principio
+                if not swept and self.api_close_last_order_id and PosOrder.search_count([
+                    ('session_id', '=', self.id),
+                    ('state', '=', 'draft'),
+                ], limit=1):
+                    swept = True
+                    self.write({'api_close_last_order_id': 0})
+                    self.env.cr.commit()
+                    continue
+                self.write({'api_close_state': 'closing'})
+                self.env.cr.commit()
+                break
+
+            for order in orders:
+                pending = order.amount_total - sum(order.payment_ids.mapped('amount'))
+                if pending:
+                    order.add_payment({
+                        'pos_order_id': order.id,
+                        'amount': pending,
+                        'payment_date': fields.Datetime.now(),
+                        'payment_method_id': payment_method.id,
+                    })
+                order.action_pos_order_paid()
+                order._create_order_picking()
+
+            self.write({
+                'api_close_last_order_id': orders[-1].id,
+                'api_close_processed': self.api_close_processed + len(orders),
+            })
+            self.env.cr.commit()
+
+            elapsed = time.monotonic() - chunk_started
+            _logger.info(
+                "Cierre de sesión %s: %s órdenes en %.1f s (%.0f órdenes/s, %s en total)",
+                self.id, len(orders), elapsed, len(orders) / elapsed if elapsed else 0, self.api_close_processed,
+            )
+
+        if deadline - time.monotonic() < final_budget:
+            # Se deja el cierre contable para una ejecución con tiempo suficiente
+            return False
+
+        # Cierre contable de la sesión con todas las órdenes ya pagadas
+        final_started = time.monotonic()
+        self.action_pos_session_closing_control()
+        if self.state != 'closed':
+            self.action_pos_session_close()
+
+        final_seconds = time.monotonic() - final_started
+        self.write({'api_close_state': 'done', 'api_close_final_seconds': final_seconds})
+        self.env.cr.commit()
+        _logger.info(
+            "Cierre contable de la sesión %s: %.1f s para %s órdenes",
+            self.id, final_seconds, self.api_close_processed,
+        )
+
+        total_seconds = (fields.Datetime.now() - self.api_close_started_at).total_seconds() if self.api_close_started_at else 0
+        _logger.info(
+            "Sesión rotada %s cerrada: %s órdenes en %.0f s (%.1f órdenes/s)",
+            self.id, self.api_close_processed, total_seconds,
+            self.api_close_processed / total_seconds if total_seconds else 0,
+        )
+        return True
+
+    def _get_api_payment_method(self):
+        """
+        Devuelve el método de pago con el que se liquidan las órdenes de la API
+        al cerrar la sesión, creándolo y vinculándolo al punto de venta si falta.
+        """
+        self.ensure_one()
+        config = self.config_id
+        method = config.payment_method_ids.filtered(lambda m: m.name == API_PAYMENT_METHOD_NAME)[:1]
+        if method:
+            return method
+
+        journal = self.env['account.journal'].sudo().search([
+            ('type', '=', 'bank'),
+            ('company_id', '=', config.company_id.id),
+        ], limit=1)
+        # Se vincula desde el método de pago: pos.config no permite cambiar sus
+        # métodos de pago con sesiones abiertas, pero un método nuevo no tiene ninguna
+        method = self.env['pos.payment.method'].sudo().create({
+            'name': API_PAYMENT_METHOD_NAME,
+            'journal_id': journal.id or False,
+            'company_id': config.company_id.id,
+            'config_ids': [(4, config.id)],
+        })
+        _logger.info("Método de pago '%s' creado para el punto de venta %s", API_PAYMENT_METHOD_NAME, config.name)
+        return method
@@ -0,0 +1,47 @@
+from odoo import models
+from ..tools.api_caches import product_cache, quote_cache
+
+# La API solo crea y busca productos con este sufijo (ver _get_or_create_product)
+API_PRODUCT_SUFFIX = ' D'
+
+
+def _is_api_name(name):
+    return bool(name) and name.endswith(API_PRODUCT_SUFFIX)
+
+
+class ProductTemplate(models.Model):
+    _inherit = 'product.template'
+
+    def write(self, vals):
+        # Solo los productos con sufijo 'D' (antes o después del cambio) están en la caché
+        cached = bool({'name', 'active', 'company_id'} & set(vals)) and (
+            _is_api_name(vals.get('name')) or any(_is_api_name(name) for name in self.mapped('name'))
+        )
+        res = super().write(vals)
+        # Un cambio de nombre, de compañía o el archivado deja obsoleta la caché de productos
+        if cached:
+            product_cache.clear(self.env)
+            quote_cache.clear(self.env)
+        return res
+
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+
+    def write(self, vals):
+        cached = bool({'name', 'active', 'company_id'} & set(vals)) and (
+            _is_api_name(vals.get('name')) or any(_is_api_name(name) for name in self.mapped('name'))
+        )
+        res = super().write(vals)
+        if cached:
+            product_cache.clear(self.env)
+            quote_cache.clear(self.env)
+        return res
+
+    def unlink(self):
+        cached = any(_is_api_name(name) for name in self.mapped('name'))
+        res = super().unlink()
+        if cached:
+            product_cache.clear(self.env)
+            quote_cache.clear(self.env)
+        return res
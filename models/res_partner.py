@@ -0,0 +1,276 @@
+from odoo import models, api, fields
+from odoo.tools import email_normalize
+from ..tools.api_caches import partner_cache
+from ..tools.request_context import get_logger
+from psycopg2 import errors
+import re
+
+_logger = get_logger(__name__)
+
+# Campo indexado de res.partner para cada tipo de clave de identidad
+IDENTITY_FIELDS = {
+    'external_id': 'api_external_id',
+    'email': 'api_email_key',
+    'phone': 'api_phone_key',
+}
+
+
+def normalize_phone(phone):
+    """
+    Deja solo los dígitos del teléfono; los valores demasiado cortos se descartan
+    """
+    digits = re.sub(r'\D', '', phone or '')
+    return digits if len(digits) >= 7 else False
+
+
+def customer_identity(customer):
+    """
+    Devuelve la clave de identidad más fuerte del cliente: (tipo, valor normalizado).
+    Prioridad: external_id, email, teléfono.
+    """
+    if not customer:
+        return None
+    if customer.get('external_id'):
+        return ('external_id', str(customer['external_id']).strip())
+    email = email_normalize(customer.get('email') or '')
+    if email:
+        return ('email', email)
+    phone = normalize_phone(customer.get('phone'))
+    if phone:
+        return ('phone', phone)
+    return None
+
+
+class ResPartner(models.Model):
+    _inherit = 'res.partner'
+
+    api_external_id = fields.Char(string='ID Externo (API)', index=True, copy=False)
+    api_email_key = fields.Char(compute='_compute_api_identity_keys', store=True, index=True)
+    api_phone_key = fields.Char(compute='_compute_api_identity_keys', store=True, index=True)
+
+    def init(self):
+        """
+        Un api_external_id identifica a un solo cliente por compañía (los
+        compartidos cuentan como una compañía más). Si ya hay duplicados el
+        índice no se crea y se avisa en el log, como con _sql_constraints.
+        """
+        super().init()
+        cr = self.env.cr
+        cr.execute("SELECT 1 FROM pg_indexes WHERE indexname = 'res_partner_api_external_id_uniq'")
+        if cr.fetchone():
+            return
+        cr.execute("""
+            SELECT api_external_id, COALESCE(company_id, 0)
+              FROM res_partner
+             WHERE api_external_id IS NOT NULL
+          GROUP BY 1, 2
+            HAVING count(*) > 1
+             LIMIT 1
+        """)
+        duplicate = cr.fetchone()
+        if duplicate:
+            _logger.warning(
+                "No se crea el índice único de api_external_id: hay clientes duplicados (por ejemplo '%s')",
+                duplicate[0],
+            )
+            return
+        cr.execute("""
+            CREATE UNIQUE INDEX res_partner_api_external_id_uniq
+                ON res_partner (api_external_id, COALESCE(company_id, 0))
+             WHERE api_external_id IS NOT NULL
+        """)
+
+    @api.depends('email', 'phone', 'mobile')
+    def _compute_api_identity_keys(self):
+        for partner in self:
+            partner.api_email_key = email_normalize(partner.email or '') or False
+            partner.api_phone_key = normalize_phone(partner.phone) or normalize_phone(partner.mobile)
+
+    @api.model
+    def _pos_api_resolve_customers(self, customers, company_id=False):
+        """
+        Resuelve una lista de clientes del payload a ids de res.partner.
+        Primero la caché del worker, luego una búsqueda indexada por tipo de
+        clave para todos los pendientes y, al final, un solo create para los
+        clientes desconocidos.
+
+        Args:
+            customers: lista de dicts con external_id, email, phone y name
+            company_id: compañía de la marca; se buscan sus clientes y los
+                        compartidos, y los nuevos se crean en ella
+
+        Returns:
+            list: id de partner (o False si el cliente no trae identidad) por cada cliente
+        """
+        identities = [customer_identity(customer) for customer in customers]
+        resolved = {}
+
+        # 1. Caché del worker
+        pending = {}
+        for identity in identities:
+            if identity is None or identity in resolved:
+                continue
+            partner_id = partner_cache.get(self.env, (company_id,) + identity, None)
+            if partner_id:
+                resolved[identity] = partner_id
+            else:
+                pending.setdefault(identity[0], set()).add(identity[1])
+
+        # 2. Una búsqueda indexada por tipo de clave, con los external_id
+        #    desconocidos ya bloqueados para que nadie más los cree a la vez
+        if pending.get('external_id'):
+            self._pos_api_lock_external_ids(pending['external_id'], company_id)
+        Partner = self.sudo().with_context(active_test=True)
+        for kind, values in pending.items():
+            field_name = IDENTITY_FIELDS[kind]
+            domain = [(field_name, 'in', list(values))]
+            if company_id:
+                domain.append(('company_id', 'in', [company_id, False]))
+            for row in Partner.search_read(domain, [field_name], order='company_id, id'):
+                identity = (kind, row[field_name])
+                if identity not in resolved:
+                    resolved[identity] = row['id']
+                    partner_cache.set(self.env, (company_id,) + identity, row['id'])
+
+        # 3. Crear en bloque los clientes desconocidos
+        to_create = {}
+        for identity, customer in zip(identities, customers):
+            if identity is None or identity in resolved or identity in to_create:
+                continue
+            email = email_normalize(customer.get('email') or '') or False
+            to_create[identity] = {
+                'name': customer.get('name') or email or customer.get('phone') or 'Cliente Ecommerce API',
+                'email': customer.get('email') or False,
+                'phone': customer.get('phone') or False,
+                'api_external_id': customer.get('external_id') and str(customer['external_id']).strip(),
+                'customer_rank': 1,
+                'is_company': False,
+                'company_id': company_id,
+            }
+
+        if to_create:
+            created = self._pos_api_create_customers(to_create, company_id)
+            resolved.update(created)
+
+            # Los ids recién creados se cachean solo si la transacción se confirma
+            for identity, partner_id in created.items():
+                partner_cache.set(self.env, (company_id,) + identity, partner_id, deferred=True)
+
+        return [resolved.get(identity, False) if identity else False for identity in identities]
+
+    @api.model
+    def _pos_api_lock_external_ids(self, external_ids, company_id=False):
+        """
+        Toma un advisory lock de transacción por (compañía, api_external_id),
+        en orden para no provocar deadlocks entre peticiones. Dos peticiones
+        con el mismo cliente nuevo ya no lo crean a la vez: la segunda espera
+        a que la primera termine.
+
+        La instantánea de la transacción (REPEATABLE READ) es anterior a la
+        espera, así que la segunda no vería al cliente recién confirmado: si
+        tuvo que esperar, aborta con un error de serialización de PostgreSQL.
+
+        Raises:
+            SerializationFailure: con pgcode 40001; Odoo reintenta la petición
+                completa y la ingesta diferida reintenta la orden
+        """
+        cr = self.env.cr
+        waited = False
+        for external_id in sorted(external_ids):
+            key = f"res.partner.api_external_id:{company_id or 0}:{external_id}"
+            cr.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s))", (key,))
+            if not cr.fetchone()[0]:
+                cr.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (key,))
+                waited = True
+        if waited:
+            self._pos_api_serialization_failure()
+
+    @api.model
+    def _pos_api_serialization_failure(self):
+        """
+        Aborta la transacción con un error de serialización generado por
+        PostgreSQL, que lleva el pgcode que Odoo reconoce para reintentar
+        """
+        self.env.cr.execute("""
+            DO $$
+            BEGIN
+                RAISE EXCEPTION USING
+                    ERRCODE = 'serialization_failure',
+                    MESSAGE = 'Cliente de la API creado por otra transacción';
+            END
+            $$
+        """)
+
+    @api.model
+    def _pos_api_create_customers(self, to_create, company_id=False):
+        """
+        Crea en un solo create los clientes desconocidos. Si el índice único
+        rechaza un api_external_id, el cliente ya existe (por ejemplo,
+        archivado): se relee en lugar de crearlo.
+
+        Args:
+            to_create: dict identidad -> valores de create
+
+        Returns:
+            dict: identidad -> id de partner
+
+        Raises:
+            SerializationFailure: con pgcode 40001, si el cliente lo confirmó
+                otra transacción después de la instantánea de esta (ver
+                _pos_api_lock_external_ids)
+        """
+        Partner = self.sudo()
+        try:
+            with self.env.cr.savepoint():
+                created = dict(zip(to_create, Partner.create(list(to_create.values())).ids))
+            _logger.info("%s clientes nuevos creados desde la API", len(created))
+            return created
+        except errors.UniqueViolation:
+            pass
+
+        external_ids = [value for kind, value in to_create if kind == 'external_id']
+        domain = [('api_external_id', 'in', external_ids)]
+        if company_id:
+            domain.append(('company_id', 'in', [company_id, False]))
+        existing = {}
+        for row in Partner.with_context(active_test=False).search_read(domain, ['api_external_id'], order='company_id, id'):
+            existing.setdefault(('external_id', row['api_external_id']), row['id'])
+
+        remaining = {identity: vals for identity, vals in to_create.items() if identity not in existing}
+        try:
+            with self.env.cr.savepoint():
+                created = dict(zip(remaining, Partner.create(list(remaining.values())).ids))
+        except errors.UniqueViolation:
+            # La fila existe pero no es visible en la instantánea de esta transacción
+            self._pos_api_serialization_failure()
+        _logger.info(
+            "%s clientes nuevos creados desde la API (%s ya existían)", len(created), len(existing),
+        )
+        return {**existing, **created}
+
+    def _pos_api_cached(self):
+        """
+        Indica si alguno de los clientes puede estar en la caché de la API:
+        solo se cachean los que tienen alguna clave de identidad
+        """
+        return any(
+            partner.api_external_id or partner.api_email_key or partner.api_phone_key
+            for partner in self.sudo().with_context(active_test=False)
+        )
+
+    def write(self, vals):
+        if not {'email', 'phone', 'mobile', 'api_external_id', 'active', 'company_id'} & set(vals):
+            return super().write(vals)
+        # Antes o después del cambio: un cliente puede entrar o salir de la caché
+        cached = self._pos_api_cached()
+        res = super().write(vals)
+        if cached or self._pos_api_cached():
+            partner_cache.clear(self.env)
+        return res
+
+    def unlink(self):
+        cached = self._pos_api_cached()
+        res = super().unlink()
+        if cached:
+            partner_cache.clear(self.env)
+        return res
@@ -1,7 +1,14 @@
 from odoo import models, api, fields
-import logging
+from .pos_session import MODULE_NAME
+from ..tools.request_context import get_logger
+import time
+
+_logger = get_logger(__name__)
+
+# Cursores de reanudación (último id de usuario procesado) de cada cron
+RESTORE_CURSOR_PARAM = 'pos_order_api.permission_restore_cursor'
+AUTO_ASSIGN_CURSOR_PARAM = 'pos_order_api.auto_assign_cursor'
 
-_logger = logging.getLogger(__name__)
 
 class ResUsers(models.Model):
     _inherit = 'res.users'
@@ -10,120 +17,185 @@ class ResUsers(models.Model):
     def restore_pos_permissions(self):
         """
         Restaura los permisos de POS para usuarios que los han perdido
-        Se ejecuta automáticamente al iniciar el módulo
+        Se ejecuta automáticamente al iniciar el módulo y cada hora por cron,
+        por bloques de usuarios con un commit por bloque
         """
         try:
-            _logger.info("Iniciando restauración de permisos de POS...")
-            
             # Obtener el grupo de manager de POS
             pos_manager_group = self.env.ref('point_of_sale.group_pos_manager', raise_if_not_found=False)
             pos_user_group = self.env.ref('point_of_sale.group_pos_user', raise_if_not_found=False)
             # Intentar obtener el grupo de ventas (puede no estar disponible en todas las versiones)
-            try:
-                sales_user_group = self.env.ref('sales_team.group_sale_salesman', raise_if_not_found=False)
-            except:
-                try:
-                    sales_user_group = self.env.ref('sale.group_sale_salesman', raise_if_not_found=False)
-                except:
-                    sales_user_group = None
-                    _logger.info("Grupo de ventas no encontrado, continuando sin él")
-            
+            sales_user_group = (
+                self.env.ref('sales_team.group_sale_salesman', raise_if_not_found=False)
+                or self.env.ref('sale.group_sale_salesman', raise_if_not_found=False)
+            )
+            if not sales_user_group:
+                _logger.debug("Grupo de ventas no encontrado, continuando sin él")
+
             if not pos_manager_group:
                 _logger.warning("Grupo 'point_of_sale.group_pos_manager' no encontrado")
                 return
-            
-            # Restaurar permisos del administrador
-            admin_user = self.env.ref('base.user_admin', raise_if_not_found=False)
-            if admin_user:
-                admin_user.sudo().write({
-                    'groups_id': [(4, pos_manager_group.id)]
-                })
-                if pos_user_group:
-                    admin_user.sudo().write({
-                        'groups_id': [(4, pos_user_group.id)]
-                    })
-                if sales_user_group:
+
+            ICP = self.env['ir.config_parameter'].sudo()
+
+            # Restaurar permisos del administrador al comenzar cada pasada
+            if self._get_resume_cursor(RESTORE_CURSOR_PARAM) == 0:
+                _logger.info("Iniciando restauración de permisos de POS...")
+                admin_user = self.env.ref('base.user_admin', raise_if_not_found=False)
+                if admin_user:
+                    admin_groups = pos_manager_group
+                    for group in (pos_user_group, sales_user_group):
+                        if group:
+                            admin_groups |= group
                     admin_user.sudo().write({
-                        'groups_id': [(4, sales_user_group.id)]
+                        'groups_id': [(4, group.id) for group in admin_groups]
                     })
-                _logger.info(f"Permisos de POS restaurados para usuario administrador")
-            
-            # Buscar todos los usuarios activos y restaurar permisos básicos de POS
-            active_users = self.search([('active', '=', True), ('share', '=', False)])
-            
-            users_updated = 0
-            for user in active_users:
-                try:
-                    # Asignar grupo básico de POS si el usuario puede acceder
-                    if pos_user_group and not user.has_group('point_of_sale.group_pos_user'):
-                        user.sudo().write({
-                            'groups_id': [(4, pos_user_group.id)]
-                        })
-                        users_updated += 1
-                        _logger.info(f"Permisos básicos de POS asignados a usuario: {user.name}")
-                        
-                except Exception as e:
-                    _logger.warning(f"No se pudieron restaurar permisos para usuario {user.name}: {str(e)}")
-            
-            _logger.info(f"Restauración de permisos completada. {users_updated} usuarios actualizados.")
-            
-            # Guardar parámetro de configuración para marcar que se ejecutó
-            self.env['ir.config_parameter'].sudo().set_param(
-                'pos_order_api.last_permission_restore', 
-                fields.Datetime.now()
+                    _logger.info("Permisos de POS restaurados para usuario administrador")
+
+            # Restaurar permisos básicos de POS a los usuarios activos, por bloques
+            if not pos_user_group:
+                return
+            finished, processed, updated = self._assign_groups_in_chunks(
+                pos_user_group.ids, RESTORE_CURSOR_PARAM, 'cron_restore_pos_permissions'
             )
-            
+
+            if finished:
+                _logger.info("Restauración de permisos completada. %s usuarios revisados, %s actualizados.", processed, updated)
+                # Guardar parámetro de configuración para marcar que se ejecutó
+                ICP.set_param('pos_order_api.last_permission_restore', fields.Datetime.now())
+            else:
+                _logger.info("Restauración de permisos pausada: %s usuarios revisados, %s actualizados; continúa en otra ejecución", processed, updated)
+
         except Exception as e:
-            _logger.error(f"Error durante la restauración de permisos de POS: {str(e)}")
+            _logger.error("Error durante la restauración de permisos de POS: %s", e)
+
+    @api.model
+    def _get_required_pos_group_ids(self):
+        """
+        Grupos de POS que se auto-asignan a los usuarios internos
+        """
+        groups = self.env.ref('point_of_sale.group_pos_user', raise_if_not_found=False)
+        sales_group = (
+            self.env.ref('sales_team.group_sale_salesman', raise_if_not_found=False)
+            or self.env.ref('sale.group_sale_salesman', raise_if_not_found=False)
+        )
+        if sales_group:
+            groups = groups | sales_group if groups else sales_group
+        else:
+            _logger.debug("Grupo de ventas no disponible para auto-asignación")
+        return groups.ids if groups else []
 
     @api.model
     def _auto_assign_pos_groups(self):
         """
-        Auto-asigna grupos de POS a usuarios que los necesiten
+        Auto-asigna grupos de POS a usuarios que los necesiten, por bloques
+        de usuarios con un commit por bloque
         """
         try:
             auto_assign = self.env['ir.config_parameter'].sudo().get_param(
                 'pos_order_api.auto_assign_groups', 'True'
             )
-            
+
             if auto_assign.lower() != 'true':
                 return
-            
-            # Grupos necesarios para POS (solo los que sabemos que existen)
-            required_groups = [
-                'point_of_sale.group_pos_user',
-            ]
-            
-            # Intentar agregar grupo de ventas si está disponible
-            try:
-                sales_group = self.env.ref('sales_team.group_sale_salesman', raise_if_not_found=False)
-                if not sales_group:
-                    sales_group = self.env.ref('sale.group_sale_salesman', raise_if_not_found=False)
-                if sales_group:
-                    required_groups.append('sales_team.group_sale_salesman')
-            except:
-                _logger.info("Grupo de ventas no disponible para auto-asignación")
-            
-            # Usuarios internos activos
-            internal_users = self.search([
-                ('active', '=', True),
-                ('share', '=', False)
-            ])
-            
-            for user in internal_users:
-                for group_xml_id in required_groups:
-                    try:
-                        group = self.env.ref(group_xml_id, raise_if_not_found=False)
-                        if group and not user.has_group(group_xml_id):
-                            user.sudo().write({
-                                'groups_id': [(4, group.id)]
-                            })
-                            _logger.info(f"Grupo {group_xml_id} asignado a usuario {user.name}")
-                    except Exception as e:
-                        _logger.warning(f"Error asignando grupo {group_xml_id} a {user.name}: {str(e)}")
-                        
+
+            group_ids = self._get_required_pos_group_ids()
+            if not group_ids:
+                return
+
+            finished, processed, updated = self._assign_groups_in_chunks(
+                group_ids, AUTO_ASSIGN_CURSOR_PARAM, 'cron_auto_assign_pos_groups'
+            )
+            _logger.info(
+                "Auto-asignación de grupos %s: %s usuarios revisados, %s asignaciones",
+                "completada" if finished else "pausada", processed, updated,
+            )
+
         except Exception as e:
-            _logger.error(f"Error en auto-asignación de grupos: {str(e)}")
+            _logger.error("Error en auto-asignación de grupos: %s", e)
+
+    @api.model
+    def _get_resume_cursor(self, cursor_param):
+        try:
+            return int(self.env['ir.config_parameter'].sudo().get_param(cursor_param, '0'))
+        except ValueError:
+            return 0
+
+    @api.model
+    def _assign_groups_in_chunks(self, group_ids, cursor_param, cron_xmlid):
+        """
+        Asigna los grupos a los usuarios internos activos que no los tienen,
+        recorriéndolos por id en bloques de tamaño fijo. Tras cada bloque se
+        hace commit, de modo que los bloqueos sobre res_groups_users_rel duran
+        solo un bloque. Si se agota el tiempo, se guarda el cursor y el cron
+        se vuelve a programar para continuar desde ahí.
+
+        El cursor se guarda solo al detenerse: cada set_param invalida las
+        cachés del registro en todos los workers. Si el proceso muere a mitad
+        de la pasada, se repiten a lo sumo los bloques de esta ejecución, y
+        asignar un grupo que el usuario ya tiene no cambia nada.
+
+        Durante la carga del registro (instalación o actualización) no se hace
+        commit ni se limita el tiempo: la pasada se completa en la transacción
+        de la instalación.
+
+        Returns:
+            tuple: (pasada completa, usuarios revisados, asignaciones hechas)
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        try:
+            chunk_size = int(ICP.get_param('pos_order_api.permission_chunk_size', '500'))
+            time_budget = float(ICP.get_param('pos_order_api.permission_time_budget', '60'))
+        except ValueError:
+            chunk_size, time_budget = 500, 60.0
+        chunk_size = max(chunk_size, 1)
+
+        can_commit = self.env.registry.ready
+        deadline = time.monotonic() + time_budget
+        cursor = self._get_resume_cursor(cursor_param)
+        Users = self.sudo()
+        processed = updated = 0
+
+        while True:
+            users = Users.search([
+                ('active', '=', True),
+                ('share', '=', False),
+                ('id', '>', cursor),
+            ], order='id', limit=chunk_size)
+
+            if not users:
+                # Pasada completa: la siguiente ejecución empieza de nuevo
+                ICP.set_param(cursor_param, '0')
+                if can_commit:
+                    self.env.cr.commit()
+                return True, processed, updated
+
+            for group_id in group_ids:
+                missing = Users.search([('id', 'in', users.ids), ('groups_id', 'not in', [group_id])])
+                if missing:
+                    missing.write({'groups_id': [(4, group_id)]})
+                    updated += len(missing)
+                    _logger.debug("Grupo %s asignado a %s usuarios: %s", group_id, len(missing), missing.ids)
+
+            cursor = users[-1].id
+            processed += len(users)
+
+            if not can_commit:
+                continue
+            self.env.cr.commit()
+
+            if time.monotonic() > deadline:
+                remaining = Users.search_count([('active', '=', True), ('share', '=', False), ('id', '>', cursor)])
+                IrCron = self.env['ir.cron']
+                if hasattr(IrCron, '_notify_progress'):
+                    IrCron._notify_progress(done=processed, remaining=remaining)
+                if remaining:
+                    ICP.set_param(cursor_param, str(cursor))
+                    cron = self.env.ref(f'{MODULE_NAME}.{cron_xmlid}', raise_if_not_found=False)
+                    if cron:
+                        cron._trigger()
+                    self.env.cr.commit()
+                    return False, processed, updated
 
     @api.model
     def create(self, vals):
@@ -131,11 +203,17 @@ class ResUsers(models.Model):
         Override para asignar automáticamente grupos de POS a nuevos usuarios
         """
         user = super(ResUsers, self).create(vals)
-        
-        # Auto-asignar grupos si está habilitado
+
+        # Auto-asignar grupos si está habilitado (solo al usuario nuevo)
         try:
-            self._auto_assign_pos_groups()
+            auto_assign = self.env['ir.config_parameter'].sudo().get_param(
+                'pos_order_api.auto_assign_groups', 'True'
+            )
+            if auto_assign.lower() == 'true' and not user.share:
+                group_ids = self._get_required_pos_group_ids()
+                if group_ids:
+                    user.sudo().write({'groups_id': [(4, group_id) for group_id in group_ids]})
         except Exception as e:
-            _logger.warning(f"Error en auto-asignación para nuevo usuario: {str(e)}")
-        
-        return user 
\ No newline at end of file
+            _logger.warning("Error en auto-asignación para nuevo usuario: %s", e)
+
+        return user
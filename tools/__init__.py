@@ -0,0 +1,8 @@
+from . import cache
+from . import shared_cache
+from . import api_caches
+from . import request_context
+from . import traffic_capture
+from . import order_stream
+from . import circuit_breaker
+from . import image_resize
@@ -0,0 +1,36 @@
+from .cache import TTLCache
+from .shared_cache import SharedCache
+
+# Cachés de búsquedas compartidas entre workers: L1 en memoria del worker y
+# L2 en PostgreSQL. Las claves no incluyen la base de datos; la caché la
+# agrega a L1 y la tabla L2 es propia de cada base.
+
+# Las claves de productos, clientes, sesiones y cotizaciones empiezan por el id
+# de la compañía: cada marca tiene sus propias entradas.
+
+# (compañía, nombre del producto con sufijo 'D') -> product.product id
+product_cache = SharedCache('product', maxsize=10000, ttl=3600)
+
+# (compañía, tipo de clave, valor normalizado) -> res.partner id
+partner_cache = SharedCache('partner', maxsize=20000, ttl=3600)
+
+# (compañía, pos_name) -> pos.session id
+session_cache = SharedCache('session', maxsize=256, ttl=60)
+
+# (tipo de destinatarios,) -> lista de res.users ids
+recipient_cache = SharedCache('recipient', maxsize=16, ttl=300)
+
+# (compañía, hash del carrito normalizado) -> cotización calculada por /api/pos/quote.
+# Se invalida junto con product_cache, porque guarda los ids de producto resueltos.
+quote_cache = SharedCache('quote', maxsize=2000, ttl=600)
+
+# (prefijo de la API key,) -> datos de la clave verificada, o None si no existe.
+# Modificar o borrar una clave invalida la caché en todos los workers.
+api_key_cache = SharedCache('api_key', maxsize=512, ttl=60)
+
+# Cachés solo del worker. Las claves incluyen el nombre de la base de datos
+# porque un mismo servidor puede atender varias bases.
+
+# (db, compañía o False, referencia) -> id de datos de referencia (compañía, categoría,
+# UoM, lista de precios, compañía de un punto de venta)
+reference_cache = TTLCache(maxsize=256, ttl=3600)
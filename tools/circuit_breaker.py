@@ -0,0 +1,176 @@
+from .request_context import get_logger
+import collections
+import threading
+import time
+
+_logger = get_logger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Parámetros (ir.config_parameter) y sus valores por defecto
+DEFAULTS = {
+    # Llamadas recientes que se evalúan
+    'window': 20,
+    # Llamadas mínimas en la ventana antes de poder abrir el circuito
+    'min_calls': 5,
+    # Fracción de llamadas fallidas o lentas que abre el circuito
+    'failure_ratio': 0.5,
+    # Una llamada más lenta que esto cuenta como fallida
+    'latency_ms': 500.0,
+    # Segundos que el circuito queda abierto antes de probar de nuevo
+    'open_seconds': 30.0,
+}
+
+
+class CircuitOpenError(Exception):
+    """
+    La estrategia está desactivada temporalmente por su circuit breaker
+    """
+
+
+class _BreakerState:
+    def __init__(self, window):
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+        self.results = collections.deque(maxlen=window)
+        self.metrics = {
+            'calls': 0, 'failures': 0, 'slow': 0, 'rejected': 0, 'opened': 0, 'total_ms': 0.0,
+        }
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por proceso para una estrategia costosa (por ejemplo, una
+    notificación). Cuenta como fallo una excepción o una llamada más lenta que
+    el umbral de latencia:
+
+    - closed: las llamadas pasan; si la fracción de fallos de la ventana
+      supera el umbral, el circuito se abre.
+    - open: las llamadas se rechazan con CircuitOpenError, sin costo.
+    - half_open: pasado open_seconds, una sola llamada de prueba decide si el
+      circuito se cierra o vuelve a abrirse.
+
+    Los umbrales se leen de pos_order_api.breaker_<parámetro> y el estado se
+    lleva por base de datos.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def _settings(self, env):
+        ICP = env['ir.config_parameter'].sudo()
+        settings = {}
+        for key, default in DEFAULTS.items():
+            try:
+                settings[key] = type(default)(float(ICP.get_param(f'pos_order_api.breaker_{key}', default)))
+            except (TypeError, ValueError):
+                settings[key] = default
+        return settings
+
+    def _get_state(self, dbname, settings):
+        state = self._states.get(dbname)
+        if state is None or state.results.maxlen != settings['window']:
+            previous = state
+            state = self._states[dbname] = _BreakerState(max(settings['window'], 1))
+            if previous:
+                state.metrics = previous.metrics
+        return state
+
+    def _admit(self, dbname, settings):
+        """
+        Devuelve True si la llamada puede pasar (y si es la prueba de half_open)
+        """
+        with self._lock:
+            state = self._get_state(dbname, settings)
+            if state.state == OPEN and time.monotonic() - state.opened_at >= settings['open_seconds']:
+                state.state = HALF_OPEN
+                state.probing = False
+            if state.state == CLOSED:
+                return True
+            if state.state == HALF_OPEN and not state.probing:
+                state.probing = True
+                return True
+            state.metrics['rejected'] += 1
+            return False
+
+    def _record(self, dbname, settings, ok, duration_ms):
+        slow = ok and duration_ms > settings['latency_ms']
+        failed = not ok or slow
+        with self._lock:
+            state = self._get_state(dbname, settings)
+            metrics = state.metrics
+            metrics['calls'] += 1
+            metrics['total_ms'] += duration_ms
+            metrics['failures'] += not ok
+            metrics['slow'] += slow
+
+            if state.state == HALF_OPEN:
+                state.probing = False
+                if failed:
+                    self._open(state)
+                else:
+                    state.state = CLOSED
+                    state.results.clear()
+                    _logger.info("Circuit breaker '%s' cerrado tras una prueba correcta", self.name)
+                return
+
+            state.results.append(failed)
+            if (state.state == CLOSED and len(state.results) >= settings['min_calls']
+                    and sum(state.results) / len(state.results) >= settings['failure_ratio']):
+                self._open(state)
+
+    def _open(self, state):
+        state.state = OPEN
+        state.opened_at = time.monotonic()
+        state.results.clear()
+        state.metrics['opened'] += 1
+        _logger.warning("Circuit breaker '%s' abierto: la estrategia se omite temporalmente", self.name)
+
+    def call(self, env, func, *args, **kwargs):
+        """
+        Ejecuta func si el circuito lo permite. Las excepciones de func se
+        registran como fallos y se propagan.
+
+        Raises:
+            CircuitOpenError: si el circuito está abierto
+        """
+        dbname = env.cr.dbname
+        settings = self._settings(env)
+        if not self._admit(dbname, settings):
+            raise CircuitOpenError(self.name)
+
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self._record(dbname, settings, False, (time.perf_counter() - started) * 1000)
+            raise
+        self._record(dbname, settings, True, (time.perf_counter() - started) * 1000)
+        return result
+
+    def snapshot(self, dbname):
+        """
+        Estado y métricas del circuito en este proceso
+        """
+        with self._lock:
+            state = self._states.get(dbname)
+            if state is None:
+                return {'state': CLOSED, 'calls': 0}
+            metrics = dict(state.metrics)
+            calls = metrics['calls']
+            metrics['avg_ms'] = round(metrics.pop('total_ms') / calls, 1) if calls else 0.0
+            return dict(metrics, state=state.state, window_failures=sum(state.results))
+
+
+# Un circuit breaker por estrategia de notificación de create_pos_order.
+# La notificación simple (solo log) no lleva breaker: es el último recurso.
+notification_breakers = {
+    'all_pos_users': CircuitBreaker('all_pos_users'),
+    'ecommerce': CircuitBreaker('ecommerce'),
+    'message': CircuitBreaker('message'),
+}
@@ -0,0 +1,58 @@
+from PIL import Image, ImageOps
+import io
+
+# Campos de imagen de image.mixin y su tamaño máximo
+IMAGE_SIZES = {
+    'image_1920': 1920,
+    'image_1024': 1024,
+    'image_512': 512,
+    'image_256': 256,
+    'image_128': 128,
+}
+
+# Formatos que se conservan; el resto se guarda como PNG
+_KEEP_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
+
+def _encode(image, fmt):
+    output = io.BytesIO()
+    if fmt == 'JPEG':
+        image.convert('RGB').save(output, format='JPEG', quality=95, optimize=True)
+    else:
+        image.save(output, format=fmt, optimize=True)
+    return output.getvalue()
+
+
+def resize_variants(raw):
+    """
+    Genera las variantes de image.mixin de una imagen, con la misma regla
+    que Odoo: cada una cabe en su tamaño máximo conservando la proporción, y
+    una imagen que ya cabe se guarda sin recomprimir.
+
+    Se ejecuta en un proceso del pool: solo usa PIL y no importa Odoo.
+
+    Returns:
+        dict: {'variants': {campo: bytes}, 'zoomable': bool}
+    """
+    image = Image.open(io.BytesIO(raw))
+    fmt = image.format if image.format in _KEEP_FORMATS else 'PNG'
+    # exif_transpose puede devolver una copia aunque no rote: se mira la etiqueta Orientation
+    rotated = image.getexif().get(0x0112, 1) != 1
+    image = ImageOps.exif_transpose(image)
+    width, height = image.size
+
+    variants = {}
+    for field, size in IMAGE_SIZES.items():
+        if width <= size and height <= size:
+            # Ya cabe: la original (salvo que la orientación EXIF obligue a rotarla)
+            variants[field] = _encode(image, fmt) if rotated else raw
+            continue
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        variants[field] = _encode(resized, fmt)
+
+    return {
+        'variants': variants,
+        # Mismo criterio que image.mixin.can_image_1024_be_zoomed
+        'zoomable': width > 1024 or height > 1024,
+    }
@@ -0,0 +1,28 @@
+import json
+
+# Backend rápido opcional; si no está instalado se usa la librería estándar
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = 'orjson' if orjson else 'json'
+
+
+def loads(data):
+    """
+    Decodifica JSON directamente desde bytes, sin decodificar a str antes
+    """
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj):
+    """
+    Codifica a JSON y devuelve bytes UTF-8 listos para la respuesta HTTP.
+    Los valores no serializables (fechas, Decimal) se convierten a texto.
+    """
+    if orjson:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=str, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
@@ -0,0 +1,202 @@
+from odoo import sql_db
+from . import json_codec
+from .request_context import get_logger
+import collections
+import functools
+import itertools
+import odoo
+import os
+import selectors
+import threading
+import time
+
+_logger = get_logger(__name__)
+
+# Canal de PostgreSQL por el que se publican las órdenes confirmadas (todas las bases)
+CHANNEL = 'pos_order_api_orders'
+
+# Eventos recientes que se conservan por base para reanudar con Last-Event-ID
+RING_SIZE = 500
+
+# Segundos entre comentarios de keepalive en cada conexión SSE
+KEEPALIVE_INTERVAL = 25
+
+# Segundos máximos de espera del listener en cada select
+LISTEN_TIMEOUT = 50
+
+if odoo.evented:
+    import gevent.event
+    _Event = gevent.event.Event
+else:
+    _Event = threading.Event
+
+
+def publish(cr, dbname, event):
+    """
+    Publica una orden en el stream. El NOTIFY se envía recién después del
+    commit (una orden revertida nunca llega a las pantallas) y, como hace
+    bus.bus, por la base 'postgres': es la que escucha el dispatcher, y
+    PostgreSQL solo entrega un NOTIFY a los LISTEN de la misma base.
+    """
+    payloads = cr.postcommit.data.setdefault('pos_order_api.stream', [])
+    if not payloads:
+        cr.postcommit.add(functools.partial(_notify, payloads))
+    payloads.append(json_codec.dumps(dict(event, db=dbname)).decode('utf-8'))
+
+
+def _notify(payloads):
+    # La orden ya está confirmada: un error del aviso solo se registra
+    try:
+        with sql_db.db_connect('postgres').cursor() as cr:
+            for payload in payloads:
+                cr.execute("SELECT pg_notify(%s, %s)", (CHANNEL, payload))
+    except Exception:
+        _logger.exception("No se pudieron publicar %s órdenes en el stream", len(payloads))
+
+
+class OrderStreamDispatch(threading.Thread):
+    """
+    Un único LISTEN por proceso. Cada notificación se guarda en el anillo de
+    su base y despierta a las conexiones SSE abiertas: un reparto por orden,
+    sin importar cuántas pantallas haya conectadas.
+
+    Los ids de evento son '<arranque>-<secuencia>', con una secuencia por
+    base: tras reiniciar el proceso, un Last-Event-ID anterior ya no sirve y
+    el cliente debe recargar.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True, name=f'{__name__}.OrderStreamDispatch')
+        self.boot = f"{os.getpid():x}{int(time.time()):x}"
+        self._sequences = collections.defaultdict(lambda: itertools.count(1))
+        self._rings = collections.defaultdict(lambda: collections.deque(maxlen=RING_SIZE))
+        self._waiters = set()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def ensure_started(self):
+        with self._lock:
+            if not self._started:
+                self._started = True
+                self.start()
+
+    def subscribe(self):
+        event = _Event()
+        with self._lock:
+            self._waiters.add(event)
+        return event
+
+    def unsubscribe(self, event):
+        with self._lock:
+            self._waiters.discard(event)
+
+    def parse_event_id(self, event_id):
+        """
+        Devuelve la secuencia de un Last-Event-ID de este arranque, o None
+        """
+        boot, _sep, sequence = (event_id or '').partition('-')
+        if boot != self.boot or not sequence.isdigit():
+            return None
+        return int(sequence)
+
+    def events_after(self, dbname, sequence, pos_name=None):
+        """
+        Eventos de la base posteriores a sequence, opcionalmente de un punto de venta.
+
+        Returns:
+            tuple: (lista de (secuencia, evento), última secuencia revisada,
+                    False si hubo eventos que ya salieron del anillo)
+        """
+        with self._lock:
+            ring = list(self._rings.get(dbname, ()))
+        if not ring:
+            return [], sequence, True
+        complete = ring[0][0] <= sequence + 1
+        events = [
+            (seq, event) for seq, event in ring
+            if seq > sequence and (not pos_name or event.get('pos') == pos_name)
+        ]
+        return events, max(sequence, ring[-1][0]), complete
+
+    def last_sequence(self, dbname):
+        with self._lock:
+            ring = self._rings.get(dbname)
+            return ring[-1][0] if ring else 0
+
+    def _dispatch(self, payloads):
+        with self._lock:
+            for payload in payloads:
+                try:
+                    event = json_codec.loads(payload)
+                except ValueError:
+                    continue
+                dbname = event.pop('db', None)
+                if dbname:
+                    self._rings[dbname].append((next(self._sequences[dbname]), event))
+            waiters = list(self._waiters)
+        for waiter in waiters:
+            waiter.set()
+
+    def loop(self):
+        _logger.info("Stream de órdenes de la API POS: LISTEN %s", CHANNEL)
+        with sql_db.db_connect('postgres').cursor() as cr, selectors.DefaultSelector() as sel:
+            cr.execute(f"LISTEN {CHANNEL}")
+            cr.commit()
+            conn = cr._cnx
+            sel.register(conn, selectors.EVENT_READ)
+            while True:
+                if sel.select(LISTEN_TIMEOUT):
+                    conn.poll()
+                    payloads = []
+                    while conn.notifies:
+                        payloads.append(conn.notifies.pop(0).payload)
+                    if payloads:
+                        self._dispatch(payloads)
+
+    def run(self):
+        while True:
+            try:
+                self.loop()
+            except Exception:
+                _logger.exception("Stream de órdenes de la API POS: error del listener, reintentando")
+                time.sleep(LISTEN_TIMEOUT / 10)
+
+
+dispatch = OrderStreamDispatch()
+
+
+def format_event(event_id, event, name='order'):
+    data = json_codec.dumps(event).decode('utf-8')
+    return f"id: {event_id}\nevent: {name}\ndata: {data}\n\n".encode('utf-8')
+
+
+def stream_events(dbname, pos_name, last_event_id, max_seconds):
+    """
+    Generador de la respuesta SSE. No usa el cursor de la petición: solo lee
+    el anillo del dispatcher y espera sus avisos.
+    """
+    sequence = dispatch.parse_event_id(last_event_id)
+    waiter = dispatch.subscribe()
+    try:
+        # Sugerencia de reconexión al cliente (ms)
+        yield b"retry: 3000\n\n"
+        if sequence is None:
+            if last_event_id:
+                # Id de otro arranque o demasiado antiguo: el cliente debe recargar por la API de estado
+                yield format_event(f"{dispatch.boot}-{dispatch.last_sequence(dbname)}", {}, name='reset')
+            sequence = dispatch.last_sequence(dbname)
+
+        deadline = time.monotonic() + max_seconds
+        while time.monotonic() < deadline:
+            waiter.clear()
+            events, last_seen, complete = dispatch.events_after(dbname, sequence, pos_name)
+            if not complete:
+                yield format_event(f"{dispatch.boot}-{last_seen}", {}, name='reset')
+            for seq, event in events:
+                yield format_event(f"{dispatch.boot}-{seq}", event)
+            # También avanza sobre los eventos de otros puntos de venta
+            sequence = last_seen
+            if not waiter.wait(KEEPALIVE_INTERVAL):
+                yield b": keepalive\n\n"
+    finally:
+        dispatch.unsubscribe(waiter)
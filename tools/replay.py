@@ -0,0 +1,175 @@
+"""
+Repite contra una base de pruebas el tráfico capturado de /api/pos/order
+(ver README_REPLAY.md). Solo usa la librería estándar y no importa Odoo:
+
+    python3 tools/replay.py capturas/*.ndjson.gz --url http://localhost:8069 --api-key <clave>
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import gzip
+import json
+import math
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def load_records(paths, route=None, limit=None):
+    """
+    Lee las capturas (gzip con un JSON por línea) ordenadas por momento de llegada
+    """
+    records = []
+    for path in paths:
+        with gzip.open(path, 'rt', encoding='utf-8') as capture_file:
+            for line in capture_file:
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if route and record.get('route') != route:
+                    continue
+                records.append(record)
+    records.sort(key=lambda record: record['ts'])
+    return records[:limit] if limit else records
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(fraction * len(ordered)) - 1)
+    return round(ordered[index], 1)
+
+
+class Replayer:
+    """
+    Envía las peticiones capturadas respetando el ritmo original (dividido
+    por speed), o tan rápido como lo permita la concurrencia si speed es 0.
+    """
+
+    def __init__(self, url, api_key, speed=1.0, concurrency=8, timeout=30):
+        self.url = url.rstrip('/')
+        self.api_key = api_key
+        self.speed = speed
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.results = []
+        self._lock = threading.Lock()
+
+    def _send(self, record):
+        body = json.dumps(record['body']).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['X-API-Key'] = self.api_key
+        if record.get('request_id'):
+            headers['X-Request-ID'] = f"replay-{record['request_id']}"[:64]
+        http_request = urllib.request.Request(
+            self.url + record.get('route', '/api/pos/order'), data=body, headers=headers, method='POST',
+        )
+
+        started = time.perf_counter()
+        queries = None
+        success = False
+        try:
+            with urllib.request.urlopen(http_request, timeout=self.timeout) as response:
+                status = response.status
+                queries = response.headers.get('X-Query-Count')
+                payload = response.read()
+            try:
+                success = bool(json.loads(payload).get('success'))
+            except ValueError:
+                success = False
+        except urllib.error.HTTPError as e:
+            status = e.code
+            queries = e.headers.get('X-Query-Count')
+        except Exception:
+            # Timeout o conexión rechazada
+            status = 0
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        with self._lock:
+            self.results.append({
+                'status': status,
+                'success': success,
+                'latency_ms': latency_ms,
+                'queries': int(queries) if queries and queries.isdigit() else None,
+                'original_ms': record.get('duration_ms'),
+            })
+
+    def run(self, records):
+        if not records:
+            return self.report(0.0)
+        first_ts = records[0]['ts']
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for record in records:
+                if self.speed > 0:
+                    due = (record['ts'] - first_ts) / self.speed
+                    delay = due - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+                executor.submit(self._send, record)
+        return self.report(time.monotonic() - started)
+
+    def report(self, elapsed):
+        results = self.results
+        latencies = [result['latency_ms'] for result in results]
+        queries = [result['queries'] for result in results if result['queries'] is not None]
+        original = [result['original_ms'] for result in results if result['original_ms'] is not None]
+        errors = [result for result in results if not result['success']]
+        statuses = {}
+        for result in results:
+            statuses[str(result['status'])] = statuses.get(str(result['status']), 0) + 1
+
+        return {
+            'requests': len(results),
+            'elapsed_s': round(elapsed, 2),
+            'throughput_rps': round(len(results) / elapsed, 2) if elapsed else None,
+            'error_rate': round(len(errors) / len(results), 4) if results else None,
+            'statuses': statuses,
+            'latency_ms': {
+                'p50': percentile(latencies, 0.50),
+                'p90': percentile(latencies, 0.90),
+                'p95': percentile(latencies, 0.95),
+                'p99': percentile(latencies, 0.99),
+                'max': round(max(latencies), 1) if latencies else None,
+            },
+            # Latencia registrada en producción para las mismas peticiones
+            'original_latency_ms': {
+                'p50': percentile(original, 0.50),
+                'p95': percentile(original, 0.95),
+            },
+            # Solo disponible con una API key con scope 'admin' (cabecera X-Query-Count)
+            'queries': {
+                'total': sum(queries) if queries else None,
+                'mean': round(sum(queries) / len(queries), 1) if queries else None,
+                'p95': percentile(queries, 0.95),
+            },
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Repite tráfico capturado de la API POS")
+    parser.add_argument('captures', nargs='+', help="archivos .ndjson.gz de la captura")
+    parser.add_argument('--url', default='http://localhost:8069', help="servidor Odoo de pruebas")
+    parser.add_argument('--api-key', help="API key con scope 'order' (y 'admin' para contar consultas)")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="1 = ritmo original, 2 = el doble de rápido, 0 = tan rápido como sea posible")
+    parser.add_argument('--concurrency', type=int, default=8, help="peticiones simultáneas como máximo")
+    parser.add_argument('--limit', type=int, help="repetir solo las primeras N peticiones")
+    parser.add_argument('--route', default='/api/pos/order', help="ruta capturada a repetir")
+    parser.add_argument('--timeout', type=float, default=30, help="segundos por petición")
+    args = parser.parse_args(argv)
+
+    records = load_records(args.captures, route=args.route, limit=args.limit)
+    replayer = Replayer(args.url, args.api_key, speed=args.speed, concurrency=args.concurrency, timeout=args.timeout)
+    report = replayer.run(records)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import contextlib
+import contextvars
+import logging
+import re
+import time
+import uuid
+
+_current_request = contextvars.ContextVar('pos_order_api_request', default=None)
+
+# Ids de correlación aceptados desde la cabecera X-Request-ID
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._:-]{1,64}$')
+
+
+def new_request_id(candidate=None):
+    """
+    Usa el id de correlación enviado por el cliente si es válido; si no, genera uno
+    """
+    if candidate and _REQUEST_ID_RE.match(candidate):
+        return candidate
+    return uuid.uuid4().hex[:16]
+
+
+class ApiRequestContext:
+    """
+    Datos de la petición en curso a la API (cliente, API key, ruta), su id de
+    correlación y los tiempos por etapa para el registro resumen
+    """
+    __slots__ = ('route', 'client_ip', 'api_key_id', 'api_key_name', 'company_id', 'request_id', 'stages', 'fields', 'payload')
+
+    def __init__(self, route, client_ip, request_id=None):
+        self.route = route
+        self.client_ip = client_ip
+        self.api_key_id = None
+        self.api_key_name = None
+        self.company_id = None
+        self.request_id = request_id or new_request_id()
+        self.stages = {}
+        self.fields = {}
+        # Cuerpo JSON decodificado por read_json, para la captura de tráfico
+        self.payload = None
+
+    def label(self):
+        if self.api_key_id:
+            return f"req={self.request_id} key={self.api_key_name}#{self.api_key_id} ip={self.client_ip}"
+        return f"req={self.request_id} key=anon ip={self.client_ip}"
+
+    def add_stage(self, name, duration_ms):
+        self.stages[name] = self.stages.get(name, 0.0) + duration_ms
+
+    def summary(self):
+        """
+        Texto clave=valor con los campos y los tiempos por etapa (ms)
+        """
+        parts = [f"{key}={value}" for key, value in self.fields.items()]
+        parts.extend(f"{name}_ms={duration:.1f}" for name, duration in self.stages.items())
+        return " ".join(parts)
+
+
+def get_request_context():
+    return _current_request.get()
+
+
+def set_request_context(context):
+    return _current_request.set(context)
+
+
+def reset_request_context(token):
+    _current_request.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Mide una etapa de la petición en curso; fuera de una petición no hace nada
+    """
+    context = _current_request.get()
+    if context is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        context.add_stage(name, (time.perf_counter() - started) * 1000)
+
+
+def record_stage(name, duration_ms):
+    """
+    Suma a la petición en curso una etapa ya medida por el llamador
+    """
+    context = _current_request.get()
+    if context is not None:
+        context.add_stage(name, duration_ms)
+
+
+def set_summary_field(name, value):
+    """
+    Agrega un campo (por ejemplo order_id) al registro resumen de la petición
+    """
+    context = _current_request.get()
+    if context is not None:
+        context.fields[name] = value
+
+
+class ApiLoggerAdapter(logging.LoggerAdapter):
+    """
+    Antepone la identidad del cliente y el id de correlación de la petición en
+    curso a cada registro, y los agrega como atributos (request_id, api_key_id)
+    para los handlers estructurados. LoggerAdapter solo llama a process() si
+    el nivel está activo, así que un registro descartado no cuesta formato.
+    """
+
+    def process(self, msg, kwargs):
+        context = _current_request.get()
+        if context is not None:
+            msg = f"[{context.label()}] {msg}"
+            extra = kwargs.setdefault('extra', {})
+            extra.setdefault('request_id', context.request_id)
+            extra.setdefault('api_key_id', context.api_key_id)
+        return msg, kwargs
+
+
+def get_logger(name):
+    return ApiLoggerAdapter(logging.getLogger(name), {})
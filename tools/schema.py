@@ -0,0 +1,123 @@
+class SchemaError(ValueError):
+    """
+    Error de validación con la lista completa de problemas encontrados
+    """
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+class Field:
+    """
+    Declaración de un campo del payload.
+
+    Args:
+        kind: str, int, float, bool, list o dict
+        required: si el campo debe venir en el payload
+        default: valor cuando el campo no viene (se copia si es lista o dict)
+        items: esquema (dict de Field) de cada elemento si kind es list,
+               o del objeto anidado si kind es dict; para listas de valores
+               simples, el tipo de cada elemento (por ejemplo int)
+        min_items / max_items: tamaño permitido de la lista
+    """
+    __slots__ = ('kind', 'required', 'default', 'items', 'min_items', 'max_items')
+
+    def __init__(self, kind, required=False, default=None, items=None, min_items=None, max_items=None):
+        self.kind = kind
+        self.required = required
+        self.default = default
+        self.items = items
+        self.min_items = min_items
+        self.max_items = max_items
+
+
+def _coerce(value, field, path, errors):
+    kind = field.kind
+    if kind is float:
+        # Se aceptan enteros y números en texto ("12.50") como en los formularios
+        if isinstance(value, bool):
+            errors.append(f"{path}: debe ser numérico")
+            return None
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, str):
+            try:
+                return float(value)
+            except ValueError:
+                pass
+        errors.append(f"{path}: debe ser numérico")
+        return None
+    if kind is int:
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.isdigit():
+            return int(value)
+        errors.append(f"{path}: debe ser un entero")
+        return None
+    if kind is str:
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        errors.append(f"{path}: debe ser texto")
+        return None
+    if kind is list:
+        if not isinstance(value, list):
+            errors.append(f"{path}: debe ser una lista")
+            return None
+        if field.min_items is not None and len(value) < field.min_items:
+            errors.append(f"{path}: debe tener al menos {field.min_items} elemento(s)")
+        if field.max_items is not None and len(value) > field.max_items:
+            errors.append(f"{path}: admite como máximo {field.max_items} elementos")
+        if field.items is None:
+            return value
+        if isinstance(field.items, type):
+            item_field = Field(field.items)
+            return [_coerce(item, item_field, f"{path}[{index}]", errors) for index, item in enumerate(value)]
+        return [_validate(item, field.items, f"{path}[{index}]", errors) for index, item in enumerate(value)]
+    if kind is dict and field.items is not None:
+        return _validate(value, field.items, path, errors)
+    if not isinstance(value, kind):
+        errors.append(f"{path}: tipo inválido")
+        return None
+    return value
+
+
+def _validate(data, schema, path, errors):
+    if not isinstance(data, dict):
+        errors.append(f"{path or 'payload'}: debe ser un objeto JSON")
+        return {}
+
+    # Las claves no declaradas se conservan tal cual
+    result = dict(data)
+    for name, field in schema.items():
+        field_path = f"{path}.{name}" if path else name
+        value = data.get(name)
+        if value is None:
+            if field.required:
+                errors.append(f"{field_path}: es obligatorio")
+            default = field.default
+            result[name] = list(default) if isinstance(default, list) else (
+                dict(default) if isinstance(default, dict) else default
+            )
+            continue
+        result[name] = _coerce(value, field, field_path, errors)
+    return result
+
+
+def validate(data, schema):
+    """
+    Valida y normaliza un payload en una sola pasada.
+
+    Returns:
+        dict normalizado, con valores por defecto y números convertidos
+
+    Raises:
+        SchemaError con todos los errores encontrados
+    """
+    errors = []
+    result = _validate(data, schema, '', errors)
+    if errors:
+        raise SchemaError(errors)
+    return result
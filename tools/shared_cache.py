@@ -0,0 +1,253 @@
+from odoo import sql_db
+from odoo.tools.sql import table_exists
+from psycopg2 import errors
+from . import json_codec
+from .cache import MISSING, TTLCache
+from .request_context import get_logger
+import functools
+import random
+import threading
+import time
+
+_logger = get_logger(__name__)
+
+# Tablas creadas por pos.order.api.cache.init()
+CACHE_TABLE = 'pos_order_api_shared_cache'
+VERSION_TABLE = 'pos_order_api_cache_version'
+
+# Cada cuántos segundos un worker relee la versión de un espacio de nombres.
+# Es el tiempo máximo que otro worker puede seguir usando su L1 tras una invalidación.
+VERSION_CHECK_INTERVAL = 1.0
+
+# Intentos para incrementar las versiones tras el commit, ante bloqueos con
+# otras invalidaciones concurrentes
+BUMP_ATTEMPTS = 5
+
+_PENDING_SETS = 'pos_order_api.shared_cache.sets'
+_PENDING_BUMPS = 'pos_order_api.shared_cache.bumps'
+
+
+def flush_pending(cr):
+    """
+    Escribe en bloque, justo antes del commit, las entradas acumuladas en la
+    transacción (una sola sentencia). Llenar L2 es opcional: un error aquí se
+    registra pero nunca impide el commit. Las invalidaciones no pasan por aquí
+    (ver _bump_versions).
+    """
+    try:
+        with cr.savepoint(flush=False):
+            _write_pending(cr)
+    except Exception as e:
+        _logger.error("Error al escribir la caché compartida de la API POS: %s", e)
+
+
+def _bump_versions(dbname, caches):
+    """
+    Incrementa, después del commit y en un cursor propio, la versión de los
+    espacios de nombres invalidados por la transacción.
+
+    Va aparte de la transacción que provocó el cambio: la fila de versión es
+    muy disputada, y así ninguna escritura del ERP la mantiene bloqueada ni
+    falla por ella. Se usa READ COMMITTED para que dos incrementos simultáneos
+    se esperen en lugar de fallar por serialización, y se reintenta ante
+    bloqueos mutuos. Si aun así no se puede, el error se propaga: perder una
+    invalidación dejaría datos obsoletos en los demás workers.
+
+    Args:
+        dbname: base de datos de la transacción confirmada
+        caches: dict espacio de nombres -> SharedCache
+    """
+    namespaces = sorted(caches)
+    try:
+        for attempt in range(1, BUMP_ATTEMPTS + 1):
+            try:
+                with sql_db.db_connect(dbname).cursor() as cr:
+                    cr.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+                    cr.execute(
+                        f"""
+                        INSERT INTO {VERSION_TABLE} AS v (namespace, version)
+                             SELECT unnest(%s::varchar[]), 1
+                        ON CONFLICT (namespace) DO UPDATE SET version = v.version + 1
+                        """,
+                        (namespaces,),
+                    )
+                return
+            except (errors.SerializationFailure, errors.DeadlockDetected, errors.LockNotAvailable) as e:
+                if attempt == BUMP_ATTEMPTS:
+                    _logger.error(
+                        "No se pudo invalidar la caché compartida de la API POS (%s) tras %s intentos: %s",
+                        ', '.join(namespaces), attempt, e,
+                    )
+                    raise
+                time.sleep(random.uniform(0.0, 0.05 * 2 ** attempt))
+            except Exception:
+                _logger.exception(
+                    "No se pudo invalidar la caché compartida de la API POS (%s)", ', '.join(namespaces),
+                )
+                raise
+    finally:
+        # La versión nueva debe leerse de inmediato en este worker
+        for cache in caches.values():
+            cache._forget(dbname)
+
+
+def _write_pending(cr):
+    entries = cr.precommit.data.pop(_PENDING_SETS, {})
+    if entries:
+        # Orden fijo de claves para que dos transacciones no se bloqueen mutuamente
+        rows = [entries[key] for key in sorted(entries)]
+        cr.execute(
+            f"""
+            INSERT INTO {CACHE_TABLE} AS c (namespace, key, version, value, expires_at)
+                 SELECT namespace, key, version, value, now() at time zone 'UTC' + ttl * interval '1 second'
+                   FROM unnest(%s::varchar[], %s::varchar[], %s::bigint[], %s::text[], %s::float[])
+                     AS t(namespace, key, version, value, ttl)
+            ON CONFLICT (namespace, key) DO UPDATE SET
+                version = EXCLUDED.version,
+                value = EXCLUDED.value,
+                expires_at = EXCLUDED.expires_at
+            """,
+            tuple(list(column) for column in zip(*rows)),
+        )
+
+
+class SharedCache:
+    """
+    Caché de dos niveles compartida entre los workers de una misma base:
+
+    - L1: LRU en memoria del worker (TTLCache), sin acceso a la base.
+    - L2: tabla UNLOGGED de PostgreSQL, leída en un fallo de L1 con una
+      consulta por clave primaria.
+
+    Cada espacio de nombres tiene una versión. Invalidar es incrementarla,
+    justo después del commit del cambio que la provoca. Las entradas de L1 y L2
+    de versiones anteriores dejan de valer, y cada worker relee la versión
+    como mucho una vez por VERSION_CHECK_INTERVAL.
+
+    Las escrituras en L2 se acumulan y se hacen en bloque antes del commit:
+    si la transacción se revierte, no llegan a los demás workers.
+    """
+
+    def __init__(self, namespace, maxsize=256, ttl=60):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.l1 = TTLCache(maxsize=maxsize, ttl=ttl)
+        # db -> (momento de la última lectura, versión, L2 disponible)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def _key(self, key):
+        return json_codec.dumps(list(key)).decode('utf-8')
+
+    def _state(self, env):
+        """
+        Devuelve (versión, L2 disponible) del espacio de nombres en la base de env
+        """
+        dbname = env.cr.dbname
+        now = time.monotonic()
+        with self._lock:
+            state = self._versions.get(dbname)
+        if state and now - state[0] < VERSION_CHECK_INTERVAL:
+            return state[1], state[2]
+
+        enabled = env['ir.config_parameter'].sudo().get_param('pos_order_api.shared_cache', 'True').lower() == 'true'
+        version = 0
+        if enabled and table_exists(env.cr, VERSION_TABLE):
+            env.cr.execute(f"SELECT version FROM {VERSION_TABLE} WHERE namespace = %s", (self.namespace,))
+            row = env.cr.fetchone()
+            version = row[0] if row else 0
+        else:
+            enabled = False
+
+        with self._lock:
+            self._versions[dbname] = (now, version, enabled)
+        return version, enabled
+
+    def get(self, env, key, default=MISSING):
+        version, shared = self._state(env)
+        l1_key = (env.cr.dbname,) + tuple(key)
+
+        entry = self.l1.get(l1_key, None)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        if not shared:
+            return default
+
+        env.cr.execute(
+            f"""
+            SELECT value FROM {CACHE_TABLE}
+             WHERE namespace = %s AND key = %s AND version = %s
+               AND expires_at > now() at time zone 'UTC'
+            """,
+            (self.namespace, self._key(key), version),
+        )
+        row = env.cr.fetchone()
+        if row is None:
+            return default
+        value = json_codec.loads(row[0])
+        self.l1.set(l1_key, (version, value))
+        return value
+
+    def set(self, env, key, value, deferred=False):
+        """
+        Guarda una entrada. Con deferred=True, L1 se actualiza recién después
+        del commit (para ids de registros creados en la transacción en curso).
+        """
+        version, shared = self._state(env)
+        cr = env.cr
+        l1_key = (cr.dbname,) + tuple(key)
+        if deferred:
+            cr.postcommit.add(lambda: self.l1.set(l1_key, (version, value)))
+        else:
+            self.l1.set(l1_key, (version, value))
+        if not shared:
+            return
+
+        entries = cr.precommit.data.get(_PENDING_SETS)
+        if entries is None:
+            entries = cr.precommit.data[_PENDING_SETS] = {}
+            cr.precommit.add(lambda: flush_pending(cr))
+        encoded_key = self._key(key)
+        entries[(self.namespace, encoded_key)] = (
+            self.namespace, encoded_key, version, json_codec.dumps(value).decode('utf-8'), float(self.ttl),
+        )
+
+    def pop(self, env, key):
+        """
+        Descarta una entrada (por ejemplo, una sesión ya cerrada)
+        """
+        self.l1.pop((env.cr.dbname,) + tuple(key))
+        pending = env.cr.precommit.data.get(_PENDING_SETS)
+        if pending:
+            pending.pop((self.namespace, self._key(key)), None)
+        version, shared = self._state(env)
+        if shared:
+            env.cr.execute(
+                f"DELETE FROM {CACHE_TABLE} WHERE namespace = %s AND key = %s",
+                (self.namespace, self._key(key)),
+            )
+
+    def clear(self, env):
+        """
+        Invalida todo el espacio de nombres en todos los workers: la versión
+        se incrementa después de confirmar la transacción en curso
+        """
+        self._forget(env.cr.dbname)
+        version, shared = self._state(env)
+        if not shared:
+            return
+
+        cr = env.cr
+        caches = cr.postcommit.data.get(_PENDING_BUMPS)
+        if caches is None:
+            caches = cr.postcommit.data[_PENDING_BUMPS] = {}
+            cr.postcommit.add(functools.partial(_bump_versions, cr.dbname, caches))
+        caches[self.namespace] = self
+
+    def _forget(self, dbname):
+        with self._lock:
+            self._versions.pop(dbname, None)
+        self.l1.clear()
+
+    def __len__(self):
+        return len(self.l1)
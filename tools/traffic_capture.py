@@ -0,0 +1,209 @@
+from odoo.tools import config
+from . import json_codec
+from .request_context import get_logger
+import atexit
+import collections
+import gzip
+import hashlib
+import os
+import queue
+import random
+import threading
+import time
+
+_logger = get_logger(__name__)
+
+# Un archivo por día y por proceso: los workers nunca escriben en el mismo archivo
+FILE_PATTERN = 'pos-order-api-%(date)s-%(pid)s.ndjson.gz'
+
+_CUSTOMER_FIELDS = ('external_id', 'email', 'phone', 'name')
+
+# Las capturas pendientes se escriben juntas, un miembro gzip por archivo,
+# cada FLUSH_INTERVAL segundos o al juntar FLUSH_RECORDS peticiones
+FLUSH_INTERVAL = 5.0
+FLUSH_RECORDS = 500
+# Capturas en espera; si el disco no da abasto se descartan, nunca se frena una petición
+QUEUE_SIZE = 10000
+
+
+def capture_dir(env):
+    """
+    Directorio de las capturas: pos_order_api.capture_dir, o
+    <data_dir>/pos_order_api_capture/<db> si no está configurado
+    """
+    path = env['ir.config_parameter'].sudo().get_param('pos_order_api.capture_dir')
+    return path or os.path.join(config['data_dir'], 'pos_order_api_capture', env.cr.dbname)
+
+
+def _pseudonym(salt, value):
+    return hashlib.sha256(f"{salt}:{value}".encode('utf-8')).hexdigest()[:16]
+
+
+def _mask(text):
+    # Misma longitud, para no alterar el tamaño de las líneas en la repetición
+    return 'x' * len(text) if isinstance(text, str) else text
+
+
+def anonymize(payload, salt):
+    """
+    Reemplaza los datos del cliente por seudónimos estables (el mismo cliente
+    conserva el mismo seudónimo dentro de la captura) y enmascara las notas.
+    Precios, cantidades, extras y pos_name se conservan tal cual.
+    """
+    if not isinstance(payload, dict):
+        return payload
+    payload = dict(payload)
+
+    if payload.get('partner_id') is not None:
+        # Los ids de cliente no existen en la base de pruebas
+        payload['partner_id'] = None
+
+    customer = payload.get('customer')
+    if isinstance(customer, dict):
+        customer = dict(customer)
+        for field in _CUSTOMER_FIELDS:
+            value = customer.get(field)
+            if not value:
+                continue
+            token = _pseudonym(salt, value)
+            if field == 'email':
+                customer[field] = f"{token}@example.invalid"
+            elif field == 'phone':
+                customer[field] = '+' + str(int(token, 16))[:11]
+            elif field == 'name':
+                customer[field] = f"Cliente {token[:8]}"
+            else:
+                customer[field] = token
+        payload['customer'] = customer
+
+    lines = payload.get('lines')
+    if isinstance(lines, list):
+        masked = []
+        for line in lines:
+            if isinstance(line, dict):
+                line = dict(line)
+                for field in ('note', 'customer_note'):
+                    if field in line:
+                        line[field] = _mask(line[field])
+            masked.append(line)
+        payload['lines'] = masked
+    return payload
+
+
+def should_capture(env):
+    """
+    Decide por muestreo si se captura la petición
+    (pos_order_api.capture_sample_rate, 0 desactiva la captura)
+    """
+    try:
+        rate = float(env['ir.config_parameter'].sudo().get_param('pos_order_api.capture_sample_rate', 0))
+    except (TypeError, ValueError):
+        return False
+    return rate > 0 and random.random() < rate
+
+
+class CaptureWriter(threading.Thread):
+    """
+    Hilo del proceso que escribe las capturas fuera de las peticiones. La
+    petición solo encola el registro; la anonimización, la serialización y
+    la escritura a disco ocurren aquí, en bloques.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True, name=f'{__name__}.CaptureWriter')
+        self._queue = queue.Queue(QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._started = False
+        self.dropped = 0
+
+    def ensure_started(self):
+        with self._lock:
+            if not self._started:
+                self._started = True
+                self.start()
+                atexit.register(self.flush)
+
+    def submit(self, item):
+        self.ensure_started()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                _logger.warning("Cola de capturas llena: %s peticiones descartadas", self.dropped)
+
+    def run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while len(batch) < FLUSH_RECORDS:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def flush(self):
+        """
+        Escribe lo que quede en la cola (al terminar el proceso)
+        """
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._write(batch)
+
+    def _write(self, batch):
+        lines_by_path = collections.defaultdict(list)
+        for directory, salt, record, payload in batch:
+            try:
+                record['body'] = anonymize(payload, salt)
+                path = os.path.join(directory, FILE_PATTERN % {
+                    'date': time.strftime('%Y%m%d', time.gmtime(record['ts'])),
+                    'pid': os.getpid(),
+                })
+                lines_by_path[path].append(json_codec.dumps(record) + b'\n')
+            except Exception as e:
+                _logger.error("Error al preparar la captura %s: %s", record.get('request_id'), e)
+
+        with self._write_lock:
+            for path, lines in lines_by_path.items():
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    # Un miembro gzip por bloque: el archivo sigue siendo un gzip válido
+                    with gzip.open(path, 'ab') as capture_file:
+                        capture_file.write(b''.join(lines))
+                except Exception as e:
+                    _logger.error("Error al escribir %s capturas en %s: %s", len(lines), path, e)
+
+
+writer = CaptureWriter()
+
+
+def write_capture(env, context, payload, started_at, status, duration_ms):
+    """
+    Encola una petición para la captura. payload es el cuerpo ya
+    decodificado por read_json (descomprimido si llegó con gzip); sin él la
+    petición no sirve para repetir la carga y no se captura. Un error aquí
+    se registra y nunca afecta a la respuesta.
+    """
+    if payload is None:
+        return
+    try:
+        salt = env['ir.config_parameter'].sudo().get_param('database.secret', '')
+        record = {
+            'ts': round(started_at, 3),
+            'route': context.route,
+            'request_id': context.request_id,
+            'status': status,
+            'duration_ms': round(duration_ms, 1),
+        }
+        writer.submit((capture_dir(env), salt, record, payload))
+    except Exception as e:
+        _logger.error("Error al capturar la petición para repetición: %s", e)